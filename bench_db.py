@@ -0,0 +1,91 @@
+"""
+Микро-бенчмарк чтения кэша: соединение на каждый запрос против
+долгоживущего соединения в режиме WAL и in-memory LRU
+
+Запуск:
+    python bench_db.py [--lookups 5000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from cards import CardFields
+from countries import COUNTRIES, HOLIDAY_TYPES
+from database import Database, AsyncDatabase
+
+
+def lookup_per_connection(db_path: str, country: str, holiday_type: str):
+    """Чтение так, как это делалось раньше: connect → query → close"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT outfit, traditions, movie, music, tip FROM holiday_responses "
+        "WHERE country = ? AND holiday_type = ?",
+        (country, holiday_type)
+    )
+    result = cursor.fetchone()
+    conn.close()
+    return result
+
+
+def report(name: str, elapsed: float, lookups: int):
+    """Печать среднего времени одного чтения"""
+    print(f"{name:<32} {elapsed / lookups * 1e6:9.1f} мкс/запрос")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lookups", type=int, default=5000, help="Количество чтений")
+    args = parser.parse_args()
+
+    keys = [(country, holiday) for country in COUNTRIES for holiday in HOLIDAY_TYPES.values()]
+    card = CardFields(*(["Тестовое поле карточки " * 12] * 5))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = Database(db_path)
+        for country, holiday in keys:
+            db.save_response(country, holiday, card)
+
+        sample = [random.choice(keys) for _ in range(args.lookups)]
+        print(f"Записей: {len(keys)}, чтений: {args.lookups}\n")
+
+        start = time.perf_counter()
+        for country, holiday in sample:
+            lookup_per_connection(db_path, country, holiday)
+        report("connect на каждый запрос", time.perf_counter() - start, args.lookups)
+
+        start = time.perf_counter()
+        for country, holiday in sample:
+            db.load_entry(country, holiday)
+        report("общее соединение (WAL)", time.perf_counter() - start, args.lookups)
+
+        start = time.perf_counter()
+        for country, holiday in sample:
+            db.get_response(country, holiday)
+        report("LRU в памяти", time.perf_counter() - start, args.lookups)
+
+        async def run_async():
+            async_db = AsyncDatabase(db)
+
+            start = time.perf_counter()
+            for country, holiday in sample:
+                await async_db.load_entry(country, holiday)
+            report("AsyncDatabase (поток БД)", time.perf_counter() - start, args.lookups)
+
+            start = time.perf_counter()
+            for country, holiday in sample:
+                await async_db.get_response(country, holiday)
+            report("AsyncDatabase (LRU)", time.perf_counter() - start, args.lookups)
+
+            await async_db.close()
+
+        asyncio.run(run_async())
+
+
+if __name__ == "__main__":
+    main()
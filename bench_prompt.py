@@ -0,0 +1,217 @@
+"""
+Офлайн-бенчмарк промптов: время ответа и расход токенов вариантов запроса
+
+Запросы идут в локальную заглушку fake_openai.py, которая имитирует
+чтение промпта (задержка на каждый токен вне кэша) и кэш начала промпта,
+как у OpenAI. Можно указать --base-url другого OpenAI-совместимого API
+(например, заглушки с записанными ответами).
+
+Запуск:
+    python bench_prompt.py [--requests 20] [--prompt-token-delay 0.0005]
+                           [--cache-min-tokens 1024] [--base-url URL]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+import openai
+
+from config import OPENAI_MODEL
+from countries import COUNTRIES, HOLIDAY_TYPES
+from fake_openai import start_fake_server
+from llm import build_request, usage_cost
+
+# Исходный промпт: свободный текст по шаблону с полным примером карточки
+LEGACY_SYSTEM_PROMPT = """Ты — культуролог и этнограф, эксперт по традициям празднования Рождества и Нового года в разных странах мира.
+Твоя задача — создавать яркие, детализированные и достоверные описания праздников, чтобы пользователь мог «окунуться» в атмосферу другой культуры.
+
+Отвечай строго по шаблону ниже.
+Будь конкретен: упоминай реальные традиции, блюда, наряды, цвета, звуки и украшения, характерные для страны.
+Не используй обобщения вроде "украсьте дом" или "весело проведите время".
+Пиши на русском языке, тёплым и описательным стилем.
+
+---
+
+🎉 Пример отличного ответа (для ориентира):
+
+🎉 Страна: Финляндия
+Праздник: Рождество
+
+👗 Наряд: Тёплые шерстяные свитера с оленями и орнаментами, валенки и красные шапки Санты. Женщины часто носят платья в традиционном финском стиле — с синими или белыми узорами.
+🍽 Традиции: Финны посещают сауну в канун Рождества — это символ очищения. Затем ужинают: запеканка из репы, ветчина, рисовая каша с миндалём — тому, кто найдёт орех, будет счастье. После ужина дети поют песни и ждут Йоулупукки (финского Санту).
+🎬 Фильм: "Joulutarina" — добрый финский фильм о происхождении Санта-Клауса.
+🎶 Музыка: "Sylvian Joululaulu" — классическая рождественская песня Финляндии.
+💡 Совет: Чтобы ощутить финское Рождество, зажгите свечи, приглушите свет и включите тихую рождественскую музыку. Поставьте на стол рисовую кашу с орешком — пусть принесёт удачу.
+
+---
+
+Формат строго такой:
+🎉 Страна: [название страны]
+Праздник: [Рождество / Новый год]
+
+👗 Наряд: [детальное описание традиционной одежды с цветами и элементами]
+🍽 Традиции: [конкретные обычаи, блюда, обряды — что делают, что едят, как украшают дом]
+🎬 Фильм: [1 фильм, связанный с этой культурой или атмосферой праздника]
+🎶 Музыка: [1 песня или мелодия, связанная с этой страной и праздником]
+💡 Совет: [конкретный совет, как воссоздать атмосферу дома — с деталями]
+
+Требования:
+- Ответ должен быть на русском языке.
+- Без длинных вступлений и заключений.
+- Используй эмодзи как в примере.
+- Будь конкретным и детальным.
+- Пиши тёплым и описательным стилем."""
+
+
+def build_legacy_request(country: str, holiday_type: str) -> Dict:
+    """Запрос в исходном виде: длинный промпт и max_tokens=1000"""
+    user_prompt = f"""Создай праздничную карточку по следующей стране и празднику:
+
+Страна: {country}
+Праздник: {holiday_type}
+
+Формат вывода и стиль описаны в системной инструкции."""
+
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": LEGACY_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        "max_tokens": 1000,
+        "temperature": 0.8,
+    }
+
+
+# Сравниваемые варианты запроса
+VARIANTS: Dict[str, Callable[[str, str], Dict]] = {
+    "исходный (пример + шаблон)": build_legacy_request,
+    "текущий (llm.build_request)": build_request,
+}
+
+
+async def run_variant(
+    client: openai.AsyncOpenAI,
+    build: Callable[[str, str], Dict],
+    keys: List[tuple],
+) -> Dict[str, float]:
+    """
+    Выполнить запросы одного варианта последовательно
+
+    Args:
+        client: Клиент OpenAI-совместимого API
+        build: Функция, формирующая запрос по стране и празднику
+        keys: Пары (страна, праздник)
+
+    Returns:
+        Медианы времени (мс) и средние значения токенов и стоимости
+    """
+    first_token_ms, latency_ms = [], []
+    prompt_tokens, cached_tokens, completion_tokens, costs = [], [], [], []
+
+    for country, holiday_type in keys:
+        request = build(country, holiday_type)
+        started = time.perf_counter()
+        first_token = None
+        usage = None
+
+        stream = await client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if first_token is None and chunk.choices and chunk.choices[0].delta.content:
+                first_token = time.perf_counter()
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+
+        finished = time.perf_counter()
+        first_token_ms.append(((first_token or finished) - started) * 1000)
+        latency_ms.append((finished - started) * 1000)
+
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        prompt_tokens.append(usage.prompt_tokens)
+        cached_tokens.append(cached)
+        completion_tokens.append(usage.completion_tokens)
+        costs.append(usage_cost(request["model"], usage.prompt_tokens, cached, usage.completion_tokens))
+
+    return {
+        "first_token_ms": statistics.median(first_token_ms),
+        "latency_ms": statistics.median(latency_ms),
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "cached_share": sum(cached_tokens) / sum(prompt_tokens) if sum(prompt_tokens) else 0.0,
+        "completion_tokens": statistics.mean(completion_tokens),
+        # Цена модели неизвестна — стоимость не считается, а не принимается за 0
+        "cost_per_1000": None if None in costs else statistics.mean(costs) * 1000,
+    }
+
+
+def report(name: str, result: Dict[str, Optional[float]]):
+    """Печать результатов одного варианта"""
+    cost = result["cost_per_1000"]
+    cost_text = "—" if cost is None else f"{cost:.4f}"
+    print(
+        f"{name:<30} {result['first_token_ms']:8.0f} {result['latency_ms']:8.0f} "
+        f"{result['prompt_tokens']:8.0f} {result['cached_share']:7.0%} "
+        f"{result['completion_tokens']:8.0f} {cost_text:>10}"
+    )
+
+
+async def main_async(args: argparse.Namespace):
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = start_fake_server(
+            chunk_delay=args.chunk_delay,
+            prompt_token_delay=args.prompt_token_delay,
+            cache_min_tokens=args.cache_min_tokens,
+        )
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    client = openai.AsyncOpenAI(api_key=args.api_key, base_url=base_url, max_retries=0)
+    rng = random.Random(args.seed)
+    pairs = [(country, holiday) for country in COUNTRIES for holiday in HOLIDAY_TYPES.values()]
+    keys = [rng.choice(pairs) for _ in range(args.requests)]
+
+    print(f"Модель: {OPENAI_MODEL}, запросов на вариант: {args.requests}, API: {base_url}\n")
+    print(
+        f"{'вариант':<30} {'1-й ток':>8} {'ответ':>8} {'промпт':>8} {'кэш':>7} "
+        f"{'ответ,т':>8} {'$/1000':>10}"
+    )
+
+    try:
+        for name, build in VARIANTS.items():
+            report(name, await run_variant(client, build, keys))
+    finally:
+        await client.close()
+        if server is not None:
+            server.shutdown()
+
+    print("\nВремя — медиана (мс), токены — среднее на запрос, $/1000 — стоимость 1000 карточек")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20, help="Запросов на вариант")
+    parser.add_argument(
+        "--prompt-token-delay", type=float, default=0.0005,
+        help="Задержка заглушки на токен промпта вне кэша (сек)",
+    )
+    parser.add_argument(
+        "--cache-min-tokens", type=int, default=1024,
+        help="Минимальная длина промпта для кэша заглушки (токены)",
+    )
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Пауза между фрагментами stream (сек)")
+    parser.add_argument("--base-url", default="", help="Адрес API вместо встроенной заглушки")
+    parser.add_argument("--api-key", default="fake", help="Ключ API (для --base-url)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed выбора стран")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,114 @@
 Telegram бот для генерации праздничных традиций разных стран
 Версия 2.0 с базой данных и изображениями
 """
+import os
 import random
+import socket
+import time
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from datetime import datetime, time as dt_time
+from typing import Awaitable, Callable, List, MutableMapping, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+from telegram import (
+    Update,
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InlineQueryResultsButton,
+    InputMediaPhoto,
+    InputTextMessageContent,
+    Message,
+)
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     MessageHandler,
     filters,
     ContextTypes,
     ConversationHandler,
 )
-from config import TELEGRAM_BOT_TOKEN
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_BASE_URL,
+    SEND_GLOBAL_RATE,
+    SEND_CHAT_RATE,
+    SEND_CHAT_BURST,
+    SEND_GROUP_PER_MINUTE,
+    SEND_MAX_RETRIES,
+    BROADCAST_TIME,
+    BROADCAST_TZ,
+    BROADCAST_SEASON,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_RETRY_INTERVAL,
+    GENERATION_LEASE_TTL,
+    LLM_MAX_CONCURRENCY,
+    RESPONSE_CACHE_MAX_ITEMS,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_WARM,
+    LLM_STREAM,
+    STREAM_EDIT_INTERVAL,
+    IMAGE_DELIVERY_DEADLINE,
+    INLINE_PAGE_SIZE,
+    INLINE_CACHE_TIME,
+    ANOTHER_PRESS_MODE,
+    RESPONSE_TTL,
+    REFRESH_INTERVAL,
+    REFRESH_QUEUE_MAX,
+    VARIANT_POOL_SIZE,
+    VARIANT_FILL_INTERVAL,
+    COLD_PICK_WEIGHT,
+    RECENT_COUNTRIES,
+    WARM_KEYS_REFRESH_INTERVAL,
+    UNKNOWN_COUNTRY_USER_LIMIT,
+    UNKNOWN_COUNTRY_GLOBAL_LIMIT,
+    UNKNOWN_COUNTRY_WINDOW,
+    BOT_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_REGISTER,
+)
 from countries import COUNTRIES, HOLIDAY_TYPES
-from llm import generate_holiday_tradition
-from database import Database
-from images import get_holiday_images
+from llm import (
+    generate_card_async,
+    close_async_client,
+    llm_in_flight,
+    llm_scheduler,
+    llm_breaker,
+    model_stats,
+    set_usage_recorder,
+    GenerationError,
+    GenerationUnavailable,
+    ProgressCallback,
+    GENERATION_ERROR_PREFIX,
+    PROMPT_VERSION,
+)
+from database import Database, AsyncDatabase, CardEntry
+from cards import render_card
+from images import get_holiday_images_async, close_image_client, unsplash_breaker
+from breaker import CLOSED
+from singleflight import SingleFlight
+from streaming import ThrottledMessageEditor
+from webhook import run_webhook
+from refresh import RefreshWorker
+from scheduler import PRIORITY_INTERACTIVE, PRIORITY_REFRESH, PRIORITY_PREWARM
+from selection import CountryPicker
+from registry import country_registry, is_plausible_country, display_name
+from ratelimit import SlidingWindowLimiter
+from outbox import SendQueue
+from variants import VariantFiller, choose_variant, get_seen, remember_seen
+from broadcast import Broadcaster, holiday_for_date, pick_unused_country
+from inline import InlineIndex, result_id, split_holiday
+from inflight import UserJobs
+from pipeline import CardJob, CardPipeline
+import metrics
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,8 +118,103 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация базы данных
-db = Database()
+# Инициализация базы данных (запросы выполняются вне event loop)
+db = AsyncDatabase(Database(
+    cache_max_items=RESPONSE_CACHE_MAX_ITEMS,
+    cache_max_bytes=RESPONSE_CACHE_MAX_BYTES,
+))
+
+# Объединение одновременных генераций одной и той же карточки
+generation_flight = SingleFlight("generation")
+
+# Идентификатор процесса для межпроцессных блокировок генерации
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Как часто проверять, не сгенерировал ли карточку другой процесс (секунды)
+LEASE_POLL_INTERVAL = 0.5
+
+# Фоновое обновление устаревших карточек
+refresh_worker = RefreshWorker(
+    lambda country, holiday_type: refresh_response(country, holiday_type),
+    interval=REFRESH_INTERVAL,
+    max_queue=REFRESH_QUEUE_MAX,
+)
+
+# Фоновое пополнение вариантов карточек, пока OpenAI простаивает
+variant_filler = VariantFiller(
+    db,
+    lambda country, holiday_type: add_response_variant(country, holiday_type),
+    is_idle=lambda: llm_in_flight() == 0 and refresh_worker.pending() == 0,
+    prompt_version=PROMPT_VERSION,
+    pool_size=VARIANT_POOL_SIZE,
+    interval=VARIANT_FILL_INTERVAL,
+)
+
+# Случайный выбор страны: при загрузке OpenAI предпочитаем закэшированные
+country_picker = CountryPicker(
+    COUNTRIES,
+    load=lambda: llm_in_flight() / LLM_MAX_CONCURRENCY if llm_breaker.state == CLOSED else 1.0,
+    cold_weight=COLD_PICK_WEIGHT,
+    recent_size=RECENT_COUNTRIES,
+)
+
+# Поиск стран для inline-режима (справочник + страны закэшированных карточек)
+inline_index = InlineIndex(country_registry)
+
+# Сколько холодных карточек из найденных по inline-запросу ставить на генерацию
+INLINE_COLD_PREFETCH = 2
+
+# Доставка карточки: одни и те же стадии для всех команд и кнопок
+card_pipeline = CardPipeline(
+    fetch_text=lambda job: fetch_card_text(job),
+    fetch_images=lambda job: fetch_card_images(job),
+    render=lambda job, text: render_card_message(job, text),
+    send_text=lambda job, text, reply_markup: send_card_text(job, text, reply_markup),
+    send_images=lambda job, found: send_card_images(job, found),
+    discard_status=lambda job: discard_status(job),
+    spawn=lambda coro: run_in_background(coro),
+    image_deadline=IMAGE_DELIVERY_DEADLINE,
+    hooks=[lambda job, stage, seconds: metrics.observe(f"stage_{stage}", seconds)],
+    on_images_timeout=lambda job: unsplash_breaker.record_failure(),
+)
+
+# Карточки по кнопке «Другая страна»: не больше одной на пользователя
+another_jobs = UserJobs("another", ANOTHER_PRESS_MODE)
+
+# Всплывающее уведомление на повторное нажатие, пока карточка готовится
+ANOTHER_BUSY_TEXT = "⏳ Уже готовлю карточку, подождите пару секунд"
+
+# Страны, которых нет в справочнике, генерируются с ограничением частоты
+unknown_country_user_limiter = SlidingWindowLimiter(UNKNOWN_COUNTRY_USER_LIMIT, UNKNOWN_COUNTRY_WINDOW)
+unknown_country_global_limiter = SlidingWindowLimiter(UNKNOWN_COUNTRY_GLOBAL_LIMIT, UNKNOWN_COUNTRY_WINDOW)
+
+# Все сообщения бота уходят через очередь с лимитами Telegram
+outbox = SendQueue(
+    global_rate=SEND_GLOBAL_RATE,
+    chat_rate=SEND_CHAT_RATE,
+    chat_burst=SEND_CHAT_BURST,
+    group_per_minute=SEND_GROUP_PER_MINUTE,
+    max_retries=SEND_MAX_RETRIES,
+)
+
+# Ежедневная рассылка карточки дня подписчикам
+broadcaster = Broadcaster(
+    db,
+    pick_country=lambda holiday_type, used: pick_unused_country(
+        COUNTRIES, holiday_type, used, country_picker.is_warm
+    ),
+    render=lambda country, holiday_type: render_broadcast_card(country, holiday_type),
+    concurrency=BROADCAST_CONCURRENCY,
+)
+
+# Время ежедневной рассылки в часовом поясе BROADCAST_TZ
+BROADCAST_AT = dt_time.fromisoformat(BROADCAST_TIME).replace(tzinfo=ZoneInfo(BROADCAST_TZ))
+
+# Типы обновлений, которые обрабатывает бот
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
+# Фоновые задачи (ссылки держим, чтобы задачи не собрал сборщик мусора)
+background_tasks = set()
 
 # Состояния для ConversationHandler
 CHOOSING_COUNTRY, CHOOSING_HOLIDAY = range(2)
@@ -47,6 +233,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 /newyear - Традиции Нового года в случайной стране
 /custom - Выбрать страну самостоятельно
 /another - Повторить с другой страной
+/subscribe - Присылать традицию дня перед праздниками
+/unsubscribe - Отписаться от рассылки
 /stats - Статистика базы данных
 
 ✨ Каждая подборка включает:
@@ -59,40 +247,22 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 Попробуй /holiday прямо сейчас!
 """
-    await update.message.reply_text(welcome_message)
+    await reply(update.message, welcome_message)
 
 
 async def holiday_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /holiday - случайная страна и случайный тип праздника"""
-    country = random.choice(COUNTRIES)
-    holiday_type = random.choice(list(HOLIDAY_TYPES.values()))
-
-    context.user_data['last_country'] = country
-    context.user_data['last_holiday'] = holiday_type
-
-    await send_holiday_info(update, country, holiday_type)
+    await deliver_card(update.message, context.user_data, random_card(None))
 
 
 async def christmas_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /christmas - Рождество в случайной стране"""
-    country = random.choice(COUNTRIES)
-    holiday_type = HOLIDAY_TYPES['christmas']
-
-    context.user_data['last_country'] = country
-    context.user_data['last_holiday'] = holiday_type
-
-    await send_holiday_info(update, country, holiday_type)
+    await deliver_card(update.message, context.user_data, random_card(HOLIDAY_TYPES['christmas']))
 
 
 async def newyear_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /newyear - Новый год в случайной стране"""
-    country = random.choice(COUNTRIES)
-    holiday_type = HOLIDAY_TYPES['newyear']
-
-    context.user_data['last_country'] = country
-    context.user_data['last_holiday'] = holiday_type
-
-    await send_holiday_info(update, country, holiday_type)
+    await deliver_card(update.message, context.user_data, random_card(HOLIDAY_TYPES['newyear']))
 
 
 async def custom_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -103,7 +273,8 @@ async def custom_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    await update.message.reply_text(
+    await reply(
+        update.message,
         "Как выбрать страну?",
         reply_markup=reply_markup
     )
@@ -112,22 +283,49 @@ async def custom_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def another_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /another - повторить с другой страной"""
-    last_holiday = context.user_data.get('last_holiday')
+    await deliver_card(update.message, context.user_data, random_card(context.user_data.get('last_holiday')))
 
-    if not last_holiday:
-        last_holiday = random.choice(list(HOLIDAY_TYPES.values()))
 
-    country = random.choice(COUNTRIES)
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Подписка на ежедневную рассылку традиции дня"""
+    if await db.add_subscriber(update.effective_chat.id):
+        text = (
+            f"🔔 Подписка оформлена! Каждый день в {BROADCAST_TIME} "
+            f"в сезон праздников я пришлю традицию дня.\n/unsubscribe — отписаться"
+        )
+    else:
+        text = "Вы уже подписаны на традицию дня. /unsubscribe — отписаться"
+    await reply(update.message, text)
 
-    context.user_data['last_country'] = country
-    context.user_data['last_holiday'] = last_holiday
 
-    await send_holiday_info(update, country, last_holiday)
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отписка от ежедневной рассылки"""
+    if await db.remove_subscriber(update.effective_chat.id):
+        text = "🔕 Вы отписались от традиции дня. /subscribe — подписаться снова"
+    else:
+        text = "Вы не подписаны на рассылку. /subscribe — подписаться"
+    await reply(update.message, text)
+
+
+def format_cost(cost: Optional[float]) -> str:
+    """Стоимость в USD для /stats («$—», если цена модели неизвестна)"""
+    return "$—" if cost is None else f"${cost:.4f}"
 
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Статистика базы данных"""
-    countries_count, total_count = db.get_stats()
+    countries_count, total_count = await db.get_stats()
+    subscribers_count = await db.get_subscriber_count()
+    cache_stats = db.response_cache.stats()
+    models_line = ", ".join(
+        f"{m['model']} {m['wins']}/{m['attempts']} ({format_cost(m['cost_usd'])})" for m in model_stats()
+    )
+    usage_line = ", ".join(
+        f"{u['model']} {u['calls']} запр., промпт {u['prompt_tokens']} "
+        f"(из кэша {u['cached_tokens'] / u['prompt_tokens']:.0%}), ответ {u['completion_tokens']}"
+        for u in await db.get_llm_usage_summary(time.time() - 24 * 3600)
+        if u["prompt_tokens"]
+    ) or "нет запросов"
 
     stats_message = f"""
 📊 Статистика базы данных:
@@ -135,10 +333,21 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 🌍 Стран в кэше: {countries_count}
 📝 Всего ответов: {total_count}
 💾 База данных: SQLite
+⚡ В памяти: {cache_stats["items"]} карточек, попаданий {cache_stats["hit_rate"]:.0%}
+🔄 В очереди на обновление: {refresh_worker.pending()}
+📤 Очередь отправки в Telegram: {outbox.depth()}
+🔔 Подписчиков рассылки: {subscribers_count}
+🤖 Запросов к OpenAI: выполняется {llm_scheduler.active()}, ждут {llm_scheduler.pending()}
+🔌 Выключатели: OpenAI — {llm_breaker.state}, Unsplash — {unsplash_breaker.state}
+🧠 Модели (победы/попытки): {models_line}
+🪙 Токены за сутки: {usage_line}
+🔁 Объединено одинаковых запросов: {int(metrics.get("generation_collapsed") + metrics.get("lease_collapsed"))}
+🎲 Случайный выбор из кэша: {country_picker.hit_rate():.0%}
+👆 Повторные нажатия «Другая страна»: подавлено {int(metrics.get("another_suppressed"))}, отменено {int(metrics.get("another_cancelled"))}
 
 Кэшированные ответы загружаются мгновенно!
 """
-    await update.message.reply_text(stats_message)
+    await reply(update.message, stats_message)
 
 
 async def handle_country_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -158,22 +367,51 @@ async def handle_country_choice(update: Update, context: ContextTypes.DEFAULT_TY
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        await query.edit_message_text(
+        await edit_query(
+            query,
             f"Выбрана страна: {country}\n\nКакой праздник?",
             reply_markup=reply_markup
         )
         return CHOOSING_HOLIDAY
 
     elif query.data == "type_country":
-        await query.edit_message_text(
-            "Введите название страны (на русском):\n\nНапример: Япония, Франция, Бразилия"
+        await edit_query(
+            query,
+            "Введите название страны (на русском или английском):\n\nНапример: Япония, Франция, Бразилия"
         )
         return CHOOSING_COUNTRY
 
 
 async def handle_typed_country(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка введённой страны"""
-    country = update.message.text.strip()
+    text = update.message.text
+    country = country_registry.resolve(text)
+
+    if country:
+        metrics.inc("country_resolved")
+    elif not is_plausible_country(text):
+        metrics.inc("country_rejected")
+        suggestions = country_registry.suggest(text)
+        hint = f"\n\nВозможно, вы имели в виду: {', '.join(suggestions)}" if suggestions else ""
+        await reply(
+            update.message,
+            f"Не удалось распознать страну. Попробуйте ещё раз.{hint}"
+        )
+        return CHOOSING_COUNTRY
+    elif allow_unknown_country(update.effective_user.id):
+        # Страны нет в справочнике, но ввод похож на название
+        country = display_name(text)
+        metrics.inc("country_unknown_allowed")
+        logger.info(f"Страна не из справочника: {country}")
+    else:
+        metrics.inc("country_unknown_limited")
+        await reply(
+            update.message,
+            "Этой страны пока нет в нашем списке, а лимит новых стран на ближайшее "
+            "время исчерпан. Выберите страну из списка или попробуйте позже."
+        )
+        return CHOOSING_COUNTRY
+
     context.user_data['custom_country'] = country
 
     # Выбор праздника
@@ -183,13 +421,34 @@ async def handle_typed_country(update: Update, context: ContextTypes.DEFAULT_TYP
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    await update.message.reply_text(
+    await reply(
+        update.message,
         f"Отлично! Выбрана страна: {country}\n\nКакой праздник?",
         reply_markup=reply_markup
     )
     return CHOOSING_HOLIDAY
 
 
+def allow_unknown_country(user_id: int) -> bool:
+    """
+    Можно ли сгенерировать страну не из справочника (лимит пользователя и общий)
+
+    Если отказал общий лимит, попытка пользователя не засчитывается.
+
+    Args:
+        user_id: Пользователь
+
+    Returns:
+        True, если оба лимита позволяют
+    """
+    if not unknown_country_user_limiter.allow(user_id):
+        return False
+    if not unknown_country_global_limiter.allow():
+        unknown_country_user_limiter.refund(user_id)
+        return False
+    return True
+
+
 async def handle_holiday_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора праздника"""
     query = update.callback_query
@@ -198,162 +457,635 @@ async def handle_holiday_choice(update: Update, context: ContextTypes.DEFAULT_TY
     country = context.user_data.get('custom_country')
     holiday_type = HOLIDAY_TYPES['christmas'] if 'christmas' in query.data else HOLIDAY_TYPES['newyear']
 
-    context.user_data['last_country'] = country
-    context.user_data['last_holiday'] = holiday_type
-
-    # Создаём фейковый update для send_holiday_info
-    await query.edit_message_text(f"Генерирую информацию о праздновании в стране {country}...")
+    # Статусным сообщением становится сообщение с выбором праздника
+    await deliver_card(query.message, context.user_data, chosen_card(country, holiday_type, query))
 
-    # Получаем информацию
-    response_text = await get_or_generate_response(country, holiday_type)
-
-    # Получаем изображения
-    images = get_holiday_images(country, holiday_type, count=3)
+    return ConversationHandler.END
 
-    # Удаляем статусное сообщение
-    await query.message.delete()
 
-    # Создаем кнопки
+def card_keyboard() -> InlineKeyboardMarkup:
+    """Inline-кнопки под карточкой"""
     keyboard = [
         [InlineKeyboardButton("Другая страна", callback_data="another")],
         [InlineKeyboardButton("Выбрать страну", callback_data="custom")],
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
 
-    # Отправляем с изображениями
-    if images:
-        # Отправляем изображения группой
-        media_group = [InputMediaPhoto(media=url) for url in images[:3]]
-        await query.message.reply_media_group(media=media_group)
 
-        # Отправляем текст отдельно
-        await query.message.reply_text(response_text, reply_markup=reply_markup)
-    else:
-        await query.message.reply_text(response_text, reply_markup=reply_markup)
+async def deliver_card(
+    message: Message,
+    user_data: Optional[MutableMapping],
+    resolve: Callable[[CardJob], Awaitable[None]],
+) -> CardJob:
+    """
+    Доставляет карточку через общий конвейер (все команды и кнопки)
 
-    return ConversationHandler.END
+    Args:
+        message: Сообщение, в чат которого отправляется карточка
+        user_data: Данные пользователя
+        resolve: Стадия resolve: random_card() или chosen_card()
 
+    Returns:
+        Доставка с временем стадий
+    """
+    return await card_pipeline.run(CardJob(message, user_data), resolve)
 
-async def send_holiday_info(update: Update, country: str, holiday_type: str) -> None:
-    """Генерирует и отправляет информацию о празднике"""
-    # Отправляем сообщение о начале генерации
-    status_message = await update.message.reply_text(
-        f"Генерирую информацию о праздновании в стране {country}..."
-    )
 
-    # Проверяем кэш или генерируем новый ответ
-    response_text = await get_or_generate_response(country, holiday_type)
+def random_card(holiday_type: Optional[str] = None) -> Callable[[CardJob], Awaitable[None]]:
+    """
+    Стадия resolve для случайной страны
 
-    # Получаем изображения
-    logger.info(f"Получение изображений для {country}, {holiday_type}")
-    images = get_holiday_images(country, holiday_type, count=3)
+    Args:
+        holiday_type: Праздник (None — случайный)
 
-    # Удаляем статусное сообщение
-    await status_message.delete()
+    Returns:
+        Корутина-функция стадии
+    """
+    async def resolve(job: CardJob) -> None:
+        holiday = holiday_type or random.choice(list(HOLIDAY_TYPES.values()))
+        country = country_picker.pick(holiday, job.user_data)
+        await start_card(job, country, holiday)
 
-    # Создаем inline-кнопки
-    keyboard = [
-        [InlineKeyboardButton("Другая страна", callback_data="another")],
-        [InlineKeyboardButton("Выбрать страну", callback_data="custom")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return resolve
 
-    # Отправляем результат с изображениями
-    if images:
+
+def chosen_card(
+    country: str,
+    holiday_type: str,
+    query: Optional[CallbackQuery] = None,
+) -> Callable[[CardJob], Awaitable[None]]:
+    """
+    Стадия resolve для выбранной пользователем страны
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+        query: Нажатие кнопки, сообщение которой становится статусным
+            (None — статус отправляется новым сообщением)
+
+    Returns:
+        Корутина-функция стадии
+    """
+    async def resolve(job: CardJob) -> None:
+        await start_card(job, country, holiday_type, query)
+
+    return resolve
+
+
+async def start_card(
+    job: CardJob,
+    country: str,
+    holiday_type: str,
+    query: Optional[CallbackQuery] = None,
+) -> None:
+    """
+    Запоминает выбранную карточку и показывает статусное сообщение «Генерирую...»
+
+    Args:
+        job: Доставка
+        country: Название страны
+        holiday_type: Тип праздника
+        query: Нажатие кнопки, сообщение которой редактируется в статус
+    """
+    job.country = country
+    job.holiday_type = holiday_type
+
+    if job.user_data is not None:
+        job.user_data['last_country'] = country
+        job.user_data['last_holiday'] = holiday_type
+
+    text = f"Генерирую информацию о праздновании в стране {country}..."
+    job.status_message = await (edit_query(query, text) if query else reply(job.message, text))
+
+
+async def fetch_card_text(job: CardJob) -> str:
+    """Стадия text: карточка из кэша или генерацией (с выводом в статус по мере генерации)"""
+    return await get_or_generate_response(job.country, job.holiday_type, job.status_message, job.user_data)
+
+
+def render_card_message(job: CardJob, text: str) -> Tuple[str, InlineKeyboardMarkup]:
+    """Стадия render: итоговый текст и кнопки под карточкой"""
+    return text, card_keyboard()
+
+
+async def send_card_text(job: CardJob, text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> None:
+    """Стадия send: статусное сообщение превращается в карточку"""
+    await finish_status(job.message, job.status_message, text, reply_markup=reply_markup)
+
+
+async def discard_status(job: CardJob) -> None:
+    """Удаляет статусное сообщение отменённой доставки"""
+    try:
+        await outbox.send(job.message.chat_id, job.status_message.delete)
+    except TelegramError:
+        pass
+
+
+async def reply(message: Message, text: str, **kwargs) -> Message:
+    """
+    Отвечает в чат сообщения через очередь отправки (с учётом лимитов Telegram)
+
+    Args:
+        message: Сообщение, в чат которого отправляется ответ
+        text: Текст ответа
+        **kwargs: Параметры reply_text (reply_markup и т. п.)
+
+    Returns:
+        Отправленное сообщение
+    """
+    return await outbox.send(message.chat_id, lambda: message.reply_text(text, **kwargs))
+
+
+async def edit_query(query: CallbackQuery, text: str, **kwargs) -> Union[Message, bool]:
+    """
+    Редактирует сообщение с нажатой кнопкой через очередь отправки
+
+    Args:
+        query: Нажатие inline-кнопки
+        text: Новый текст
+        **kwargs: Параметры edit_message_text
+
+    Returns:
+        Отредактированное сообщение
+    """
+    return await outbox.send(query.message.chat_id, lambda: query.edit_message_text(text, **kwargs))
+
+
+async def finish_status(
+    message: Message,
+    status_message: Message,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+) -> None:
+    """
+    Заменяет статусное сообщение итоговым текстом
+
+    Вместо пары «удалить статус + отправить карточку» статус редактируется:
+    один запрос к Telegram вместо двух. Если править нельзя (сообщение
+    удалено или слишком старое), статус удаляется и карточка отправляется
+    новым сообщением.
+
+    Args:
+        message: Сообщение, в чат которого отправляется карточка
+        status_message: Статусное сообщение «Генерирую...»
+        text: Текст карточки
+        reply_markup: Кнопки под карточкой
+    """
+    chat_id = message.chat_id
+    try:
+        await outbox.send(chat_id, lambda: status_message.edit_text(text, reply_markup=reply_markup))
+        metrics.inc("status_coalesced")
+        return
+    except BadRequest as e:
+        if "not modified" in str(e):
+            return
+        logger.info(f"Статусное сообщение не удалось отредактировать: {e}")
+
+    try:
+        await outbox.send(chat_id, status_message.delete)
+    except TelegramError:
+        pass
+    await reply(message, text, reply_markup=reply_markup)
+
+
+async def fetch_card_images(job: CardJob) -> Optional[Tuple[List[str], bool]]:
+    """
+    Стадия images: изображения карточки (идёт параллельно с генерацией текста)
+
+    Если фотографии карточки уже отправлялись, используются сохранённые
+    file_id — Telegram не скачивает изображения заново.
+
+    Args:
+        job: Доставка
+
+    Returns:
+        (file_id или URL, это file_id) или None, если изображений нет
+    """
+    file_ids = await db.get_photo_file_ids(job.country, job.holiday_type)
+    if file_ids:
+        return file_ids, True
+
+    images = await get_holiday_images_async(job.country, job.holiday_type, count=3, db=db)
+    logger.info(f"Изображения {job}: найдено {len(images)} шт.")
+    return (images[:3], False) if images else None
+
+
+async def send_card_images(job: CardJob, found: Tuple[List[str], bool]) -> None:
+    """
+    Отправляет изображения карточки альбомом
+
+    Если Telegram отклоняет сохранённые file_id (BadRequest), они удаляются
+    и изображения ищутся заново. Сетевые ошибки и RetryAfter file_id не
+    затрагивают: альбом просто не отправляется.
+
+    Args:
+        job: Доставка
+        found: Результат fetch_card_images
+    """
+    media, from_file_ids = found
+    chat_id = job.message.chat_id
+
+    if from_file_ids:
         try:
-            # Отправляем изображения группой
-            media_group = [InputMediaPhoto(media=url) for url in images[:3]]
-            await update.message.reply_media_group(media=media_group)
-
-            # Отправляем текст отдельно
-            await update.message.reply_text(response_text, reply_markup=reply_markup)
-        except Exception as e:
-            logger.error(f"Ошибка при отправке изображений: {e}")
-            # Если не удалось отправить изображения, отправляем только текст
-            await update.message.reply_text(response_text, reply_markup=reply_markup)
-    else:
-        await update.message.reply_text(response_text, reply_markup=reply_markup)
+            await outbox.send(
+                chat_id,
+                lambda: job.message.reply_media_group(media=[InputMediaPhoto(media=file_id) for file_id in media]),
+                cost=len(media),
+            )
+            metrics.inc("photo_file_id_hits")
+            return
+        except BadRequest as e:
+            logger.warning(f"Сохранённые file_id для {job} не приняты: {e}")
+            metrics.inc("photo_file_id_invalidated")
+            await db.delete_photo_file_ids(job.country, job.holiday_type)
+
+        media = (await get_holiday_images_async(job.country, job.holiday_type, count=3, db=db))[:3]
+        if not media:
+            return
+
+    media_group = [InputMediaPhoto(media=url) for url in media]
+    sent = await outbox.send(
+        chat_id, lambda: job.message.reply_media_group(media=media_group), cost=len(media_group)
+    )
 
+    # Запоминаем file_id, чтобы в следующий раз не загружать фото заново
+    file_ids = [m.photo[-1].file_id for m in sent if m.photo]
+    if file_ids:
+        await db.save_photo_file_ids(job.country, job.holiday_type, file_ids)
 
-async def get_or_generate_response(country: str, holiday_type: str) -> str:
+
+def run_in_background(coro) -> asyncio.Task:
+    """
+    Запускает корутину фоновой задачей, сохраняя ссылку до её завершения
+
+    Args:
+        coro: Корутина
+
+    Returns:
+        Созданная задача
+    """
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def get_or_generate_response(
+    country: str,
+    holiday_type: str,
+    status_message: Optional[Message] = None,
+    user_data: Optional[MutableMapping] = None,
+) -> str:
     """
     Получает ответ из кэша или генерирует новый
 
+    Если у карточки несколько вариантов, пользователю показывается
+    тот, который он ещё не видел.
+
     Args:
         country: Название страны
         holiday_type: Тип праздника
+        status_message: Статусное сообщение, в котором показывается
+            текст по мере генерации (если включён LLM_STREAM)
+        user_data: Данные пользователя (для ротации вариантов)
 
     Returns:
         Текст ответа
     """
-    # Проверяем кэш
-    cached = db.get_response(country, holiday_type)
+    # Проверяем кэш; устаревшую карточку выдаём сразу и обновляем в фоне
+    variants = await db.get_variants(country, holiday_type)
 
-    if cached:
-        logger.info(f"Ответ для {country} ({holiday_type}) взят из кэша")
-        return f"💾 {cached}"
+    if variants:
+        note_cached(country, holiday_type)
+        seen = get_seen(user_data)
+        entry, exhausted = choose_variant(variants, seen, is_fresh)
+        remember_seen(seen, entry)
 
-    # Генерируем новый ответ
-    logger.info(f"Генерация нового ответа для {country} ({holiday_type})")
-    response = generate_holiday_tradition(country, holiday_type)
+        if exhausted and user_data is not None:
+            variant_filler.note_demand(country, holiday_type)
 
-    # Сохраняем в кэш
-    db.save_response(country, holiday_type, response)
-    logger.info(f"Ответ для {country} ({holiday_type}) сохранён в кэш")
+        if is_fresh(entry):
+            logger.info(f"Ответ для {country} ({holiday_type}) взят из кэша")
+        else:
+            refresh_worker.schedule(country, holiday_type)
+            metrics.inc("stale_served")
+            if not entry.is_complete():
+                metrics.inc("incomplete_served")
+            logger.info(f"Устаревший ответ для {country} ({holiday_type}) выдан из кэша, обновление в фоне")
+        return f"💾 {entry.render(country, holiday_type)}"
+
+    editor = None
+    if LLM_STREAM and status_message is not None:
+        editor = ThrottledMessageEditor(status_message, STREAM_EDIT_INTERVAL, outbox)
+
+    try:
+        # Одновременные промахи по одному ключу ждут одну общую генерацию
+        return await generation_flight.do(
+            (country, holiday_type),
+            lambda: generate_and_save_response(
+                country, holiday_type, editor.update if editor else None
+            )
+        )
+    except GenerationUnavailable:
+        metrics.inc("fallback_served")
+        return await fallback_response(country, holiday_type)
+    except GenerationError as e:
+        # Ошибка показывается пользователю, но в кэш не попадает
+        return f"{GENERATION_ERROR_PREFIX}: {e}"
+    finally:
+        if editor is not None:
+            await editor.close()
+
+
+async def fallback_response(country: str, holiday_type: str) -> str:
+    """
+    Запасной ответ, пока генерация недоступна (выключатель OpenAI разомкнут)
 
-    return response
+    Если есть карточка этой страны для другого праздника, показываем её,
+    иначе просим попробовать позже.
 
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Обработчик нажатий на inline-кнопки"""
-    query = update.callback_query
-    await query.answer()
+    Returns:
+        Текст ответа
+    """
+    for other_holiday in HOLIDAY_TYPES.values():
+        if other_holiday == holiday_type:
+            continue
+
+        entry = await db.get_entry(country, other_holiday)
+        if entry:
+            return (
+                f"⚠️ Сейчас не получается подготовить карточку «{holiday_type}», "
+                f"вот готовая карточка «{other_holiday}» для этой страны:\n\n"
+                f"💾 {entry.render(country, other_holiday)}"
+            )
+
+    return (
+        f"⚠️ Сервис генерации временно недоступен, карточку для страны {country} "
+        f"подготовить не получилось. Попробуйте позже или нажмите «Другая страна» — "
+        f"готовые карточки по-прежнему доступны."
+    )
 
-    if query.data == "another":
-        last_holiday = context.user_data.get('last_holiday')
 
-        if not last_holiday:
-            last_holiday = random.choice(list(HOLIDAY_TYPES.values()))
+async def generate_and_save_response(
+    country: str,
+    holiday_type: str,
+    on_progress: Optional[ProgressCallback] = None,
+    variant: int = 0,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> str:
+    """
+    Генерирует ответ под межпроцессной блокировкой и сохраняет его в кэш
 
-        country = random.choice(COUNTRIES)
+    Если карточку уже генерирует другой процесс с той же базой,
+    ждём его результат вместо повторного запроса к OpenAI.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+        on_progress: Колбэк для постепенного вывода текста
+        variant: Номер варианта, который нужно (пере)создать
+        priority: Приоритет запроса в очереди к OpenAI
+
+    Returns:
+        Текст ответа
+
+    Raises:
+        GenerationError: Ответ не сгенерирован (в кэш ничего не сохраняется)
+    """
+    # Свежие записи других процессов читаем из базы, минуя LRU
+    while not await db.acquire_lease(country, holiday_type, LEASE_OWNER, GENERATION_LEASE_TTL):
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+
+        entry = await load_variant(country, holiday_type, variant)
+        if entry and is_fresh(entry):
+            metrics.inc("lease_collapsed")
+            logger.info(f"Ответ для {country} ({holiday_type}) сгенерирован другим процессом")
+            return f"💾 {entry.render(country, holiday_type)}"
+
+    try:
+        # Карточка могла появиться, пока мы ждали блокировку
+        entry = await load_variant(country, holiday_type, variant)
+        if entry and is_fresh(entry):
+            note_cached(country, holiday_type)
+            return f"💾 {entry.render(country, holiday_type)}"
+
+        # Генерируем новый ответ; блокировка продлевается, пока идёт генерация
+        logger.info(f"Генерация нового ответа для {country} ({holiday_type})")
+        try:
+            async with db.lease_heartbeat(country, holiday_type, LEASE_OWNER, GENERATION_LEASE_TTL):
+                card = await generate_card_async(
+                    country, holiday_type, on_progress=on_progress, priority=priority
+                )
+        except GenerationError as e:
+            logger.error(f"Ответ для {country} ({holiday_type}) не сгенерирован: {e}")
+            raise
+
+        # Сохраняем в кэш поля карточки; текст собирается при отправке
+        await db.save_response(country, holiday_type, card, PROMPT_VERSION, variant)
+        note_cached(country, holiday_type)
+        logger.info(f"Ответ для {country} ({holiday_type}) сохранён в кэш")
+    finally:
+        await db.release_lease(country, holiday_type, LEASE_OWNER)
+
+    return render_card(country, holiday_type, card)
+
+
+def note_cached(country: str, holiday_type: str) -> None:
+    """
+    Отметить, что карточка есть в базе (для случайного выбора и inline-режима)
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+    """
+    country_picker.mark_warm(country, holiday_type)
+    inline_index.add_countries([country])
+
+
+async def load_cached_keys() -> int:
+    """
+    Перечитать из базы, для каких пар (страна, праздник) есть карточки
+
+    Карточки пишут и другие процессы (prewarm.py, другие экземпляры бота
+    с той же базой), поэтому список обновляется периодически.
+
+    Returns:
+        Число пар с карточками
+    """
+    cached_keys = await db.get_cached_keys()
+    country_picker.load_warm(cached_keys)
+    inline_index.add_countries(country for country, _ in cached_keys)
+    return len(cached_keys)
+
+
+async def warm_keys_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодическое обновление списка готовых карточек"""
+    await load_cached_keys()
+
+
+def is_fresh(entry: CardEntry) -> bool:
+    """
+    Проверяет, актуальна ли закэшированная карточка
+
+    Карточка устаревает по истечении RESPONSE_TTL, если она создана
+    другой версией промпта/модели или в ней заполнены не все поля.
+
+    Args:
+        entry: Запись кэша
+
+    Returns:
+        True, если карточку не нужно обновлять
+    """
+    return entry.is_complete() and entry.is_fresh(PROMPT_VERSION, RESPONSE_TTL)
+
+
+async def load_variant(country: str, holiday_type: str, variant: int) -> Optional[CardEntry]:
+    """
+    Читает из базы (минуя LRU) вариант карточки с указанным номером
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+        variant: Номер варианта
+
+    Returns:
+        Запись кэша или None если варианта нет
+    """
+    for entry in await db.load_variants(country, holiday_type):
+        if entry.variant == variant:
+            return entry
+    return None
 
-        context.user_data['last_country'] = country
-        context.user_data['last_holiday'] = last_holiday
 
-        # Статусное сообщение
-        status_message = await query.message.reply_text(
-            f"Генерирую информацию о праздновании в стране {country}..."
+async def refresh_response(country: str, holiday_type: str) -> None:
+    """
+    Заново генерирует устаревший вариант карточки (вызывается фоновым обработчиком)
+
+    За один вызов обновляется самый старый устаревший вариант.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+    """
+    stale = [entry for entry in await db.load_variants(country, holiday_type) if not is_fresh(entry)]
+    variant = min(stale, key=lambda entry: entry.created_at).variant if stale else 0
+
+    await generation_flight.do(
+        (country, holiday_type),
+        lambda: generate_and_save_response(
+            country, holiday_type, variant=variant, priority=PRIORITY_REFRESH
         )
+    )
 
-        # Получаем ответ
-        response_text = await get_or_generate_response(country, last_holiday)
 
-        # Получаем изображения
-        images = get_holiday_images(country, last_holiday, count=3)
+async def add_response_variant(country: str, holiday_type: str) -> None:
+    """
+    Генерирует ещё один вариант карточки (вызывается фоновым пополнением)
 
-        # Удаляем статус
-        await status_message.delete()
+    Если карточку сейчас генерирует кто-то другой, пополнение пропускается.
 
-        # Кнопки
-        keyboard = [
-            [InlineKeyboardButton("Другая страна", callback_data="another")],
-            [InlineKeyboardButton("Выбрать страну", callback_data="custom")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+    """
+    if not await db.acquire_lease(country, holiday_type, LEASE_OWNER, GENERATION_LEASE_TTL):
+        return
+
+    try:
+        if len(await db.load_variants(country, holiday_type)) >= VARIANT_POOL_SIZE:
+            return
+
+        try:
+            async with db.lease_heartbeat(country, holiday_type, LEASE_OWNER, GENERATION_LEASE_TTL):
+                card = await generate_card_async(
+                    country, holiday_type, priority=PRIORITY_PREWARM
+                )
+        except GenerationError as e:
+            logger.error(f"Вариант для {country} ({holiday_type}) не сгенерирован: {e}")
+            return
+
+        await db.add_variant(country, holiday_type, card, PROMPT_VERSION)
+        metrics.inc("variants_added")
+        logger.info(f"Добавлен вариант карточки {country} ({holiday_type})")
+    finally:
+        await db.release_lease(country, holiday_type, LEASE_OWNER)
+
+
+async def render_broadcast_card(country: str, holiday_type: str) -> str:
+    """
+    Текст карточки дня для рассылки: из кэша или одной генерацией
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+
+    Returns:
+        Текст сообщения рассылки
+
+    Raises:
+        GenerationError: Карточки нет в кэше и её не удалось сгенерировать
+    """
+    variants = [entry for entry in await db.get_variants(country, holiday_type) if entry.is_complete()]
+    if variants:
+        entry = next((entry for entry in variants if is_fresh(entry)), variants[0])
+        text = entry.render(country, holiday_type)
+    else:
+        text = await generation_flight.do(
+            (country, holiday_type),
+            lambda: generate_and_save_response(country, holiday_type, priority=PRIORITY_REFRESH)
+        )
+        text = text.removeprefix("💾 ")
+
+    return f"🎁 Традиция дня\n\n{text}"
+
+
+async def broadcast_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Задача рассылки традиции дня (по расписанию и для возобновления при старте)
 
-        # Отправляем
-        if images:
-            try:
-                media_group = [InputMediaPhoto(media=url) for url in images[:3]]
-                await query.message.reply_media_group(media=media_group)
-                await query.message.reply_text(response_text, reply_markup=reply_markup)
-            except Exception as e:
-                logger.error(f"Ошибка при отправке изображений: {e}")
-                await query.message.reply_text(response_text, reply_markup=reply_markup)
+    Вне сезона и до BROADCAST_TIME ничего не делает; завершённая за
+    сегодня рассылка не повторяется. Если карточку дня не удалось
+    подготовить, задача повторяется через BROADCAST_RETRY_INTERVAL.
+    """
+    now = datetime.now(BROADCAST_AT.tzinfo)
+    holiday_type = holiday_for_date(now.date(), BROADCAST_SEASON)
+    if holiday_type is None or now.timetz() < BROADCAST_AT:
+        return
+
+    async def send(chat_id: int, text: str):
+        return await outbox.send(
+            chat_id, lambda: context.bot.send_message(chat_id, text, reply_markup=card_keyboard())
+        )
+
+    try:
+        await broadcaster.run(now.date(), holiday_type, send)
+    except GenerationError as e:
+        logger.error(f"Карточка дня не подготовлена, повтор через {BROADCAST_RETRY_INTERVAL:.0f}с: {e}")
+        context.job_queue.run_once(broadcast_job, BROADCAST_RETRY_INTERVAL, name="broadcast_retry")
+
+
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик нажатий на inline-кнопки"""
+    query = update.callback_query
+
+    if query.data == "another":
+        # Пока карточка готовится, повторные нажатия не запускают новую.
+        # При отмене (ANOTHER_PRESS_MODE=replace) конвейер удаляет статус, а
+        # общая генерация в SingleFlight продолжается и сохранит карточку в кэш
+        job = deliver_card(query.message, context.user_data, random_card(context.user_data.get('last_holiday')))
+        if another_jobs.start(query.from_user.id, job):
+            await query.answer()
         else:
-            await query.message.reply_text(response_text, reply_markup=reply_markup)
+            await query.answer(ANOTHER_BUSY_TEXT)
+        return
+
+    await query.answer()
 
-    elif query.data == "custom":
+    if query.data == "custom":
         # Запускаем выбор страны
         keyboard = [
             [InlineKeyboardButton("🎲 Случайная страна", callback_data="random_country")],
@@ -361,26 +1093,143 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        await query.message.reply_text(
+        await reply(
+            query.message,
             "Как выбрать страну?",
             reply_markup=reply_markup
         )
 
 
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Inline-режим (@bot Япония): готовые карточки, подходящие под запрос
+
+    Ответ собирается только из кэша и не ждёт OpenAI. Карточки, которых
+    ещё нет, ставятся на генерацию в фоне и появятся в следующих запросах.
+    Карточки других процессов появляются после обновления списка готовых
+    карточек (warm_keys_job) или первой выдачи этим процессом.
+    """
+    query = update.inline_query
+    started = time.monotonic()
+    offset = int(query.offset) if query.offset.isdigit() else 0
+
+    text, holiday_type = split_holiday(query.query)
+    holidays = [holiday_type] if holiday_type else list(HOLIDAY_TYPES.values())
+    keys = [(country, holiday) for country in inline_index.search(text) for holiday in holidays]
+    warm = [key for key in keys if country_picker.is_warm(*key)]
+
+    # Холодные карточки лучших совпадений — на генерацию (только из справочника)
+    preparing = False
+    if offset == 0 and text:
+        cold = [key for key in keys if not country_picker.is_warm(*key) and key[0] in COUNTRIES]
+        for country, holiday in cold[:INLINE_COLD_PREFETCH]:
+            if refresh_worker.schedule(country, holiday):
+                metrics.inc("inline_cold_scheduled")
+        preparing = bool(cold) and not warm
+
+    page = warm[offset:offset + INLINE_PAGE_SIZE]
+    bot_link = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🎄 Больше традиций", url=f"https://t.me/{context.bot.username}")]
+    ])
+    results = []
+    for country, holiday in page:
+        variants = await db.get_variants(country, holiday)
+        entry = next((entry for entry in variants if entry.is_complete()), variants[0] if variants else None)
+        if entry is None:
+            continue
+        results.append(InlineQueryResultArticle(
+            id=result_id(country, holiday),
+            title=f"{country} — {holiday}",
+            description=entry.card.traditions[:100] if entry.card else None,
+            input_message_content=InputTextMessageContent(entry.render(country, holiday)),
+            reply_markup=bot_link,
+        ))
+
+    next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(warm) else ""
+    button = None
+    if preparing:
+        button = InlineQueryResultsButton(text="⏳ Карточка готовится — открыть бота", start_parameter="inline")
+
+    await query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME if not preparing else 0,
+        next_offset=next_offset,
+        button=button,
+    )
+    metrics.inc("inline_queries")
+    metrics.observe("inline_answer", time.monotonic() - started)
+
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик ошибок"""
+    if isinstance(context.error, RetryAfter):
+        # Очередь отправки уже повторяла запрос; отвечать сейчас — только продлить запрет
+        metrics.inc("outbox_retry_after_exhausted")
+        logger.warning(f"Telegram ограничил частоту отправки: {context.error}")
+        return
+
     logger.error(f"Update {update} caused error {context.error}")
 
     if update and update.message:
-        await update.message.reply_text(
+        await reply(
+            update.message,
             "Произошла ошибка при обработке запроса. Попробуйте еще раз."
         )
 
 
+async def on_startup(application: Application) -> None:
+    """Подготовка бота после инициализации"""
+    if RESPONSE_CACHE_WARM:
+        loaded = await db.warm_response_cache()
+        logger.info(f"В память загружено {loaded} карточек из кэша")
+
+    await load_cached_keys()
+
+    # Расход токенов каждой генерации пишется в таблицу llm_usage
+    set_usage_recorder(
+        lambda country, holiday_type, records: db.save_llm_usage(
+            country, holiday_type, records, PROMPT_VERSION
+        )
+    )
+
+    refresh_worker.start()
+    variant_filler.start()
+
+    # Ежедневная рассылка; при старте продолжаем прерванную рассылку дня.
+    # Список готовых карточек перечитывается: их пишут и другие процессы
+    if application.job_queue is None:
+        logger.warning(
+            "Рассылка и обновление списка готовых карточек отключены: "
+            "установите python-telegram-bot[job-queue]"
+        )
+    else:
+        application.job_queue.run_daily(broadcast_job, time=BROADCAST_AT, name="broadcast")
+        application.job_queue.run_once(broadcast_job, 10, name="broadcast_resume")
+        application.job_queue.run_repeating(
+            warm_keys_job, WARM_KEYS_REFRESH_INTERVAL, first=WARM_KEYS_REFRESH_INTERVAL, name="warm_keys"
+        )
+
+
+async def on_shutdown(application: Application) -> None:
+    """Освобождение ресурсов при остановке бота"""
+    await variant_filler.stop()
+    await refresh_worker.stop()
+    await close_async_client()
+    await close_image_client()
+    await db.close()
+
+
 def main() -> None:
     """Основная функция запуска бота"""
     # Создаем приложение
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_BASE_URL)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # ConversationHandler для выбора кастомной страны
     conv_handler = ConversationHandler(
@@ -404,8 +1253,13 @@ def main() -> None:
     application.add_handler(CommandHandler("newyear", newyear_command))
     application.add_handler(CommandHandler("another", another_command))
     application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
     application.add_handler(conv_handler)
 
+    # Inline-режим: ответы из готовых карточек
+    application.add_handler(InlineQueryHandler(inline_query_handler))
+
     # Регистрируем обработчик callback-кнопок
     application.add_handler(CallbackQueryHandler(button_callback))
 
@@ -413,8 +1267,21 @@ def main() -> None:
     application.add_error_handler(error_handler)
 
     # Запускаем бота
-    logger.info("Бот запускается...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    logger.info(f"Бот запускается (режим: {BOT_MODE})...")
+
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(
+            application,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+            register=WEBHOOK_REGISTER,
+        ))
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+"""
+Автоматический выключатель (circuit breaker) для внешних сервисов
+
+После нескольких ошибок подряд выключатель размыкается, и запросы
+к сервису сразу отклоняются вместо ожидания таймаута. Через
+reset_timeout секунд пропускается один пробный запрос: при успехе
+выключатель замыкается, при ошибке снова размыкается.
+"""
+import time
+from typing import Optional
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Значения показателя breaker_<имя>_state в metrics
+STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Выключатель разомкнут: сервис временно не вызывается"""
+
+
+class CircuitBreaker:
+    """Выключатель с состояниями closed, open и half_open"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            name: Имя сервиса (для метрик и логов)
+            failure_threshold: Сколько ошибок подряд размыкают выключатель
+            reset_timeout: Через сколько секунд пробовать снова
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started: Optional[float] = None
+        metrics.set_gauge(f"breaker_{name}_state", STATE_GAUGE[CLOSED])
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние (с учётом истёкшего reset_timeout)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Можно ли сейчас обращаться к сервису
+
+        В состоянии half_open разрешается один пробный запрос; если его
+        результат не сообщён за reset_timeout, разрешается следующий.
+
+        Returns:
+            True, если запрос можно выполнять
+        """
+        state = self.state
+
+        if state == CLOSED:
+            return True
+
+        if state == HALF_OPEN:
+            now = time.monotonic()
+            if self._trial_started is None or now - self._trial_started >= self.reset_timeout:
+                self._trial_started = now
+                return True
+
+        metrics.inc(f"breaker_{self.name}_rejected")
+        return False
+
+    def check(self):
+        """
+        То же, что allow(), но с исключением
+
+        Raises:
+            CircuitOpenError: Выключатель разомкнут
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} временно недоступен")
+
+    def record_success(self):
+        """Сообщить об успешном запросе"""
+        self._failures = 0
+        self._trial_started = None
+        if self._state != CLOSED:
+            self._set_state(CLOSED)
+
+    def release_trial(self):
+        """
+        Забыть пробный запрос, отменённый до получения результата
+
+        Отмена не говорит о состоянии сервиса: следующий запрос в
+        half_open снова может стать пробным.
+        """
+        self._trial_started = None
+
+    def record_failure(self):
+        """Сообщить о неудачном запросе"""
+        self._failures += 1
+        self._trial_started = None
+
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                metrics.inc(f"breaker_{self.name}_opened")
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self._state = state
+        metrics.set_gauge(f"breaker_{self.name}_state", STATE_GAUGE[state])
@@ -0,0 +1,221 @@
+"""
+Ежедневная рассылка «традиция дня» подписчикам (/subscribe)
+
+Карточка дня готовится один раз — из кэша или одной генерацией — и
+рассылается всем подписчикам с ограниченным параллелизмом через очередь
+отправки с лимитами Telegram. Каждая отправка записывается в базу,
+поэтому после перезапуска рассылка продолжается с того же места и
+никому не приходит дважды.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import date
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+import metrics
+from countries import HOLIDAY_TYPES
+from database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def holiday_for_date(day: date, season: Tuple[Tuple[int, int], Tuple[int, int]]) -> Optional[str]:
+    """
+    Праздник рассылки для даты
+
+    До 25 декабря — Рождество, с 26 декабря по 1 января — Новый год,
+    в январе после Нового года — снова Рождество (православное).
+
+    Args:
+        day: Дата
+        season: Начало и конец сезона рассылки ((месяц, день), (месяц, день)),
+            сезон может переходить через Новый год
+
+    Returns:
+        Тип праздника или None, если дата вне сезона
+    """
+    current = (day.month, day.day)
+    start, end = season
+    in_season = start <= current <= end if start <= end else current >= start or current <= end
+    if not in_season:
+        return None
+
+    if (12, 26) <= current or current == (1, 1):
+        return HOLIDAY_TYPES["newyear"]
+    return HOLIDAY_TYPES["christmas"]
+
+
+def is_unreachable(error: TelegramError) -> bool:
+    """Чат больше недоступен: бот заблокирован или чат удалён"""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+
+class BroadcastProgress:
+    """Счётчики и скорость рассылки"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.started_at = time.monotonic()
+
+    def messages_per_second(self) -> float:
+        """Скорость рассылки в сообщениях в секунду"""
+        elapsed = time.monotonic() - self.started_at
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"отправлено {self.sent}/{self.total}, ошибок {self.failed}, "
+            f"заблокировали бота {self.blocked}, {self.messages_per_second():.1f} сообщений/с"
+        )
+
+
+class Broadcaster:
+    """Рассылка карточки дня подписчикам"""
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        pick_country: Callable[[str, set], str],
+        render: Callable[[str, str], Awaitable[str]],
+        concurrency: int = 8,
+    ):
+        """
+        Args:
+            db: База данных
+            pick_country: Выбор страны для праздника (праздник, уже использованные страны)
+            render: Корутина, возвращающая текст карточки (из кэша или генерацией)
+            concurrency: Максимум одновременных отправок
+        """
+        self.db = db
+        self.pick_country = pick_country
+        self.render = render
+        self.concurrency = concurrency
+        self._lock = asyncio.Lock()
+
+    async def run(
+        self,
+        day: date,
+        holiday_type: str,
+        send: Callable[[int, str], Awaitable[object]],
+    ) -> Optional[BroadcastProgress]:
+        """
+        Разослать карточку дня (или продолжить прерванную рассылку)
+
+        Args:
+            day: Дата рассылки
+            holiday_type: Праздник (используется, если рассылка ещё не начата)
+            send: Корутина отправки текста в чат (с учётом лимитов Telegram)
+
+        Returns:
+            Итоги рассылки или None, если рассылка за этот день уже завершена
+
+        Raises:
+            GenerationError: Карточку дня не удалось подготовить
+        """
+        # Задача по расписанию и возобновление при старте не должны идти параллельно
+        async with self._lock:
+            key = day.isoformat()
+            broadcast = await self.db.get_broadcast(key)
+            if broadcast and broadcast["finished_at"]:
+                return None
+
+            if broadcast is None:
+                used = await self.db.get_broadcast_countries()
+                country = self.pick_country(holiday_type, used)
+                broadcast = await self.db.start_broadcast(key, country, holiday_type)
+
+            # Текст готовится один раз и сохраняется: после перезапуска
+            # подписчики получают ту же карточку
+            text = broadcast["text"]
+            if not text:
+                text = await self.render(broadcast["country"], broadcast["holiday_type"])
+                await self.db.set_broadcast_text(key, text)
+
+            recipients = await self.db.get_pending_recipients(key)
+            progress = BroadcastProgress(len(recipients))
+            logger.info(
+                f"Рассылка {key}: {broadcast['country']} ({broadcast['holiday_type']}), "
+                f"получателей {len(recipients)}"
+            )
+
+            await self._fan_out(key, text, recipients, progress, send)
+            await self.db.finish_broadcast(key)
+
+            metrics.set_gauge("broadcast_messages_per_second", progress.messages_per_second())
+            logger.info(f"Рассылка {key} завершена: {progress}")
+            return progress
+
+    async def _fan_out(
+        self,
+        key: str,
+        text: str,
+        recipients: List[int],
+        progress: BroadcastProgress,
+        send: Callable[[int, str], Awaitable[object]],
+    ):
+        """Отправить текст получателям, не больше concurrency одновременно"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(chat_id: int):
+            async with semaphore:
+                try:
+                    await send(chat_id, text)
+                    status = "sent"
+                    progress.sent += 1
+                    metrics.inc("broadcast_sent")
+                except TelegramError as e:
+                    status = "blocked" if is_unreachable(e) else "failed"
+
+                if status == "blocked":
+                    # Бот заблокирован или чат удалён — отписываем
+                    progress.blocked += 1
+                    metrics.inc("broadcast_blocked")
+                    await self.db.remove_subscriber(chat_id)
+                    logger.info(f"Чат {chat_id} отписан от рассылки")
+                elif status == "failed":
+                    progress.failed += 1
+                    metrics.inc("broadcast_failed")
+                    logger.warning(f"Рассылка в чат {chat_id} не отправлена")
+
+                await self.db.record_delivery(key, chat_id, status)
+
+        tasks = [asyncio.create_task(deliver(chat_id)) for chat_id in recipients]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Не досылаем после сбоя: неотмеченные получатели достанутся возобновлению
+            for task in tasks:
+                task.cancel()
+            raise
+
+
+def pick_unused_country(
+    countries: List[str],
+    holiday_type: str,
+    used: set,
+    is_warm: Callable[[str, str], bool],
+) -> str:
+    """
+    Страна для рассылки: ещё не было в рассылках, по возможности уже в кэше
+
+    Args:
+        countries: Все страны
+        holiday_type: Праздник
+        used: Страны прошлых рассылок
+        is_warm: Есть ли карточка в кэше
+
+    Returns:
+        Название страны
+    """
+    candidates = [country for country in countries if country not in used] or countries
+    warm = [country for country in candidates if is_warm(country, holiday_type)]
+    return random.choice(warm or candidates)
@@ -0,0 +1,116 @@
+"""
+In-memory LRU кэш перед базой данных
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Ограниченный LRU-кэш с лимитом по числу записей и по объёму"""
+
+    def __init__(self, max_items: int = 256, max_bytes: int = 4 * 1024 * 1024):
+        """
+        Args:
+            max_items: Максимальное количество записей
+            max_bytes: Максимальный суммарный размер значений (байты UTF-8)
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Получить значение и отметить его как недавно использованное
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Значение или None, если записи нет
+        """
+        with self._lock:
+            value = self._data.get(key)
+
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None):
+        """
+        Сохранить значение, вытесняя самые старые записи при превышении лимитов
+
+        Args:
+            key: Ключ записи
+            value: Значение
+            size: Размер значения в байтах (для строк считается автоматически)
+        """
+        if size is None:
+            size = len(value.encode("utf-8"))
+
+        with self._lock:
+            self._remove(key)
+
+            # Значение больше всего кэша не кэшируем
+            if size > self.max_bytes or self.max_items <= 0:
+                return
+
+            self._data[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+
+            while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+
+    def invalidate(self, key: Hashable):
+        """
+        Удалить запись
+
+        Args:
+            key: Ключ записи
+        """
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """Удалить все записи"""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Статистика кэша
+
+        Returns:
+            Словарь с количеством записей, объёмом, попаданиями и промахами
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "items": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _remove(self, key: Hashable):
+        """Удалить запись без захвата блокировки"""
+        if key in self._data:
+            del self._data[key]
+            self._bytes -= self._sizes.pop(key)
@@ -0,0 +1,169 @@
+"""
+Структурированная карточка праздника: поля, разбор ответа модели и отрисовка
+
+Модель возвращает JSON-объект с полями карточки. В базе хранятся только
+поля, а текст сообщения Telegram собирается при отправке, поэтому
+оформление можно менять без повторной генерации.
+"""
+import json
+import re
+from typing import Dict, NamedTuple, Optional
+
+# Поля карточки в порядке вывода: (ключ JSON, эмодзи, подпись)
+CARD_LAYOUT = (
+    ("outfit", "👗", "Наряд"),
+    ("traditions", "🍽", "Традиции"),
+    ("movie", "🎬", "Фильм"),
+    ("music", "🎶", "Музыка"),
+    ("tip", "💡", "Совет"),
+)
+
+CARD_FIELDS = tuple(key for key, _, _ in CARD_LAYOUT)
+
+# Начало текста, который показывается вместо карточки при ошибке генерации
+GENERATION_ERROR_PREFIX = "Ошибка при генерации"
+
+# Начало строки поля в тексте карточки старого формата («👗 Наряд: ...»)
+_LEGACY_FIELD_RE = re.compile(
+    r"^\s*(?:" + "|".join(
+        f"(?P<{key}>{re.escape(emoji)}\\ufe0f?\\s*{label}\\s*:)" for key, emoji, label in CARD_LAYOUT
+    ) + r")",
+    re.MULTILINE,
+)
+
+# Строковое поле JSON, возможно ещё не закрытое (для частичного ответа)
+_PARTIAL_FIELD_RE = re.compile(r'"(\w+)"\s*:\s*"((?:[^"\\]|\\.)*)(")?', re.DOTALL)
+
+
+class CardFields(NamedTuple):
+    """Поля карточки (пустая строка — поле отсутствует)"""
+    outfit: str = ""
+    traditions: str = ""
+    movie: str = ""
+    music: str = ""
+    tip: str = ""
+
+    def missing(self) -> tuple:
+        """Названия незаполненных полей"""
+        return tuple(key for key in CARD_FIELDS if not getattr(self, key))
+
+    def is_complete(self) -> bool:
+        """Заполнены ли все поля"""
+        return not self.missing()
+
+    def size(self) -> int:
+        """Объём полей в байтах UTF-8"""
+        return sum(len(value.encode("utf-8")) for value in self)
+
+
+class CardParseError(ValueError):
+    """Ответ модели не удалось разобрать как карточку"""
+
+
+def _fields_from_dict(data: Dict) -> CardFields:
+    """Взять из словаря известные поля, приведя значения к строкам"""
+    return CardFields(**{
+        key: " ".join(str(data.get(key) or "").split())
+        for key in CARD_FIELDS
+    })
+
+
+def parse_card(text: str) -> CardFields:
+    """
+    Разобрать ответ модели (JSON-объект с полями карточки)
+
+    Args:
+        text: Текст ответа
+
+    Returns:
+        Поля карточки (отсутствующие поля пустые)
+
+    Raises:
+        CardParseError: Ответ не JSON-объект или в нём нет ни одного поля
+    """
+    # Некоторые модели оборачивают JSON в ```json ... ```
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):] if "{" in text else text
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise CardParseError(f"ответ модели не JSON: {e}") from e
+
+    if not isinstance(data, dict):
+        raise CardParseError("ответ модели не JSON-объект")
+
+    card = _fields_from_dict(data)
+    if len(card.missing()) == len(CARD_FIELDS):
+        raise CardParseError("в ответе модели нет полей карточки")
+
+    return card
+
+
+def parse_partial_card(text: str) -> CardFields:
+    """
+    Разобрать незаконченный JSON во время stream
+
+    Берутся все строковые поля, включая последнее ещё не закрытое.
+
+    Args:
+        text: Полученная на данный момент часть ответа
+
+    Returns:
+        Поля карточки, известные на данный момент
+    """
+    data = {}
+    for key, raw, _ in _PARTIAL_FIELD_RE.findall(text):
+        if key not in CARD_FIELDS:
+            continue
+        # Незаконченная escape-последовательность в конце фрагмента
+        raw = re.sub(r"\\(u[0-9a-fA-F]{0,3})?$", "", raw)
+        try:
+            data[key] = json.loads(f'"{raw}"')
+        except ValueError:
+            data[key] = raw
+    return _fields_from_dict(data)
+
+
+def card_from_text(text: str) -> Optional[CardFields]:
+    """
+    Разобрать карточку старого формата (свободный текст по шаблону)
+
+    Args:
+        text: Текст карточки с строками «👗 Наряд: ...» и т. д.
+
+    Returns:
+        Поля карточки или None, если ни одного поля не найдено
+    """
+    matches = list(_LEGACY_FIELD_RE.finditer(text))
+    if not matches:
+        return None
+
+    data = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        data[match.lastgroup] = text[match.end():end].strip()
+
+    return _fields_from_dict(data)
+
+
+def render_card(country: str, holiday_type: str, card: CardFields) -> str:
+    """
+    Собрать текст сообщения Telegram из полей карточки
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+        card: Поля карточки
+
+    Returns:
+        Текст карточки (незаполненные поля пропускаются)
+    """
+    lines = [f"🎉 Страна: {country}", f"Праздник: {holiday_type}", ""]
+    for key, emoji, label in CARD_LAYOUT:
+        value = getattr(card, key)
+        if value:
+            lines.append(f"{emoji} {label}: {value}")
+    return "\n".join(lines).strip()
@@ -12,6 +12,52 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN не найден в .env файле!")
 
+# Адрес Bot API (для локальной заглушки fake_telegram.py, например
+# http://127.0.0.1:8088/bot); по умолчанию — api.telegram.org
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL") or "https://api.telegram.org/bot"
+
+# Лимиты отправки сообщений: всего в секунду, в личный чат в секунду
+# (и сколько подряд без паузы), в группу в минуту; сколько раз повторять
+# запрос, если Telegram ответил RetryAfter
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_GROUP_PER_MINUTE = float(os.getenv("SEND_GROUP_PER_MINUTE", "20"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Ежедневная рассылка подписчикам (/subscribe): время и часовой пояс,
+# сезон (месяц-день начала и конца, может переходить через Новый год),
+# одновременных отправок и пауза перед повтором, если карточку дня
+# не удалось подготовить (секунды)
+BROADCAST_TIME = os.getenv("BROADCAST_TIME", "10:00")
+BROADCAST_TZ = os.getenv("BROADCAST_TZ", "Europe/Moscow")
+BROADCAST_SEASON = tuple(
+    tuple(int(part) for part in bound.split("-"))
+    for bound in os.getenv("BROADCAST_SEASON", "12-01..01-07").split("..")
+)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_RETRY_INTERVAL = float(os.getenv("BROADCAST_RETRY_INTERVAL", "600"))
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Настройки webhook-режима
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Регистрировать webhook в Telegram при старте (0 — для локальной проверки
+# и для всех экземпляров за одним reverse proxy, кроме одного)
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "1") == "1"
+
+if BOT_MODE == "webhook":
+    if not WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET не найден в .env файле (обязателен в режиме webhook)!")
+    if WEBHOOK_REGISTER and not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL не найден в .env файле (обязателен в режиме webhook)!")
+
 # OpenAI API Key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
@@ -20,46 +66,138 @@ if not OPENAI_API_KEY:
 # Модель OpenAI
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-# Unsplash API Access Key (опционально)
-UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY", "")
+# Запасные модели через запятую: если основная модель не прислала первый
+# токен за LLM_HEDGE_DELAY секунд (0 — не подстраховывать) или ответила
+# ошибкой, запрос дублируется следующей; побеждает первый готовый ответ
+OPENAI_HEDGE_MODELS = [m.strip() for m in os.getenv("OPENAI_HEDGE_MODELS", "").split(",") if m.strip()]
+LLM_MODEL_CHAIN = [OPENAI_MODEL] + [m for m in OPENAI_HEDGE_MODELS if m != OPENAI_MODEL]
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "4"))
 
-# Системный промпт для LLM
-SYSTEM_PROMPT = """Ты — культуролог и этнограф, эксперт по традициям празднования Рождества и Нового года в разных странах мира.
-Твоя задача — создавать яркие, детализированные и достоверные описания праздников, чтобы пользователь мог «окунуться» в атмосферу другой культуры.
+# Цены моделей для статистики стоимости: "модель=вход/выход[/кэш],..." в USD
+# за 1M токенов; третья цена — для закэшированных токенов промпта
+# (по умолчанию как вход)
+LLM_MODEL_PRICES = {
+    name.strip(): tuple(float(price) for price in prices.split("/"))
+    for name, prices in (
+        item.split("=", 1)
+        for item in os.getenv("LLM_MODEL_PRICES", "gpt-4o-mini=0.15/0.6/0.075").split(",")
+        if "=" in item
+    )
+}
+
+# Адрес OpenAI-совместимого API (опционально, например локальная заглушка fake_openai.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Максимальное число одновременных запросов к OpenAI
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# Таймаут одного запроса к OpenAI (секунды)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+# Максимальная длина ответа модели (токены). Карточка из пяти полей
+# занимает 300–450 токенов; обрезанный ответ сохраняется как неполная
+# карточка и обновляется в фоне
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "600"))
+
+# Лимиты аккаунта OpenAI: запросов и токенов в минуту (0 — без лимита)
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "200000"))
+
+# Повторы при ответах 429/5xx и базовая пауза экспоненциальной задержки (секунды)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "1"))
+
+# Выключатель OpenAI: после стольких неудачных генераций подряд запросы
+# не выполняются LLM_BREAKER_RESET секунд (вместо ожидания таймаутов)
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
 
-Отвечай строго по шаблону ниже.
-Будь конкретен: упоминай реальные традиции, блюда, наряды, цвета, звуки и украшения, характерные для страны.
-Не используй обобщения вроде "украсьте дом" или "весело проведите время".
-Пиши на русском языке, тёплым и описательным стилем.
+# Время жизни блокировки генерации (секунды). Пока блокировка жива,
+# другие процессы с той же базой ждут результат вместо повторной генерации
+GENERATION_LEASE_TTL = float(os.getenv("GENERATION_LEASE_TTL", "60"))
 
----
+# In-memory LRU-кэш карточек перед базой данных
+RESPONSE_CACHE_MAX_ITEMS = int(os.getenv("RESPONSE_CACHE_MAX_ITEMS", "256"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
 
-🎉 Пример отличного ответа (для ориентира):
+# Через сколько карточка считается устаревшей (секунды, 0 — без срока).
+# Устаревшая карточка выдаётся сразу и обновляется в фоне
+RESPONSE_TTL = int(os.getenv("RESPONSE_TTL", str(30 * 24 * 3600)))
 
-🎉 Страна: Финляндия
-Праздник: Рождество
+# Минимальный интервал между фоновыми обновлениями карточек (секунды)
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", "10"))
 
-👗 Наряд: Тёплые шерстяные свитера с оленями и орнаментами, валенки и красные шапки Санты. Женщины часто носят платья в традиционном финском стиле — с синими или белыми узорами.
-🍽 Традиции: Финны посещают сауну в канун Рождества — это символ очищения. Затем ужинают: запеканка из репы, ветчина, рисовая каша с миндалём — тому, кто найдёт орех, будет счастье. После ужина дети поют песни и ждут Йоулупукки (финского Санту).
-🎬 Фильм: "Joulutarina" — добрый финский фильм о происхождении Санта-Клауса.
-🎶 Музыка: "Sylvian Joululaulu" — классическая рождественская песня Финляндии.
-💡 Совет: Чтобы ощутить финское Рождество, зажгите свечи, приглушите свет и включите тихую рождественскую музыку. Поставьте на стол рисовую кашу с орешком — пусть принесёт удачу.
+# Максимальная длина очереди фоновых обновлений
+REFRESH_QUEUE_MAX = int(os.getenv("REFRESH_QUEUE_MAX", "200"))
 
----
+# Загружать все карточки из базы в память при старте
+RESPONSE_CACHE_WARM = os.getenv("RESPONSE_CACHE_WARM", "1") == "1"
 
-Формат строго такой:
-🎉 Страна: [название страны]
-Праздник: [Рождество / Новый год]
+# Сколько вариантов текста хранить на одну карточку (страна, праздник) и как
+# часто дозаполнять их в фоне, когда OpenAI простаивает (секунды)
+VARIANT_POOL_SIZE = int(os.getenv("VARIANT_POOL_SIZE", "3"))
+VARIANT_FILL_INTERVAL = float(os.getenv("VARIANT_FILL_INTERVAL", "30"))
+
+# Вес случайной страны без карточки в кэше относительно закэшированной
+# (при полной загрузке OpenAI он снижается до нуля) и сколько последних
+# стран пользователя не повторять
+COLD_PICK_WEIGHT = float(os.getenv("COLD_PICK_WEIGHT", "1"))
+RECENT_COUNTRIES = int(os.getenv("RECENT_COUNTRIES", "10"))
+
+# Как часто перечитывать из базы список готовых карточек (секунды): их
+# пишут и другие процессы — prewarm.py и другие экземпляры бота
+WARM_KEYS_REFRESH_INTERVAL = float(os.getenv("WARM_KEYS_REFRESH_INTERVAL", "300"))
+
+# Сколько стран не из справочника (/custom) можно запросить за
+# UNKNOWN_COUNTRY_WINDOW секунд: одному пользователю и всем вместе
+UNKNOWN_COUNTRY_USER_LIMIT = int(os.getenv("UNKNOWN_COUNTRY_USER_LIMIT", "3"))
+UNKNOWN_COUNTRY_GLOBAL_LIMIT = int(os.getenv("UNKNOWN_COUNTRY_GLOBAL_LIMIT", "30"))
+UNKNOWN_COUNTRY_WINDOW = float(os.getenv("UNKNOWN_COUNTRY_WINDOW", "3600"))
+
+# Показывать карточку по мере генерации (stream) и минимальный интервал
+# между правками статусного сообщения (секунды, лимиты Telegram)
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+
+# Повторное нажатие «Другая страна», пока карточка готовится:
+# ignore — ответить уведомлением, replace — отменить и показать новую страну
+ANOTHER_PRESS_MODE = os.getenv("ANOTHER_PRESS_MODE", "ignore")
+
+# Inline-режим (@bot Япония): результатов на страницу и сколько секунд
+# Telegram может кэшировать ответ на одинаковый запрос
+INLINE_PAGE_SIZE = int(os.getenv("INLINE_PAGE_SIZE", "10"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+
+# Unsplash API Access Key (опционально)
+UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY", "")
+
+# Таймаут запроса к Unsplash (секунды)
+UNSPLASH_TIMEOUT = float(os.getenv("UNSPLASH_TIMEOUT", "10"))
+
+# Выключатель Unsplash: число ошибок подряд и пауза до пробного запроса (секунды)
+UNSPLASH_BREAKER_THRESHOLD = int(os.getenv("UNSPLASH_BREAKER_THRESHOLD", "3"))
+UNSPLASH_BREAKER_RESET = float(os.getenv("UNSPLASH_BREAKER_RESET", "60"))
+
+# Сколько ждать изображения после отправки текста карточки (секунды).
+# Не успевшие изображения не отправляются
+IMAGE_DELIVERY_DEADLINE = float(os.getenv("IMAGE_DELIVERY_DEADLINE", "8"))
+
+# Сколько хранить найденные URL изображений (секунды, по умолчанию неделя)
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Сколько помнить пустой ответ или превышение лимита Unsplash (секунды)
+IMAGE_NEGATIVE_TTL = int(os.getenv("IMAGE_NEGATIVE_TTL", "3600"))
+
+# Системный промпт для LLM
+SYSTEM_PROMPT = """Ты — культуролог и этнограф, эксперт по традициям Рождества и Нового года в разных странах.
+Опиши, как празднуют в указанной стране, чтобы читатель мог «окунуться» в атмосферу другой культуры.
 
-👗 Наряд: [детальное описание традиционной одежды с цветами и элементами]
-🍽 Традиции: [конкретные обычаи, блюда, обряды — что делают, что едят, как украшают дом]
-🎬 Фильм: [1 фильм, связанный с этой культурой или атмосферой праздника]
-🎶 Музыка: [1 песня или мелодия, связанная с этой страной и праздником]
-💡 Совет: [конкретный совет, как воссоздать атмосферу дома — с деталями]
+Ответь только JSON-объектом с полями (все значения — строки на русском языке):
+- "outfit": традиционная праздничная одежда — цвета, ткани, элементы (2–3 предложения)
+- "traditions": конкретные обычаи, блюда и украшения дома (3–4 предложения)
+- "movie": 1 фильм, связанный с этой культурой или праздником, с пояснением в одну фразу
+- "music": 1 песня или мелодия этой страны к празднику, с пояснением в одну фразу
+- "tip": конкретный совет, как воссоздать атмосферу дома (2 предложения)
 
-Требования:
-- Ответ должен быть на русском языке.
-- Без длинных вступлений и заключений.
-- Используй эмодзи как в примере.
-- Будь конкретным и детальным.
-- Пиши тёплым и описательным стилем."""
+Пиши тёплым описательным стилем, упоминай реальные традиции, блюда и названия.
+Без обобщений вроде "украсьте дом", без эмодзи и текста вне JSON."""
@@ -1,5 +1,6 @@
 """
 Список стран для генерации праздничных традиций
+и справочные данные для распознавания их названий
 """
 
 COUNTRIES = [
@@ -76,3 +77,64 @@ HOLIDAY_TYPES = {
     "christmas": "Рождество",
     "newyear": "Новый год",
 }
+
+
+# Английские названия, ISO-коды (ISO 3166-1 alpha-2, для частей страны —
+# ISO 3166-2), дополнительные названия, по которым распознаётся ввод
+# пользователя, и подсказки для поиска изображений (на английском)
+COUNTRY_DETAILS = {
+    "Финляндия": {"iso": "FI", "en": "Finland", "aliases": ["Суоми", "Suomi"], "hint": "Lapland snow"},
+    "Швеция": {"iso": "SE", "en": "Sweden", "aliases": [], "hint": "Lucia candles"},
+    "Норвегия": {"iso": "NO", "en": "Norway", "aliases": [], "hint": "fjord snow lights"},
+    "Дания": {"iso": "DK", "en": "Denmark", "aliases": [], "hint": "hygge candles"},
+    "Исландия": {"iso": "IS", "en": "Iceland", "aliases": [], "hint": "Reykjavik lights"},
+    "Германия": {"iso": "DE", "en": "Germany", "aliases": ["ФРГ", "Deutschland"], "hint": "Christmas market"},
+    "Франция": {"iso": "FR", "en": "France", "aliases": [], "hint": "Paris lights"},
+    "Италия": {"iso": "IT", "en": "Italy", "aliases": ["Italia"], "hint": "nativity scene"},
+    "Испания": {"iso": "ES", "en": "Spain", "aliases": ["España"], "hint": "Madrid lights"},
+    "Португалия": {"iso": "PT", "en": "Portugal", "aliases": [], "hint": "Lisbon lights"},
+    "Греция": {"iso": "GR", "en": "Greece", "aliases": ["Эллада"], "hint": "Athens lights"},
+    "Польша": {"iso": "PL", "en": "Poland", "aliases": ["Polska"], "hint": "Krakow market"},
+    "Чехия": {"iso": "CZ", "en": "Czechia", "aliases": ["Чешская Республика", "Czech Republic"], "hint": "Prague market"},
+    "Австрия": {"iso": "AT", "en": "Austria", "aliases": [], "hint": "Vienna market"},
+    "Швейцария": {"iso": "CH", "en": "Switzerland", "aliases": [], "hint": "Alps snow village"},
+    "Нидерланды": {"iso": "NL", "en": "Netherlands", "aliases": ["Голландия", "Holland"], "hint": "Amsterdam canal lights"},
+    "Бельгия": {"iso": "BE", "en": "Belgium", "aliases": [], "hint": "Brussels Grand Place"},
+    "Великобритания": {"iso": "GB", "en": "United Kingdom", "aliases": ["Британия", "Соединённое Королевство", "UK", "Great Britain", "Britain"], "hint": "London lights"},
+    "Ирландия": {"iso": "IE", "en": "Ireland", "aliases": [], "hint": "Dublin lights"},
+    "Шотландия": {"iso": "GB-SCT", "en": "Scotland", "aliases": [], "hint": "Hogmanay Edinburgh"},
+    "Япония": {"iso": "JP", "en": "Japan", "aliases": ["Nippon"], "hint": "Tokyo illumination"},
+    "Китай": {"iso": "CN", "en": "China", "aliases": ["КНР"], "hint": "red lanterns"},
+    "Южная Корея": {"iso": "KR", "en": "South Korea", "aliases": ["Корея", "Республика Корея", "Korea"], "hint": "Seoul lights"},
+    "Таиланд": {"iso": "TH", "en": "Thailand", "aliases": ["Тайланд"], "hint": "Bangkok lights"},
+    "Вьетнам": {"iso": "VN", "en": "Vietnam", "aliases": ["Viet Nam"], "hint": "Hanoi lanterns"},
+    "Индия": {"iso": "IN", "en": "India", "aliases": [], "hint": "Goa lights"},
+    "Индонезия": {"iso": "ID", "en": "Indonesia", "aliases": [], "hint": "Bali festive"},
+    "Филиппины": {"iso": "PH", "en": "Philippines", "aliases": [], "hint": "parol lanterns"},
+    "Сингапур": {"iso": "SG", "en": "Singapore", "aliases": [], "hint": "Orchard Road lights"},
+    "США": {"iso": "US", "en": "United States", "aliases": ["Соединённые Штаты", "Америка", "USA", "America"], "hint": "New York lights"},
+    "Канада": {"iso": "CA", "en": "Canada", "aliases": [], "hint": "snow cabin lights"},
+    "Мексика": {"iso": "MX", "en": "Mexico", "aliases": [], "hint": "posadas pinatas"},
+    "Бразилия": {"iso": "BR", "en": "Brazil", "aliases": ["Brasil"], "hint": "Rio fireworks"},
+    "Аргентина": {"iso": "AR", "en": "Argentina", "aliases": [], "hint": "Buenos Aires summer"},
+    "Чили": {"iso": "CL", "en": "Chile", "aliases": [], "hint": "Santiago lights"},
+    "Перу": {"iso": "PE", "en": "Peru", "aliases": [], "hint": "Cusco festive"},
+    "Колумбия": {"iso": "CO", "en": "Colombia", "aliases": [], "hint": "Medellin lights"},
+    "Египет": {"iso": "EG", "en": "Egypt", "aliases": [], "hint": "Cairo lights"},
+    "Марокко": {"iso": "MA", "en": "Morocco", "aliases": [], "hint": "Marrakech lanterns"},
+    "ЮАР": {"iso": "ZA", "en": "South Africa", "aliases": ["Южно-Африканская Республика", "Южная Африка"], "hint": "Cape Town summer"},
+    "Кения": {"iso": "KE", "en": "Kenya", "aliases": [], "hint": "Nairobi festive"},
+    "Эфиопия": {"iso": "ET", "en": "Ethiopia", "aliases": [], "hint": "Genna Lalibela"},
+    "Нигерия": {"iso": "NG", "en": "Nigeria", "aliases": [], "hint": "Lagos festive"},
+    "Танзания": {"iso": "TZ", "en": "Tanzania", "aliases": [], "hint": "Zanzibar beach"},
+    "Австралия": {"iso": "AU", "en": "Australia", "aliases": [], "hint": "Sydney fireworks"},
+    "Новая Зеландия": {"iso": "NZ", "en": "New Zealand", "aliases": [], "hint": "pohutukawa summer"},
+    "Турция": {"iso": "TR", "en": "Turkey", "aliases": ["Türkiye"], "hint": "Istanbul lights"},
+    "Израиль": {"iso": "IL", "en": "Israel", "aliases": [], "hint": "Jerusalem lights"},
+    "ОАЭ": {"iso": "AE", "en": "United Arab Emirates", "aliases": ["Объединённые Арабские Эмираты", "Эмираты", "UAE"], "hint": "Dubai fireworks"},
+    "Грузия": {"iso": "GE", "en": "Georgia", "aliases": ["Сакартвело"], "hint": "Tbilisi lights"},
+    "Армения": {"iso": "AM", "en": "Armenia", "aliases": [], "hint": "Yerevan lights"},
+    "Беларусь": {"iso": "BY", "en": "Belarus", "aliases": ["Белоруссия"], "hint": "Minsk lights"},
+    "Казахстан": {"iso": "KZ", "en": "Kazakhstan", "aliases": [], "hint": "Almaty snow"},
+    "Узбекистан": {"iso": "UZ", "en": "Uzbekistan", "aliases": [], "hint": "Tashkent lights"},
+}
@@ -1,42 +1,331 @@
 """
 Модуль для работы с базой данных (кэширование ответов)
 """
+import json
+import logging
 import sqlite3
+import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import AsyncIterator, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from cache import LRUCache
+from cards import CARD_FIELDS, GENERATION_ERROR_PREFIX, CardFields, card_from_text, render_card
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Размер области memory-mapped I/O для чтения базы (байты)
+MMAP_SIZE = 64 * 1024 * 1024
+
+# Сколько ждать снятия блокировки другим процессом (миллисекунды)
+BUSY_TIMEOUT_MS = 5000
+
+# Таблица карточек: несколько вариантов на (страна, праздник).
+# Поля карточки хранятся отдельными колонками; response_text заполнен
+# только у старых карточек, которые не удалось разобрать на поля
+HOLIDAY_RESPONSES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country TEXT NOT NULL,
+        holiday_type TEXT NOT NULL,
+        variant INTEGER NOT NULL DEFAULT 0,
+        response_text TEXT NOT NULL DEFAULT '',
+        outfit TEXT,
+        traditions TEXT,
+        movie TEXT,
+        music TEXT,
+        tip TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        prompt_version TEXT,
+        UNIQUE(country, holiday_type, variant)
+    )
+"""
+
+# Колонки holiday_responses, из которых собирается CardEntry
+CARD_ENTRY_COLUMNS = (
+    "id, variant, response_text, CAST(strftime('%s', created_at) AS REAL), prompt_version, "
+    + ", ".join(CARD_FIELDS)
+)
+
+# Условие «карточка заполнена не полностью» для SQL
+INCOMPLETE_CARD_SQL = " OR ".join(f"COALESCE({field}, '') = ''" for field in CARD_FIELDS)
+
+
+class CardEntry(NamedTuple):
+    """Закэшированная карточка (один вариант)"""
+    id: int
+    variant: int
+    text: str
+    created_at: float
+    prompt_version: Optional[str]
+    card: Optional[CardFields] = None
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "CardEntry":
+        """Собрать запись из строки с колонками CARD_ENTRY_COLUMNS"""
+        base, fields = row[:5], row[5:]
+        card = CardFields(*(value or "" for value in fields)) if any(fields) else None
+        return cls(*base, card)
+
+    def render(self, country: str, holiday_type: str) -> str:
+        """
+        Текст карточки для отправки
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            Текст, собранный из полей (или сохранённый текст старой карточки)
+        """
+        if self.card is not None:
+            return render_card(country, holiday_type, self.card)
+        return self.text
+
+    def is_complete(self) -> bool:
+        """Заполнены ли все поля карточки"""
+        return self.card is not None and self.card.is_complete()
+
+    def size(self) -> int:
+        """Объём карточки в байтах UTF-8 (для лимита LRU)"""
+        return len(self.text.encode("utf-8")) + (self.card.size() if self.card else 0)
+
+    def is_fresh(self, prompt_version: str, ttl: float) -> bool:
+        """
+        Актуальна ли карточка
+
+        Args:
+            prompt_version: Текущая версия промпта и модели
+            ttl: Срок жизни карточки в секундах (0 — бессрочно)
+
+        Returns:
+            False, если карточка создана другой версией промпта или старше ttl
+        """
+        if self.prompt_version != prompt_version:
+            return False
+
+        return not ttl or time.time() - self.created_at < ttl
 
 
 class Database:
     """Класс для работы с SQLite базой данных"""
 
-    def __init__(self, db_path: str = "holiday_bot.db"):
+    def __init__(
+        self,
+        db_path: str = "holiday_bot.db",
+        cache_max_items: int = 256,
+        cache_max_bytes: int = 4 * 1024 * 1024,
+    ):
         """
         Инициализация базы данных
 
+        Открывает одно долгоживущее соединение в режиме WAL:
+        читатели не блокируются писателями, а схема и pragma
+        настраиваются один раз, а не на каждый запрос.
+        Перед таблицей holiday_responses стоит in-memory LRU-кэш.
+
         Args:
             db_path: Путь к файлу базы данных
+            cache_max_items: Максимум карточек в памяти
+            cache_max_bytes: Максимальный объём карточек в памяти (байты)
         """
         self.db_path = db_path
+        self.response_cache = LRUCache(cache_max_items, cache_max_bytes)
+        self._lock = threading.RLock()
+        self.conn = self._connect()
         self.init_db()
 
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие соединения и настройка pragma"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    @contextmanager
+    def _cursor(self) -> Iterator[sqlite3.Cursor]:
+        """Курсор общего соединения; изменения фиксируются при выходе из блока"""
+        with self._lock:
+            cursor = self.conn.cursor()
+            try:
+                yield cursor
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def close(self):
+        """Закрыть соединение с базой"""
+        with self._lock:
+            self.conn.close()
+
     def init_db(self):
         """Создание таблиц, если их нет"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            cursor.execute(HOLIDAY_RESPONSES_SCHEMA.format(table="holiday_responses"))
 
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS holiday_responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                country TEXT NOT NULL,
-                holiday_type TEXT NOT NULL,
-                response_text TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(country, holiday_type)
+            # Базы, созданные до появления версий промпта, вариантов и полей карточки
+            self._add_column_if_missing(cursor, "holiday_responses", "prompt_version", "TEXT")
+            self._migrate_to_variants(cursor)
+            for field in CARD_FIELDS:
+                self._add_column_if_missing(cursor, "holiday_responses", field, "TEXT")
+            self._migrate_text_to_fields(cursor)
+
+            # Блокировки генерации, общие для всех процессов с этой базой
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS generation_leases (
+                    country TEXT NOT NULL,
+                    holiday_type TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (country, holiday_type)
+                )
+            """)
+
+            # Кэш результатов поиска изображений (пустой список — негативный кэш)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS image_cache (
+                    query TEXT PRIMARY KEY,
+                    image_urls TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+            # Расход токенов по каждому запросу к модели
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    country TEXT NOT NULL,
+                    holiday_type TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT,
+                    prompt_tokens INTEGER NOT NULL,
+                    cached_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL,
+                    first_token_ms REAL,
+                    latency_ms REAL,
+                    outcome TEXT NOT NULL
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage (created_at)"
             )
+
+            # Подписчики ежедневной рассылки
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS subscribers (
+                    chat_id INTEGER PRIMARY KEY,
+                    subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Рассылки по дням: выбранная карточка, готовый текст и итоги
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    day TEXT PRIMARY KEY,
+                    country TEXT NOT NULL,
+                    holiday_type TEXT NOT NULL,
+                    text TEXT,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+            # Кому рассылка дня уже отправлена (точка возобновления после перезапуска)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                    day TEXT NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    delivered_at REAL NOT NULL,
+                    PRIMARY KEY (day, chat_id)
+                )
+            """)
+
+            # file_id фотографий, уже загруженных в Telegram
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS photo_file_ids (
+                    country TEXT NOT NULL,
+                    holiday_type TEXT NOT NULL,
+                    file_ids TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (country, holiday_type)
+                )
+            """)
+
+    @staticmethod
+    def _has_column(cursor: sqlite3.Cursor, table: str, column: str) -> bool:
+        """Есть ли колонка в таблице"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        return column in {row[1] for row in cursor.fetchall()}
+
+    def _add_column_if_missing(self, cursor: sqlite3.Cursor, table: str, column: str, declaration: str):
+        """Добавить колонку в существующую таблицу, если её ещё нет"""
+        if not self._has_column(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _migrate_to_variants(self, cursor: sqlite3.Cursor):
+        """
+        Перестроить holiday_responses с UNIQUE(country, holiday_type)
+        в таблицу с несколькими вариантами на ключ
+
+        SQLite не умеет удалять ограничение UNIQUE, поэтому таблица
+        пересоздаётся; существующие ответы становятся вариантом 0.
+        """
+        if self._has_column(cursor, "holiday_responses", "variant"):
+            return
+
+        cursor.execute(HOLIDAY_RESPONSES_SCHEMA.format(table="holiday_responses_new"))
+        cursor.execute("""
+            INSERT INTO holiday_responses_new
+                (id, country, holiday_type, variant, response_text, created_at, prompt_version)
+            SELECT id, country, holiday_type, 0, response_text, created_at, prompt_version
+            FROM holiday_responses
         """)
+        cursor.execute("DROP TABLE holiday_responses")
+        cursor.execute("ALTER TABLE holiday_responses_new RENAME TO holiday_responses")
+
+    @staticmethod
+    def _migrate_text_to_fields(cursor: sqlite3.Cursor):
+        """
+        Разобрать карточки, сохранённые целым текстом, на поля
 
-        conn.commit()
-        conn.close()
+        Старые версии кэшировали и сообщения об ошибке генерации — такие
+        записи удаляются, чтобы их не показывали как устаревшие карточки.
+        """
+        cursor.execute(
+            "DELETE FROM holiday_responses WHERE substr(response_text, 1, ?) = ?",
+            (len(GENERATION_ERROR_PREFIX), GENERATION_ERROR_PREFIX)
+        )
+        cursor.execute(
+            "SELECT id, response_text FROM holiday_responses WHERE response_text != ''"
+        )
+        updates = []
+        for row_id, text in cursor.fetchall():
+            card = card_from_text(text)
+            if card is not None:
+                updates.append((*card, row_id))
+
+        cursor.executemany(
+            f"""
+            UPDATE holiday_responses
+            SET {", ".join(f"{field} = ?" for field in CARD_FIELDS)}, response_text = ''
+            WHERE id = ?
+            """,
+            updates
+        )
 
     def get_response(self, country: str, holiday_type: str) -> Optional[str]:
         """
@@ -47,43 +336,669 @@ class Database:
             holiday_type: Тип праздника
 
         Returns:
-            Текст ответа или None если не найден
+            Текст карточки или None если не найден
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        entry = self.get_entry(country, holiday_type)
+        return entry.render(country, holiday_type) if entry else None
 
-        cursor.execute(
-            "SELECT response_text FROM holiday_responses WHERE country = ? AND holiday_type = ?",
-            (country, holiday_type)
-        )
+    def get_entry(self, country: str, holiday_type: str) -> Optional["CardEntry"]:
+        """
+        Получить основной вариант карточки (с наименьшим номером)
 
-        result = cursor.fetchone()
-        conn.close()
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
 
-        return result[0] if result else None
+        Returns:
+            Запись кэша или None если не найдена
+        """
+        variants = self.get_variants(country, holiday_type)
+        return variants[0] if variants else None
 
-    def save_response(self, country: str, holiday_type: str, response_text: str):
+    def get_variants(self, country: str, holiday_type: str) -> List["CardEntry"]:
         """
-        Сохранить ответ в кэш
+        Получить все варианты карточки
 
         Args:
             country: Название страны
             holiday_type: Тип праздника
-            response_text: Текст ответа
+
+        Returns:
+            Список вариантов по возрастанию номера (пустой, если карточки нет)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cached = self.response_cache.get((country, holiday_type))
+        if cached is not None:
+            return cached
 
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO holiday_responses (country, holiday_type, response_text)
-            VALUES (?, ?, ?)
-            """,
-            (country, holiday_type, response_text)
-        )
+        return self.load_variants(country, holiday_type)
+
+    def load_variants(self, country: str, holiday_type: str) -> List["CardEntry"]:
+        """
+        Прочитать варианты карточки из базы (минуя LRU) и поместить их в LRU
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            Список вариантов по возрастанию номера
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT {CARD_ENTRY_COLUMNS} FROM holiday_responses
+                WHERE country = ? AND holiday_type = ?
+                ORDER BY variant
+                """,
+                (country, holiday_type)
+            )
+
+            variants = [CardEntry.from_row(row) for row in cursor.fetchall()]
+
+        if variants:
+            self._cache_variants(country, holiday_type, variants)
+
+        return variants
+
+    def load_entry(self, country: str, holiday_type: str) -> Optional["CardEntry"]:
+        """
+        Прочитать основной вариант карточки из базы, минуя LRU
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            Запись кэша или None если не найдена
+        """
+        variants = self.load_variants(country, holiday_type)
+        return variants[0] if variants else None
+
+    def warm_response_cache(self) -> int:
+        """
+        Загрузить все сохранённые ответы в LRU одним запросом
+
+        Returns:
+            Количество загруженных вариантов
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT country, holiday_type, {CARD_ENTRY_COLUMNS} FROM holiday_responses
+                ORDER BY country, holiday_type, variant
+                """
+            )
+            rows = cursor.fetchall()
+
+        grouped = {}
+        for country, holiday_type, *entry in rows:
+            grouped.setdefault((country, holiday_type), []).append(CardEntry.from_row(entry))
+
+        for (country, holiday_type), variants in grouped.items():
+            self._cache_variants(country, holiday_type, variants)
+
+        return len(rows)
+
+    def save_response(
+        self,
+        country: str,
+        holiday_type: str,
+        card: CardFields,
+        prompt_version: Optional[str] = None,
+        variant: int = 0,
+    ) -> int:
+        """
+        Сохранить карточку в кэш
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            card: Поля карточки
+            prompt_version: Версия промпта и модели, которыми создана карточка
+            variant: Номер варианта, который нужно заменить
+
+        Returns:
+            id сохранённой записи
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT OR REPLACE INTO holiday_responses
+                    (country, holiday_type, variant, prompt_version, {", ".join(CARD_FIELDS)})
+                VALUES (?, ?, ?, ?, {", ".join("?" * len(CARD_FIELDS))})
+                """,
+                (country, holiday_type, variant, prompt_version, *card)
+            )
+            row_id = cursor.lastrowid
+
+        self.response_cache.invalidate((country, holiday_type))
+        return row_id
+
+    def add_variant(
+        self,
+        country: str,
+        holiday_type: str,
+        card: CardFields,
+        prompt_version: Optional[str] = None,
+    ) -> int:
+        """
+        Добавить ещё один вариант карточки со следующим свободным номером
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            card: Поля карточки
+            prompt_version: Версия промпта и модели, которыми создана карточка
+
+        Returns:
+            id сохранённой записи
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO holiday_responses
+                    (country, holiday_type, variant, prompt_version, {", ".join(CARD_FIELDS)})
+                SELECT ?, ?, COALESCE(MAX(variant), -1) + 1, ?, {", ".join("?" * len(CARD_FIELDS))}
+                FROM holiday_responses WHERE country = ? AND holiday_type = ?
+                """,
+                (country, holiday_type, prompt_version, *card, country, holiday_type)
+            )
+            row_id = cursor.lastrowid
+
+        self.response_cache.invalidate((country, holiday_type))
+        return row_id
+
+    def save_responses(
+        self,
+        rows: Iterable[Tuple[str, str, CardFields]],
+        prompt_version: Optional[str] = None,
+    ) -> int:
+        """
+        Сохранить несколько карточек (вариант 0) одной транзакцией
+
+        Args:
+            rows: Кортежи (страна, праздник, поля карточки)
+            prompt_version: Версия промпта и модели, которыми созданы карточки
+
+        Returns:
+            Количество сохранённых карточек
+        """
+        rows = list(rows)
+
+        with self._cursor() as cursor:
+            cursor.executemany(
+                f"""
+                INSERT OR REPLACE INTO holiday_responses
+                    (country, holiday_type, variant, prompt_version, {", ".join(CARD_FIELDS)})
+                VALUES (?, ?, 0, ?, {", ".join("?" * len(CARD_FIELDS))})
+                """,
+                [(country, holiday_type, prompt_version, *card) for country, holiday_type, card in rows]
+            )
+
+        for country, holiday_type, _ in rows:
+            self.response_cache.invalidate((country, holiday_type))
+
+        return len(rows)
+
+    def get_stale_keys(self, prompt_version: str, ttl: float) -> Set[Tuple[str, str]]:
+        """
+        Получить пары (страна, праздник), основной вариант которых устарел
+
+        Устаревшим считается и вариант с незаполненными полями карточки.
+
+        Args:
+            prompt_version: Текущая версия промпта и модели
+            ttl: Срок жизни карточки в секундах (0 — бессрочно)
+
+        Returns:
+            Множество кортежей (страна, праздник)
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT country, holiday_type FROM holiday_responses
+                WHERE variant = 0 AND (
+                    prompt_version IS NOT ?
+                    OR (? > 0 AND strftime('%s', 'now') - strftime('%s', created_at) >= ?)
+                    OR {INCOMPLETE_CARD_SQL}
+                )
+                """,
+                (prompt_version, ttl, ttl)
+            )
+            return set(cursor.fetchall())
+
+    def get_underfilled_keys(
+        self,
+        pool_size: int,
+        prompt_version: str,
+        limit: int = 1,
+    ) -> List[Tuple[str, str]]:
+        """
+        Получить случайные актуальные карточки, у которых меньше pool_size вариантов
+
+        Args:
+            pool_size: Желаемое число вариантов
+            prompt_version: Текущая версия промпта (устаревшие карточки пропускаются)
+            limit: Максимальное количество ключей
+
+        Returns:
+            Список кортежей (страна, праздник)
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT country, holiday_type FROM holiday_responses
+                GROUP BY country, holiday_type
+                HAVING COUNT(*) < ? AND SUM(variant = 0 AND prompt_version IS ?) > 0
+                ORDER BY RANDOM()
+                LIMIT ?
+                """,
+                (pool_size, prompt_version, limit)
+            )
+            return cursor.fetchall()
+
+    def _cache_variants(self, country: str, holiday_type: str, variants: List["CardEntry"]):
+        """Положить варианты карточки в LRU (размер считается по текстам)"""
+        size = sum(entry.size() for entry in variants)
+        self.response_cache.put((country, holiday_type), variants, size=size)
+
+    def get_cached_keys(self) -> Set[Tuple[str, str]]:
+        """
+        Получить все пары (страна, праздник), для которых есть ответ
+
+        Returns:
+            Множество кортежей (страна, праздник)
+        """
+        with self._cursor() as cursor:
+            cursor.execute("SELECT DISTINCT country, holiday_type FROM holiday_responses")
+            return set(cursor.fetchall())
+
+    def acquire_lease(self, country: str, holiday_type: str, owner: str, ttl: float) -> bool:
+        """
+        Захватить блокировку генерации для (страна, праздник)
+
+        Блокировка захватывается, если её нет или срок предыдущей истёк.
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            owner: Идентификатор процесса-владельца
+            ttl: Время жизни блокировки в секундах
+
+        Returns:
+            True, если блокировка получена
+        """
+        now = time.time()
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO generation_leases (country, holiday_type, owner, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(country, holiday_type) DO UPDATE
+                    SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE generation_leases.expires_at < ?
+                """,
+                (country, holiday_type, owner, now + ttl, now)
+            )
+            acquired = cursor.rowcount == 1
+
+        return acquired
+
+    def renew_lease(self, country: str, holiday_type: str, owner: str, ttl: float) -> bool:
+        """
+        Продлить свою блокировку генерации (или захватить заново, если она истекла
+        и никто её не взял)
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            owner: Идентификатор процесса-владельца
+            ttl: Новое время жизни блокировки в секундах
+
+        Returns:
+            True, если блокировка принадлежит owner; False — её захватил другой процесс
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE generation_leases SET expires_at = ?
+                WHERE country = ? AND holiday_type = ? AND owner = ?
+                """,
+                (time.time() + ttl, country, holiday_type, owner)
+            )
+            if cursor.rowcount == 1:
+                return True
+
+        return self.acquire_lease(country, holiday_type, owner, ttl)
+
+    def release_lease(self, country: str, holiday_type: str, owner: str):
+        """
+        Освободить блокировку генерации
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            owner: Идентификатор процесса-владельца
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM generation_leases WHERE country = ? AND holiday_type = ? AND owner = ?",
+                (country, holiday_type, owner)
+            )
+
+    def get_image_urls(self, query: str) -> Optional[List[str]]:
+        """
+        Получить URL изображений из кэша
+
+        Args:
+            query: Поисковый запрос
+
+        Returns:
+            Список URL (может быть пустым для негативного кэша)
+            или None, если записи нет или она устарела
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT image_urls FROM image_cache WHERE query = ? AND expires_at > ?",
+                (query, time.time())
+            )
+
+            result = cursor.fetchone()
+
+        return json.loads(result[0]) if result else None
+
+    def save_image_urls(self, query: str, image_urls: List[str], ttl: float):
+        """
+        Сохранить URL изображений в кэш
+
+        Args:
+            query: Поисковый запрос
+            image_urls: Список URL (пустой список кэширует отсутствие результата)
+            ttl: Время жизни записи в секундах
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO image_cache (query, image_urls, expires_at)
+                VALUES (?, ?, ?)
+                """,
+                (query, json.dumps(image_urls), time.time() + ttl)
+            )
+
+    def get_photo_file_ids(self, country: str, holiday_type: str) -> List[str]:
+        """
+        Получить file_id фотографий, отправленных ранее для карточки
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            Список file_id (пустой, если фотографии ещё не отправлялись)
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT file_ids FROM photo_file_ids WHERE country = ? AND holiday_type = ?",
+                (country, holiday_type)
+            )
+
+            result = cursor.fetchone()
+
+        return json.loads(result[0]) if result else []
+
+    def save_photo_file_ids(self, country: str, holiday_type: str, file_ids: List[str]):
+        """
+        Сохранить file_id отправленных фотографий
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            file_ids: Список file_id
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO photo_file_ids (country, holiday_type, file_ids)
+                VALUES (?, ?, ?)
+                """,
+                (country, holiday_type, json.dumps(file_ids))
+            )
+
+    def delete_photo_file_ids(self, country: str, holiday_type: str):
+        """
+        Удалить сохранённые file_id (например, если Telegram их больше не принимает)
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM photo_file_ids WHERE country = ? AND holiday_type = ?",
+                (country, holiday_type)
+            )
+
+    def save_llm_usage(
+        self,
+        country: str,
+        holiday_type: str,
+        records: Iterable[tuple],
+        prompt_version: Optional[str] = None,
+    ) -> int:
+        """
+        Сохранить расход токенов запросов к модели
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            records: Записи llm.UsageRecord (модель, токены промпта, из них
+                закэшированных, токены ответа, первый токен (мс), весь ответ (мс), исход)
+            prompt_version: Версия промпта
+
+        Returns:
+            Количество сохранённых записей
+        """
+        now = time.time()
+        rows = [(now, country, holiday_type, prompt_version, *record) for record in records]
+
+        with self._cursor() as cursor:
+            cursor.executemany(
+                """
+                INSERT INTO llm_usage
+                    (created_at, country, holiday_type, prompt_version, model, prompt_tokens,
+                     cached_tokens, completion_tokens, first_token_ms, latency_ms, outcome)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+
+        return len(rows)
+
+    def get_llm_usage_summary(self, since: float) -> List[dict]:
+        """
+        Суммарный расход токенов по моделям
+
+        Args:
+            since: Учитывать запросы начиная с этого момента (unix time)
+
+        Returns:
+            Для каждой модели: запросы, токены промпта (и из кэша), токены
+            ответа и среднее время до первого токена (мс)
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT model, COUNT(*), SUM(prompt_tokens), SUM(cached_tokens),
+                       SUM(completion_tokens), AVG(first_token_ms)
+                FROM llm_usage WHERE created_at >= ?
+                GROUP BY model ORDER BY model
+                """,
+                (since,)
+            )
+            rows = cursor.fetchall()
+
+        return [
+            {
+                "model": model,
+                "calls": calls,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "completion_tokens": completion_tokens,
+                "first_token_ms": first_token_ms,
+            }
+            for model, calls, prompt_tokens, cached_tokens, completion_tokens, first_token_ms in rows
+        ]
+
+    def add_subscriber(self, chat_id: int) -> bool:
+        """
+        Подписать чат на ежедневную рассылку
+
+        Args:
+            chat_id: Чат
+
+        Returns:
+            True, если чат не был подписан
+        """
+        with self._cursor() as cursor:
+            cursor.execute("INSERT OR IGNORE INTO subscribers (chat_id) VALUES (?)", (chat_id,))
+            return cursor.rowcount > 0
+
+    def remove_subscriber(self, chat_id: int) -> bool:
+        """
+        Отписать чат от рассылки
+
+        Args:
+            chat_id: Чат
+
+        Returns:
+            True, если чат был подписан
+        """
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+            return cursor.rowcount > 0
+
+    def get_subscriber_count(self) -> int:
+        """Количество подписчиков"""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM subscribers")
+            return cursor.fetchone()[0]
+
+    def get_broadcast(self, day: str) -> Optional[dict]:
+        """
+        Рассылка за день
+
+        Args:
+            day: Дата в формате YYYY-MM-DD
+
+        Returns:
+            Словарь с полями таблицы broadcasts или None, если рассылки не было
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT day, country, holiday_type, text, started_at, finished_at, sent, failed
+                FROM broadcasts WHERE day = ?
+                """,
+                (day,)
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        keys = ("day", "country", "holiday_type", "text", "started_at", "finished_at", "sent", "failed")
+        return dict(zip(keys, row))
+
+    def start_broadcast(self, day: str, country: str, holiday_type: str) -> dict:
+        """
+        Начать рассылку дня (или вернуть уже начатую)
+
+        Страна выбирается один раз: при перезапуске рассылка продолжается
+        с той же карточкой.
+
+        Args:
+            day: Дата в формате YYYY-MM-DD
+            country: Страна карточки дня
+            holiday_type: Праздник карточки дня
+
+        Returns:
+            Рассылка (см. get_broadcast)
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO broadcasts (day, country, holiday_type, started_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (day, country, holiday_type, time.time())
+            )
+        return self.get_broadcast(day)
+
+    def set_broadcast_text(self, day: str, text: str):
+        """Сохранить готовый текст карточки дня"""
+        with self._cursor() as cursor:
+            cursor.execute("UPDATE broadcasts SET text = ? WHERE day = ?", (text, day))
+
+    def finish_broadcast(self, day: str):
+        """Отметить рассылку завершённой и посчитать итоги"""
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE broadcasts SET
+                    finished_at = ?,
+                    sent = (SELECT COUNT(*) FROM broadcast_deliveries
+                            WHERE day = broadcasts.day AND status = 'sent'),
+                    failed = (SELECT COUNT(*) FROM broadcast_deliveries
+                              WHERE day = broadcasts.day AND status != 'sent')
+                WHERE day = ?
+                """,
+                (time.time(), day)
+            )
+
+    def get_broadcast_countries(self) -> Set[str]:
+        """Страны, которые уже были в рассылках"""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT DISTINCT country FROM broadcasts")
+            return {row[0] for row in cursor.fetchall()}
+
+    def get_pending_recipients(self, day: str) -> List[int]:
+        """
+        Подписчики, которым рассылка дня ещё не отправлялась
+
+        Args:
+            day: Дата в формате YYYY-MM-DD
+
+        Returns:
+            Список chat_id
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT chat_id FROM subscribers
+                WHERE chat_id NOT IN (SELECT chat_id FROM broadcast_deliveries WHERE day = ?)
+                ORDER BY chat_id
+                """,
+                (day,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def record_delivery(self, day: str, chat_id: int, status: str):
+        """
+        Отметить отправку рассылки подписчику
 
-        conn.commit()
-        conn.close()
+        Args:
+            day: Дата в формате YYYY-MM-DD
+            chat_id: Чат
+            status: sent, failed или blocked
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO broadcast_deliveries (day, chat_id, status, delivered_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (day, chat_id, status, time.time())
+            )
 
     def get_stats(self) -> Tuple[int, int]:
         """
@@ -92,28 +1007,147 @@ class Database:
         Returns:
             Кортеж (количество стран, количество записей)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            cursor.execute("SELECT COUNT(DISTINCT country) FROM holiday_responses")
+            countries_count = cursor.fetchone()[0]
 
-        cursor.execute("SELECT COUNT(DISTINCT country) FROM holiday_responses")
-        countries_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM holiday_responses")
-        total_count = cursor.fetchone()[0]
-
-        conn.close()
+            cursor.execute("SELECT COUNT(*) FROM holiday_responses")
+            total_count = cursor.fetchone()[0]
 
         return countries_count, total_count
 
     def clear_cache(self):
         """Очистить весь кэш"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM holiday_responses")
+
+        self.response_cache.clear()
+
+
+class AsyncDatabase:
+    """
+    Асинхронная обёртка над Database
+
+    Каждый метод Database доступен как корутина и выполняется
+    в отдельном потоке, поэтому запросы к SQLite не блокируют event loop.
+    Один рабочий поток сохраняет порядок операций.
+    """
+
+    def __init__(self, db: Database):
+        """
+        Args:
+            db: Синхронная база данных
+        """
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(attr, *args, **kwargs)
+            )
+
+        return method
+
+    @asynccontextmanager
+    async def lease_heartbeat(
+        self,
+        country: str,
+        holiday_type: str,
+        owner: str,
+        ttl: float,
+    ) -> AsyncIterator[None]:
+        """
+        Продлевать захваченную блокировку генерации каждые ttl / 2 секунд
+
+        Генерация с подстраховкой моделями и ожиданием в очереди к OpenAI
+        может идти дольше ttl; без продления блокировку забрал бы другой
+        процесс и сгенерировал ту же карточку ещё раз.
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+            owner: Идентификатор процесса-владельца
+            ttl: Время жизни блокировки в секундах
+        """
+        async def renew():
+            while True:
+                await asyncio.sleep(ttl / 2)
+                if not await self.renew_lease(country, holiday_type, owner, ttl):
+                    metrics.inc("lease_lost")
+                    logger.warning(f"Блокировку генерации {country} ({holiday_type}) захватил другой процесс")
+                    return
+                metrics.inc("lease_renewed")
+
+        task = asyncio.create_task(renew())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    async def get_response(self, country: str, holiday_type: str) -> Optional[str]:
+        """
+        Получить ответ из кэша
+
+        Попадание в LRU обслуживается сразу, без перехода в поток БД.
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            Текст ответа или None если не найден
+        """
+        entry = await self.get_entry(country, holiday_type)
+        return entry.render(country, holiday_type) if entry else None
+
+    async def get_entry(self, country: str, holiday_type: str) -> Optional[CardEntry]:
+        """
+        Получить основной вариант карточки
+
+        Попадание в LRU обслуживается сразу, без перехода в поток БД.
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            Запись кэша или None если не найдена
+        """
+        variants = await self.get_variants(country, holiday_type)
+        return variants[0] if variants else None
+
+    async def get_variants(self, country: str, holiday_type: str) -> List[CardEntry]:
+        """
+        Получить все варианты карточки
+
+        Попадание в LRU обслуживается сразу, без перехода в поток БД.
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            Список вариантов по возрастанию номера
+        """
+        cached = self.db.response_cache.get((country, holiday_type))
+        if cached is not None:
+            return cached
 
-        cursor.execute("DELETE FROM holiday_responses")
+        return await self.load_variants(country, holiday_type)
 
-        conn.commit()
-        conn.close()
+    async def close(self):
+        """Дождаться завершения операций и закрыть соединение"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.db.close)
+        self._executor.shutdown(wait=True)
 
 
 if __name__ == "__main__":
@@ -123,7 +1157,13 @@ if __name__ == "__main__":
     print("Тестирование базы данных...")
 
     # Сохранение
-    db.save_response("Финляндия", "Рождество", "Тестовый ответ про Финляндию")
+    db.save_response("Финляндия", "Рождество", CardFields(
+        outfit="Тестовый наряд",
+        traditions="Тестовые традиции Финляндии",
+        movie="Тестовый фильм",
+        music="Тестовая песня",
+        tip="Тестовый совет",
+    ))
     print("✅ Ответ сохранён")
 
     # Получение
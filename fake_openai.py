@@ -0,0 +1,335 @@
+"""
+Локальная заглушка OpenAI Chat Completions API для тестов и бенчмарков
+
+Запуск:
+    python fake_openai.py [--port 8089] [--delay 0.5] [--chunk-delay 0.05] [--error-rate 0.1]
+                          [--model-delay gpt-4o-mini=3 --model-delay gpt-4.1-nano=0.2]
+                          [--prompt-token-delay 0.0005] [--cache-min-tokens 1024]
+
+Затем укажите в .env:
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+
+Токены считаются приблизительно: токен на 2 символа. Кэш промптов
+устроен как у OpenAI: начало промпта длиной от cache_min_tokens токенов
+запоминается блоками по 128 токенов; совпавшее начало возвращается как
+cached_tokens и не добавляет задержку на чтение промпта.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set
+
+# Размер блока кэша промптов (токены) и символов на токен
+CACHE_BLOCK_TOKENS = 128
+CHARS_PER_TOKEN = 2
+
+
+def fake_card_fields(country: str) -> Dict[str, str]:
+    """Поля карточки с предсказуемым содержимым"""
+    return {
+        "outfit": f"Праздничный наряд ({country}).",
+        "traditions": f"Традиционный ужин и обычаи ({country}).",
+        "movie": f"«Фильм о празднике» ({country}).",
+        "music": f"«Праздничная песня» ({country}).",
+        "tip": f"Устройте дома вечер в стиле {country}.",
+    }
+
+
+def render_fake_card(country: str, holiday_type: str, as_json: bool = False) -> str:
+    """
+    Карточка в формате SYSTEM_PROMPT с предсказуемым содержимым
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+        as_json: Вернуть JSON-объект (запрос с response_format json_object)
+
+    Returns:
+        Текст карточки
+    """
+    fields = fake_card_fields(country)
+    if as_json:
+        return json.dumps(fields, ensure_ascii=False)
+
+    return (
+        f"🎉 Страна: {country}\n"
+        f"Праздник: {holiday_type}\n\n"
+        f"👗 Наряд: {fields['outfit']}\n"
+        f"🍽 Традиции: {fields['traditions']}\n"
+        f"🎬 Фильм: {fields['movie']}\n"
+        f"🎶 Музыка: {fields['music']}\n"
+        f"💡 Совет: {fields['tip']}"
+    )
+
+
+def _extract_field(messages: list, name: str) -> str:
+    """Достаёт значение вида 'Страна: ...' из пользовательского сообщения"""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            match = re.search(rf"{name}:\s*(.+)", message.get("content", ""))
+            if match:
+                return match.group(1).strip()
+    return "?"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Обработчик POST /v1/chat/completions"""
+
+    # Задержка ответа (общая и по моделям), пауза между фрагментами stream,
+    # доля ответов 429, время «чтения» токена промпта вне кэша и минимальная
+    # длина кэшируемого промпта (задаются при запуске сервера)
+    delay = 0.0
+    model_delays: Dict[str, float] = {}
+    chunk_delay = 0.0
+    error_rate = 0.0
+    prompt_token_delay = 0.0
+    cache_min_tokens = 1024
+    prompt_cache: Set[int] = set()
+    cache_lock = threading.Lock()
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        messages = request.get("messages", [])
+
+        prompt = "".join(f"{m.get('role')}:{m.get('content', '')}\n" for m in messages)
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        cached_tokens = self._cached_tokens(request.get("model"), prompt)
+
+        time.sleep(
+            self.model_delays.get(request.get("model"), self.delay)
+            + (prompt_tokens - cached_tokens) * self.prompt_token_delay
+        )
+
+        if random.random() < self.error_rate:
+            self._send_rate_limited()
+            return
+
+        text = render_fake_card(
+            _extract_field(messages, "Страна"),
+            _extract_field(messages, "Праздник"),
+            as_json=(request.get("response_format") or {}).get("type") == "json_object",
+        )
+
+        # Как OpenAI: ответ длиннее max_tokens обрезается
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if max_tokens and len(text) > max_tokens * CHARS_PER_TOKEN:
+            text = text[:max_tokens * CHARS_PER_TOKEN]
+            finish_reason = "length"
+
+        completion_tokens = len(text) // CHARS_PER_TOKEN
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+        if request.get("stream"):
+            self._send_stream(request, text, usage, finish_reason)
+            return
+
+        body = json.dumps({
+            "id": f"chatcmpl-fake-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _cached_tokens(self, model: Optional[str], prompt: str) -> int:
+        """
+        Сколько токенов начала промпта уже было в кэше (и запомнить промпт)
+
+        Args:
+            model: Модель (у каждой модели свой кэш)
+            prompt: Текст всех сообщений запроса
+
+        Returns:
+            Число закэшированных токенов (кратно CACHE_BLOCK_TOKENS)
+        """
+        if len(prompt) // CHARS_PER_TOKEN < self.cache_min_tokens:
+            return 0
+
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        prefixes = [hash((model, prompt[:end])) for end in range(block, len(prompt) + 1, block)]
+
+        with self.cache_lock:
+            cached = 0
+            for prefix in prefixes:
+                if prefix not in self.prompt_cache:
+                    break
+                cached += CACHE_BLOCK_TOKENS
+            self.prompt_cache.update(prefixes)
+
+        # Как у OpenAI: кэш действует только от минимальной длины
+        return cached if cached >= self.cache_min_tokens else 0
+
+    def _send_rate_limited(self):
+        """Отвечает 429 так же, как OpenAI при превышении лимита"""
+        body = json.dumps({
+            "error": {
+                "message": "Rate limit reached (fake)",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            },
+        }).encode("utf-8")
+
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, request: dict, text: str, usage: dict, finish_reason: str = "stop"):
+        """Отправляет ответ в формате server-sent events по словам"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-fake-{time.time_ns()}"
+        words = re.findall(r"\S+\s*", text)
+
+        for index, word in enumerate(words):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word},
+                    "finish_reason": finish_reason if index == len(words) - 1 else None,
+                }],
+            }
+            try:
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент отменил запрос (например, победила другая модель)
+                return
+            time.sleep(self.chunk_delay)
+
+        # Как OpenAI при stream_options.include_usage: последний фрагмент с usage
+        if (request.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [],
+                "usage": usage,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        # Не засоряем вывод тестов логами каждого запроса
+        pass
+
+
+def start_fake_server(
+    port: int = 0,
+    delay: float = 0.0,
+    chunk_delay: float = 0.0,
+    error_rate: float = 0.0,
+    model_delays: Optional[Dict[str, float]] = None,
+    prompt_token_delay: float = 0.0,
+    cache_min_tokens: int = 1024,
+) -> ThreadingHTTPServer:
+    """
+    Запускает заглушку в фоновом потоке
+
+    Args:
+        port: Порт (0 — выбрать свободный)
+        delay: Задержка каждого ответа в секундах
+        chunk_delay: Пауза между фрагментами в режиме stream (секунды)
+        error_rate: Доля запросов, на которые возвращается 429
+        model_delays: Задержка ответа для отдельных моделей (вместо delay)
+        prompt_token_delay: Дополнительная задержка на каждый токен промпта
+            вне кэша (секунды)
+        cache_min_tokens: Минимальная длина промпта для кэширования (токены)
+
+    Returns:
+        Запущенный сервер; адрес API — http://127.0.0.1:{server.server_port}/v1
+    """
+    handler = type(
+        "ConfiguredFakeOpenAIHandler",
+        (FakeOpenAIHandler,),
+        {
+            "delay": delay,
+            "model_delays": dict(model_delays or {}),
+            "chunk_delay": chunk_delay,
+            "error_rate": error_rate,
+            "prompt_token_delay": prompt_token_delay,
+            "cache_min_tokens": cache_min_tokens,
+            "prompt_cache": set(),
+            "cache_lock": threading.Lock(),
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Заглушка OpenAI API")
+    parser.add_argument("--port", type=int, default=8089, help="Порт сервера")
+    parser.add_argument("--delay", type=float, default=0.5, help="Задержка ответа (сек)")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Пауза между фрагментами stream (сек)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 429 (0..1)")
+    parser.add_argument(
+        "--model-delay", action="append", default=[], metavar="MODEL=SEC",
+        help="Задержка для отдельной модели (можно указать несколько раз)",
+    )
+    parser.add_argument(
+        "--prompt-token-delay", type=float, default=0.0,
+        help="Задержка на токен промпта вне кэша (сек)",
+    )
+    parser.add_argument(
+        "--cache-min-tokens", type=int, default=1024,
+        help="Минимальная длина промпта для кэша (токены)",
+    )
+    args = parser.parse_args(argv)
+
+    model_delays = {
+        model: float(seconds)
+        for model, seconds in (item.split("=", 1) for item in args.model_delay)
+    }
+    server = start_fake_server(
+        args.port, args.delay, args.chunk_delay, args.error_rate, model_delays,
+        args.prompt_token_delay, args.cache_min_tokens,
+    )
+    print(f"Заглушка OpenAI: http://127.0.0.1:{server.server_port}/v1 (Ctrl+C для остановки)")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Локальная заглушка Telegram Bot API для проверки отправки сообщений
+
+Поддерживает методы, которые использует бот (sendMessage, editMessageText,
+deleteMessage, sendMediaGroup, answerCallbackQuery и т. п.), и имитирует
+ограничение частоты: если в чат отправлено больше chat_limit сообщений за
+секунду, отвечает 429 с retry_after, как настоящий Telegram.
+
+Запуск:
+    python fake_telegram.py [--port 8088] [--chat-limit 1] [--retry-after 1]
+
+Затем укажите в .env:
+    TELEGRAM_BASE_URL=http://127.0.0.1:8088/bot
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Optional
+from urllib.parse import parse_qsl
+
+# Методы, которые считаются отправкой сообщения в чат (для лимита)
+LIMITED_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup", "sendMediaGroup", "sendPhoto"}
+
+
+class FakeTelegramState:
+    """Сообщения, счётчики вызовов и окна лимита по чатам"""
+
+    def __init__(self, chat_limit: int, retry_after: int):
+        self.chat_limit = chat_limit
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.flood_errors = 0
+        self.sent: Dict[int, Deque[float]] = defaultdict(deque)
+        self.messages: Dict[tuple, str] = {}
+
+    def allow(self, chat_id: int, cost: int) -> bool:
+        """Не превышен ли лимит chat_limit сообщений в секунду для чата"""
+        now = time.monotonic()
+        with self.lock:
+            window = self.sent[chat_id]
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if self.chat_limit and len(window) + cost > self.chat_limit:
+                self.flood_errors += 1
+                return False
+            window.extend([now] * cost)
+            return True
+
+
+def _message(message_id: int, chat_id: int, **fields) -> dict:
+    """Объект Message в формате Bot API"""
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+        **fields,
+    }
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Обработчик POST /bot<token>/<method>"""
+
+    state: FakeTelegramState
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length", 0))
+        params = self._parse_params(self.rfile.read(length))
+
+        with self.state.lock:
+            self.state.calls[method] += 1
+
+        chat_id = int(params.get("chat_id", 0) or 0)
+        cost = len(params.get("media", [])) if method == "sendMediaGroup" else 1
+        if method in LIMITED_METHODS and chat_id and not self.state.allow(chat_id, cost):
+            self._reply(429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.state.retry_after}",
+                "parameters": {"retry_after": self.state.retry_after},
+            })
+            return
+
+        result = self._handle(method, chat_id, params)
+        if result is None:
+            self._reply(400, {"ok": False, "error_code": 400, "description": "Bad Request: message to edit not found"})
+        else:
+            self._reply(200, {"ok": True, "result": result})
+
+    def _handle(self, method: str, chat_id: int, params: dict):
+        """Результат метода или None, если сообщения нет"""
+        state = self.state
+
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+        if method == "sendMessage":
+            message_id = next(state.message_ids)
+            state.messages[(chat_id, message_id)] = params.get("text", "")
+            return _message(message_id, chat_id, text=params.get("text", ""))
+
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            key = (chat_id, int(params.get("message_id", 0)))
+            if key not in state.messages:
+                return None
+            if method == "editMessageText":
+                state.messages[key] = params.get("text", "")
+            return _message(key[1], chat_id, text=state.messages[key])
+
+        if method == "deleteMessage":
+            deleted = state.messages.pop((chat_id, int(params.get("message_id", 0))), None) is not None
+            return True if deleted else None
+
+        if method == "sendMediaGroup":
+            result = []
+            for _ in params.get("media", []):
+                message_id = next(state.message_ids)
+                photo = {"file_id": f"fake-{message_id}", "file_unique_id": f"u{message_id}", "width": 800, "height": 600}
+                result.append(_message(message_id, chat_id, photo=[photo]))
+            return result
+
+        if method == "getUpdates":
+            time.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            return []
+
+        # answerCallbackQuery, setWebhook, deleteWebhook, setMyCommands и т. п.
+        return True
+
+    @staticmethod
+    def _parse_params(body: bytes) -> dict:
+        """Параметры запроса: JSON или form-urlencoded (значения в JSON)"""
+        if body.startswith(b"{"):
+            return json.loads(body)
+
+        params = {}
+        for key, value in parse_qsl(body.decode("utf-8")):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Не засоряем вывод тестов логами каждого запроса
+        pass
+
+
+def start_fake_telegram(port: int = 0, chat_limit: int = 1, retry_after: int = 1) -> ThreadingHTTPServer:
+    """
+    Запускает заглушку в фоновом потоке
+
+    Args:
+        port: Порт (0 — выбрать свободный)
+        chat_limit: Сообщений в секунду в один чат до ответа 429 (0 — без лимита)
+        retry_after: Значение retry_after в ответе 429 (секунды)
+
+    Returns:
+        Запущенный сервер; счётчики — в server.state, адрес Bot API —
+        http://127.0.0.1:{server.server_port}/bot
+    """
+    state = FakeTelegramState(chat_limit, retry_after)
+    handler = type("ConfiguredFakeTelegramHandler", (FakeTelegramHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8088, help="Порт сервера")
+    parser.add_argument("--chat-limit", type=int, default=1, help="Сообщений в секунду в чат до 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответе 429 (сек)")
+    args = parser.parse_args(argv)
+
+    server = start_fake_telegram(args.port, args.chat_limit, args.retry_after)
+    print(f"Заглушка Telegram: http://127.0.0.1:{server.server_port}/bot (Ctrl+C для остановки)")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"Вызовы: {dict(server.state.calls)}, ответов 429: {server.state.flood_errors}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,74 @@
 """
 Модуль для получения изображений из Unsplash API
 """
+import asyncio
 import requests
-from typing import List, Optional
+import httpx
+from typing import List, Optional, TYPE_CHECKING
 import logging
-from config import UNSPLASH_ACCESS_KEY
+import metrics
+from breaker import CircuitBreaker
+from countries import COUNTRY_DETAILS
+from config import (
+    UNSPLASH_ACCESS_KEY,
+    UNSPLASH_TIMEOUT,
+    IMAGE_CACHE_TTL,
+    IMAGE_NEGATIVE_TTL,
+    UNSPLASH_BREAKER_THRESHOLD,
+    UNSPLASH_BREAKER_RESET,
+)
+
+if TYPE_CHECKING:
+    from database import AsyncDatabase
 
 logger = logging.getLogger(__name__)
 
+UNSPLASH_SEARCH_URL = "https://api.unsplash.com/search/photos"
+
+# Общий асинхронный HTTP-клиент (переиспользует соединения с Unsplash)
+_async_http: Optional[httpx.AsyncClient] = None
+
+# Выключатель: пока Unsplash сбоит, карточки отправляются без изображений
+unsplash_breaker = CircuitBreaker("unsplash", UNSPLASH_BREAKER_THRESHOLD, UNSPLASH_BREAKER_RESET)
+
+
+class UnsplashRateLimited(Exception):
+    """Unsplash ответил 403: лимит запросов исчерпан"""
+
+
+def generate_image_queries(country: str, holiday_type: str) -> List[str]:
+    """
+    Генерирует цепочку поисковых запросов для Unsplash, от точного к общему
+
+    Запросы строятся по английскому названию страны и подсказке из
+    countries.py; для стран не из справочника используется название как есть.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+
+    Returns:
+        Список запросов; следующий используется, только если предыдущий
+        ничего не нашёл
+    """
+    holiday_en = "Christmas" if "Рождество" in holiday_type else "New Year"
+    details = COUNTRY_DETAILS.get(country, {})
+    country_en = details.get("en", country)
+
+    queries = []
+    if details.get("hint"):
+        queries.append(f"{holiday_en} {country_en} {details['hint']}")
+    queries += [
+        f"{holiday_en} {country_en} celebration traditional",
+        f"{holiday_en} {country_en} celebration",
+        f"{country_en} celebration",
+    ]
+    return queries
+
 
 def generate_image_query(country: str, holiday_type: str) -> str:
     """
-    Генерирует поисковый запрос для Unsplash на основе страны и праздника
+    Генерирует основной поисковый запрос для Unsplash на основе страны и праздника
 
     Args:
         country: Название страны
@@ -20,9 +77,43 @@ def generate_image_query(country: str, holiday_type: str) -> str:
     Returns:
         Строка запроса для поиска
     """
-    holiday_en = "Christmas" if "Рождество" in holiday_type else "New Year"
-    query = f"{holiday_en} {country} celebration traditional"
-    return query
+    return generate_image_queries(country, holiday_type)[0]
+
+
+def _auth_headers() -> dict:
+    """Заголовки авторизации Unsplash API"""
+    return {"Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"}
+
+
+def _search_params(query: str, count: int) -> dict:
+    """Параметры поискового запроса Unsplash API"""
+    return {
+        "query": query,
+        "per_page": min(count, 3),
+        "orientation": "landscape"
+    }
+
+
+def _extract_image_urls(data: dict, count: int) -> List[str]:
+    """
+    Достаёт URL изображений из ответа Unsplash API
+
+    Args:
+        data: JSON-ответ поиска
+        count: Максимальное количество изображений
+
+    Returns:
+        Список URL изображений
+    """
+    images = []
+
+    for photo in data.get("results", [])[:count]:
+        # Используем regular размер для баланса качества и скорости
+        image_url = photo.get("urls", {}).get("regular")
+        if image_url:
+            images.append(image_url)
+
+    return images
 
 
 def get_unsplash_images(query: str, count: int = 3) -> List[str]:
@@ -43,30 +134,15 @@ def get_unsplash_images(query: str, count: int = 3) -> List[str]:
 
     try:
         # Официальный Unsplash API
-        url = "https://api.unsplash.com/search/photos"
-
-        headers = {
-            "Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"
-        }
-
-        params = {
-            "query": query,
-            "per_page": min(count, 3),
-            "orientation": "landscape"
-        }
-
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        response = requests.get(
+            UNSPLASH_SEARCH_URL,
+            headers=_auth_headers(),
+            params=_search_params(query, count),
+            timeout=UNSPLASH_TIMEOUT
+        )
 
         if response.status_code == 200:
-            data = response.json()
-            images = []
-
-            for photo in data.get("results", [])[:count]:
-                # Используем regular размер для баланса качества и скорости
-                image_url = photo.get("urls", {}).get("regular")
-                if image_url:
-                    images.append(image_url)
-
+            images = _extract_image_urls(response.json(), count)
             logger.info(f"Получено {len(images)} изображений для запроса: {query}")
             return images
 
@@ -103,8 +179,154 @@ def get_holiday_images(country: str, holiday_type: str, count: int = 3) -> List[
     Returns:
         Список URL изображений
     """
-    query = generate_image_query(country, holiday_type)
-    return get_unsplash_images(query, count)
+    for query in generate_image_queries(country, holiday_type):
+        images = get_unsplash_images(query, count)
+        if images:
+            return images
+
+    return []
+
+
+def _get_async_http() -> httpx.AsyncClient:
+    """Возвращает общий асинхронный HTTP-клиент, создавая его при первом вызове"""
+    global _async_http
+
+    if _async_http is None or _async_http.is_closed:
+        _async_http = httpx.AsyncClient(
+            timeout=UNSPLASH_TIMEOUT,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+
+    return _async_http
+
+
+async def fetch_unsplash_images_async(query: str, count: int = 3) -> Optional[List[str]]:
+    """
+    Асинхронно получает изображения из Unsplash API
+
+    Args:
+        query: Поисковый запрос
+        count: Количество изображений (до 3)
+
+    Returns:
+        Список URL изображений (пустой, если ничего не найдено)
+        или None при временной ошибке, которую не нужно кэшировать
+
+    Raises:
+        UnsplashRateLimited: Превышен лимит запросов (ответ 403)
+    """
+    try:
+        response = await _get_async_http().get(
+            UNSPLASH_SEARCH_URL,
+            headers=_auth_headers(),
+            params=_search_params(query, count),
+        )
+
+        if response.status_code == 200:
+            images = _extract_image_urls(response.json(), count)
+            logger.info(f"Получено {len(images)} изображений для запроса: {query}")
+            return images
+
+        elif response.status_code == 401:
+            logger.error("Неверный Unsplash API ключ")
+            return None
+
+        elif response.status_code == 403:
+            logger.error("Превышен лимит запросов Unsplash API")
+            raise UnsplashRateLimited()
+
+        else:
+            logger.warning(f"Unsplash API вернул статус {response.status_code}")
+            return None
+
+    except UnsplashRateLimited:
+        raise
+
+    except httpx.TimeoutException:
+        logger.error("Timeout при запросе к Unsplash API")
+        return None
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении изображений: {e}")
+        return None
+
+
+async def get_holiday_images_async(
+    country: str,
+    holiday_type: str,
+    count: int = 3,
+    db: Optional["AsyncDatabase"] = None,
+) -> List[str]:
+    """
+    Асинхронно получает праздничные изображения для страны
+
+    Сначала проверяет кэш в базе данных. Пока выключатель Unsplash
+    разомкнут, сразу возвращается пустой список. Если основной запрос ничего
+    не нашёл, по очереди пробуются более общие (generate_image_queries).
+    Итог цепочки кэшируется под основным запросом: найденные изображения
+    на IMAGE_CACHE_TTL, пустой результат и ответ 403 — на IMAGE_NEGATIVE_TTL.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+        count: Количество изображений
+        db: База данных для кэширования (без неё кэш не используется)
+
+    Returns:
+        Список URL изображений
+    """
+    if not UNSPLASH_ACCESS_KEY:
+        return []
+
+    queries = generate_image_queries(country, holiday_type)
+    cache_key = queries[0]
+
+    if db is not None:
+        cached = await db.get_image_urls(cache_key)
+        if cached is not None:
+            logger.info(f"Изображения для запроса '{cache_key}' взяты из кэша")
+            return cached[:count]
+
+    if not unsplash_breaker.allow():
+        return []
+
+    images: List[str] = []
+    try:
+        for attempt, query in enumerate(queries):
+            images = await fetch_unsplash_images_async(query, count)
+
+            # Временную ошибку не кэшируем и более общие запросы не пробуем
+            if images is None:
+                unsplash_breaker.record_failure()
+                return []
+
+            unsplash_breaker.record_success()
+
+            if images:
+                if attempt:
+                    metrics.inc("images_query_fallback")
+                    logger.info(f"Изображения для '{cache_key}' найдены по запросу '{query}'")
+                break
+    except UnsplashRateLimited:
+        unsplash_breaker.record_failure()
+        images = []
+    except asyncio.CancelledError:
+        # Отмена (повторное нажатие, ошибка текста, дедлайн доставки) не
+        # говорит о состоянии Unsplash; дедлайн учитывает сам конвейер
+        unsplash_breaker.release_trial()
+        raise
+
+    if db is not None:
+        ttl = IMAGE_CACHE_TTL if images else IMAGE_NEGATIVE_TTL
+        await db.save_image_urls(cache_key, images, ttl)
+
+    return images
+
+
+async def close_image_client() -> None:
+    """Закрывает общий HTTP-клиент"""
+    if _async_http is not None:
+        await _async_http.aclose()
 
 
 if __name__ == "__main__":
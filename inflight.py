@@ -0,0 +1,84 @@
+"""
+Не больше одной карточки на пользователя одновременно
+
+Пока карточка по кнопке «Другая страна» готовится, повторные нажатия
+того же пользователя не запускают новые генерации, поиски изображений и
+альбомы: нажатие либо подавляется (пользователь видит всплывающее
+уведомление), либо отменяет текущую задачу и запускает новую.
+"""
+import asyncio
+import logging
+from typing import Coroutine, Dict, Hashable
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Повторное нажатие подавляется
+MODE_IGNORE = "ignore"
+# Повторное нажатие отменяет текущую задачу и запускает новую
+MODE_REPLACE = "replace"
+
+
+class UserJobs:
+    """Текущая фоновая задача каждого пользователя"""
+
+    def __init__(self, name: str, mode: str = MODE_IGNORE):
+        """
+        Args:
+            name: Префикс имён счётчиков в metrics
+            mode: MODE_IGNORE или MODE_REPLACE
+        """
+        if mode not in (MODE_IGNORE, MODE_REPLACE):
+            raise ValueError(f"Неизвестный режим повторных нажатий: {mode}")
+
+        self.name = name
+        self.mode = mode
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def busy(self, user_id: Hashable) -> bool:
+        """Выполняется ли задача пользователя"""
+        task = self._tasks.get(user_id)
+        return task is not None and not task.done()
+
+    def start(self, user_id: Hashable, coro: Coroutine) -> bool:
+        """
+        Запустить задачу пользователя в фоне
+
+        Обработчик нажатия сразу возвращается, поэтому следующее нажатие
+        обрабатывается, пока задача ещё идёт, и попадает сюда же.
+
+        Args:
+            user_id: Пользователь
+            coro: Корутина задачи
+
+        Returns:
+            True, если задача запущена; False, если нажатие подавлено
+            (корутина закрывается без запуска)
+        """
+        if self.busy(user_id):
+            if self.mode == MODE_IGNORE:
+                coro.close()
+                metrics.inc(f"{self.name}_suppressed")
+                return False
+
+            self._tasks[user_id].cancel()
+            metrics.inc(f"{self.name}_cancelled")
+
+        task = asyncio.create_task(coro)
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda done: self._finished(user_id, done))
+        metrics.inc(f"{self.name}_started")
+        return True
+
+    def active(self) -> int:
+        """Количество выполняющихся задач"""
+        return sum(1 for task in self._tasks.values() if not task.done())
+
+    def _finished(self, user_id: Hashable, task: asyncio.Task):
+        """Убрать завершённую задачу и записать её ошибку в лог"""
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Задача пользователя {user_id} завершилась ошибкой: {task.exception()}")
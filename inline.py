@@ -0,0 +1,123 @@
+"""
+Поиск карточек для inline-режима (@bot Япония)
+
+Telegram ждёт ответ на inline-запрос несколько секунд, поэтому ответ
+собирается только из готовых карточек: индекс названий стран строится
+заранее из справочника и закэшированных карточек, а поиск идёт по
+отсортированному списку префиксов без обращений к базе и OpenAI.
+"""
+import hashlib
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from countries import HOLIDAY_TYPES
+from registry import CountryRegistry, normalize
+
+# Минимальная длина слова, по которой узнаётся праздник в конце запроса («рожд»)
+MIN_HOLIDAY_PREFIX = 3
+
+
+def split_holiday(text: str) -> Tuple[str, Optional[str]]:
+    """
+    Отделить праздник в конце запроса («япония новый год» → «япония», «Новый год»)
+
+    Если весь запрос — праздник («рожд», «новый год»), страна пустая:
+    показываются все готовые карточки этого праздника.
+
+    Args:
+        text: Текст inline-запроса
+
+    Returns:
+        Запрос без праздника и тип праздника (None, если не указан)
+    """
+    key = normalize(text)
+    words = key.split(" ")
+
+    # Пробуем хвосты запроса от самого длинного: «новый год», «год», «нов»
+    for start in range(len(words)):
+        tail = " ".join(words[start:])
+        if len(tail) < MIN_HOLIDAY_PREFIX:
+            continue
+        for holiday_type in HOLIDAY_TYPES.values():
+            if normalize(holiday_type).startswith(tail):
+                return " ".join(words[:start]), holiday_type
+
+    return key, None
+
+
+def result_id(country: str, holiday_type: str) -> str:
+    """Идентификатор результата inline-запроса (не длиннее 64 байт)"""
+    return hashlib.md5(f"{country}|{holiday_type}".encode("utf-8")).hexdigest()
+
+
+class InlineIndex:
+    """Префиксный и нечёткий поиск страны по началу названия или синонима"""
+
+    def __init__(self, registry: CountryRegistry):
+        """
+        Args:
+            registry: Справочник стран (названия, синонимы, нечёткий поиск)
+        """
+        self.registry = registry
+        # Отсортированные тройки (начало слова названия, ранг, страна):
+        # «новая зеландия» находится и по «нов» (ранг 0 — начало названия),
+        # и по «зел» (ранг 1 — начало другого слова)
+        self._prefixes: List[Tuple[str, int, str]] = []
+        # Порядок стран для пустого запроса
+        self._countries: Dict[str, int] = {}
+
+        for name, country in registry.names():
+            self._add_name(name, country)
+
+    def add_countries(self, countries: Iterable[str]):
+        """
+        Добавить страны закэшированных карточек (в том числе не из справочника)
+
+        Args:
+            countries: Названия стран
+        """
+        for country in countries:
+            if country not in self._countries:
+                self._add_name(normalize(country), country)
+
+    def search(self, text: str) -> List[str]:
+        """
+        Найти страны по запросу
+
+        Сначала страны, название или синоним которых начинается с запроса,
+        затем совпадения по началу других слов названия и, если префиксом
+        ничего не нашлось, нечёткие совпадения из справочника («Японя»).
+
+        Args:
+            text: Запрос (без праздника)
+
+        Returns:
+            Страны по убыванию релевантности; для пустого запроса — все
+        """
+        key = normalize(text)
+        if not key:
+            return list(self._countries)
+
+        ranked: Dict[str, int] = {}
+        start = bisect_left(self._prefixes, (key,))
+        for prefix, rank, country in islice(self._prefixes, start, None):
+            if not prefix.startswith(key):
+                break
+            ranked[country] = min(rank, ranked.get(country, rank))
+
+        found = sorted(ranked, key=lambda country: (ranked[country], self._countries[country]))
+        if found:
+            return found
+
+        return self.registry.suggest(text, limit=5)
+
+    def _add_name(self, name: str, country: str):
+        """Добавить в индекс начало каждого слова названия"""
+        self._countries.setdefault(country, len(self._countries))
+        words = name.split(" ")
+        for i in range(len(words)):
+            entry = (" ".join(words[i:]), min(i, 1), country)
+            position = bisect_left(self._prefixes, entry)
+            if position == len(self._prefixes) or self._prefixes[position] != entry:
+                insort(self._prefixes, entry)
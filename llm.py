@@ -1,18 +1,166 @@
 """
 Модуль для работы с LLM (OpenAI API)
 """
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, List, Dict, NamedTuple, Optional, Tuple
+
+import httpx
 import openai
-from config import OPENAI_API_KEY, OPENAI_MODEL, SYSTEM_PROMPT
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    OPENAI_BASE_URL,
+    SYSTEM_PROMPT,
+    LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT,
+    LLM_MAX_TOKENS,
+    LLM_RPM,
+    LLM_TPM,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE,
+    LLM_BREAKER_THRESHOLD,
+    LLM_BREAKER_RESET,
+    LLM_MODEL_CHAIN,
+    LLM_HEDGE_DELAY,
+    LLM_MODEL_PRICES,
+)
+import metrics
+from breaker import CircuitBreaker
+from cards import (
+    GENERATION_ERROR_PREFIX, CardFields, CardParseError, parse_card, parse_partial_card, render_card,
+)
+from scheduler import LLMScheduler, PRIORITY_INTERACTIVE
 
+logger = logging.getLogger(__name__)
 
 # Настройка OpenAI клиента
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+# Асинхронный клиент с общим пулом HTTP-соединений (используется ботом)
+async_client = openai.AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    timeout=LLM_TIMEOUT,
+    # Повторы выполняет generate_holiday_tradition_async через планировщик
+    max_retries=0,
+    http_client=openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONCURRENCY * 2,
+            max_keepalive_connections=LLM_MAX_CONCURRENCY,
+        ),
+    ),
+)
+
+# Очередь запросов с лимитами RPM/TPM и числа одновременных генераций
+llm_scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, rpm=LLM_RPM, tpm=LLM_TPM)
+
+
+# Выключатель: после серии неудачных генераций запросы к OpenAI
+# на время прекращаются, и бот сразу отдаёт запасной ответ
+llm_breaker = CircuitBreaker("openai", LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET)
+
+
+class GenerationError(Exception):
+    """Карточку не удалось сгенерировать"""
+
+
+class GenerationUnavailable(GenerationError):
+    """OpenAI временно не вызывается (выключатель разомкнут)"""
+
+
+class UsageRecord(NamedTuple):
+    """Токены и время одного запроса к модели"""
+    model: str
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+    first_token_ms: Optional[float]
+    latency_ms: float
+    outcome: str  # win, error или cancelled
+
+
+# Получатель записей о расходе токенов: (страна, праздник, записи)
+UsageRecorder = Callable[[str, str, List[UsageRecord]], Awaitable[None]]
+
+# Число генераций, которые сейчас ждут или выполняют запрос
+_in_flight = 0
+
+# Куда сохранять расход токенов (см. set_usage_recorder)
+_usage_recorder: Optional[UsageRecorder] = None
+
+
+def build_messages(country: str, holiday_type: str) -> List[Dict[str, str]]:
+    """
+    Формирует список сообщений для запроса к модели
+
+    Провайдеры кэшируют одинаковое начало промпта, поэтому всё общее
+    для всех карточек (системная инструкция) идёт первым и не меняется
+    от запроса к запросу, а страна и праздник — в самом конце.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника ("Рождество" или "Новый год")
+
+    Returns:
+        Список сообщений в формате Chat Completions API
+    """
+    user_prompt = f"Страна: {country}\nПраздник: {holiday_type}"
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def build_request(country: str, holiday_type: str) -> Dict:
+    """
+    Формирует параметры запроса Chat Completions для карточки
+
+    Используется и для прямых вызовов, и для файлов OpenAI Batch API.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника
+
+    Returns:
+        Словарь параметров (model, messages, max_tokens, temperature, response_format)
+    """
+    return {
+        "model": OPENAI_MODEL,
+        "messages": build_messages(country, holiday_type),
+        "max_tokens": LLM_MAX_TOKENS,
+        "temperature": 0.8,
+        "response_format": {"type": "json_object"},
+    }
+
+
+def _compute_prompt_version() -> str:
+    """
+    Версия промпта и параметров генерации
+
+    Меняется при изменении SYSTEM_PROMPT, модели или параметров запроса,
+    после чего сохранённые карточки считаются устаревшими.
+    """
+    request = build_request("{country}", "{holiday_type}")
+    fingerprint = json.dumps(request, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+
+
+PROMPT_VERSION = _compute_prompt_version()
 
 
 def generate_holiday_tradition(country: str, holiday_type: str) -> str:
     """
     Генерирует описание праздничных традиций для указанной страны.
 
+    Синхронная версия, блокирует поток. В боте используйте
+    generate_holiday_tradition_async().
+
     Args:
         country: Название страны
         holiday_type: Тип праздника ("Рождество" или "Новый год")
@@ -20,28 +168,508 @@ def generate_holiday_tradition(country: str, holiday_type: str) -> str:
     Returns:
         Форматированный текст с описанием традиций
     """
-    user_prompt = f"""Создай праздничную карточку по следующей стране и празднику:
+    try:
+        response = client.chat.completions.create(**build_request(country, holiday_type))
+        card = parse_card(response.choices[0].message.content)
 
-Страна: {country}
-Праздник: {holiday_type}
+        return render_card(country, holiday_type, card)
 
-Формат вывода и стиль описаны в системной инструкции."""
+    except Exception as e:
+        return f"{GENERATION_ERROR_PREFIX}: {str(e)}"
 
-    try:
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.8,
+
+# Колбэк, получающий весь сгенерированный на данный момент текст
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+
+class _ModelAttempt:
+    """Один запрос к модели из цепочки в режиме stream"""
+
+    def __init__(self, model: str, tier: int):
+        self.model = model
+        self.tier = tier
+        self.started = asyncio.Event()
+        self.first_token = asyncio.Event()
+        self.parts: List[str] = []
+        self.usage = None
+        self.outcome = "cancelled"
+        self.started_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    async def run(
+        self,
+        request: Dict,
+        timeout: float,
+        priority: int,
+        estimated: int,
+        on_progress: Optional[ProgressCallback],
+    ) -> str:
+        """
+        Дождаться слота планировщика и получить ответ модели
+
+        Args:
+            request: Параметры запроса Chat Completions
+            timeout: Ограничение на весь ответ (секунды)
+            priority: Приоритет в очереди
+            estimated: Оценка токенов для лимита TPM
+            on_progress: Колбэк с накопленным текстом
+
+        Returns:
+            Полный текст ответа
+        """
+        async with llm_scheduler.slot(priority, estimated):
+            self.started_at = time.monotonic()
+            self.started.set()
+            metrics.inc(f"llm_attempts_{self.model}")
+            # В режиме stream таймаут httpx ограничивает только паузы
+            # между фрагментами, поэтому ограничиваем весь ответ целиком
+            try:
+                await asyncio.wait_for(self._stream({**request, "model": self.model}, on_progress), timeout)
+            finally:
+                self.finished_at = time.monotonic()
+                # Уточняем расход TPM и для отменённых (проигравших подстраховку),
+                # прерванных таймаутом и неудачных попыток: иначе до конца минуты
+                # за ними числится вся оценка
+                prompt_tokens, _, completion_tokens = self._token_counts(request)
+                llm_scheduler.settle(estimated, prompt_tokens + completion_tokens)
+
+        return "".join(self.parts).strip()
+
+    async def _stream(self, request: Dict, on_progress: Optional[ProgressCallback]):
+        stream = await async_client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                self.parts.append(chunk.choices[0].delta.content)
+                if not self.first_token.is_set():
+                    self.first_token_at = time.monotonic()
+                    self.first_token.set()
+                if on_progress is not None:
+                    await on_progress("".join(self.parts))
+            if getattr(chunk, "usage", None):
+                self.usage = chunk.usage
+
+    def _token_counts(self, request: Dict) -> Tuple[int, int, int]:
+        """
+        Токены попытки: промпт, из них закэшированные, ответ
+
+        Если usage не получен (попытка отменена или прервана), токены
+        оцениваются по длине промпта и уже полученной части ответа.
+        """
+        if self.usage is None:
+            prompt_tokens = sum(len(m["content"]) for m in request["messages"]) // 2
+            return prompt_tokens, 0, len("".join(self.parts)) // 2
+
+        details = getattr(self.usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        return self.usage.prompt_tokens, cached_tokens, self.usage.completion_tokens
+
+    def record_usage(self, request: Dict) -> UsageRecord:
+        """
+        Учесть токены и стоимость попытки
+
+        Для отменённых попыток usage неизвестен, поэтому токены оцениваются
+        по длине промпта и уже полученной части ответа.
+
+        Returns:
+            Запись о расходе токенов и времени ответа
+        """
+        prompt_tokens, cached_tokens, completion_tokens = self._token_counts(request)
+
+        metrics.inc(f"llm_tokens_{self.model}", prompt_tokens + completion_tokens)
+        metrics.inc(f"llm_cached_tokens_{self.model}", cached_tokens)
+
+        cost = usage_cost(self.model, prompt_tokens, cached_tokens, completion_tokens)
+        if cost is not None:
+            metrics.inc(f"llm_cost_usd_{self.model}", cost)
+
+        finished_at = self.finished_at or time.monotonic()
+        return UsageRecord(
+            model=self.model,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            completion_tokens=completion_tokens,
+            first_token_ms=(self.first_token_at - self.started_at) * 1000 if self.first_token_at else None,
+            latency_ms=(finished_at - self.started_at) * 1000,
+            outcome=self.outcome,
         )
 
-        return response.choices[0].message.content.strip()
 
+def usage_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    Стоимость запроса по ценам LLM_MODEL_PRICES
+
+    Args:
+        model: Модель
+        prompt_tokens: Токены промпта (включая закэшированные)
+        cached_tokens: Закэшированные токены промпта
+        completion_tokens: Токены ответа
+
+    Returns:
+        Стоимость в USD или None, если цена модели неизвестна
+    """
+    price = LLM_MODEL_PRICES.get(model)
+    if not price:
+        return None
+
+    cached_price = price[2] if len(price) > 2 else price[0]
+    return (
+        (prompt_tokens - cached_tokens) * price[0]
+        + cached_tokens * cached_price
+        + completion_tokens * price[1]
+    ) / 1_000_000
+
+
+async def _wait_hedge_trigger(attempt: _ModelAttempt, delay: float) -> bool:
+    """
+    Ждать, пока попытке пора подстраховаться следующей моделью
+
+    Returns:
+        True, если за delay секунд после начала запроса не пришёл первый токен
+    """
+    await attempt.started.wait()
+    try:
+        await asyncio.wait_for(attempt.first_token.wait(), delay)
+        return False
+    except asyncio.TimeoutError:
+        return True
+
+
+async def _hedged_completion(
+    request: Dict,
+    timeout: float,
+    priority: int,
+    estimated: int,
+    on_progress: Optional[ProgressCallback],
+    usage: Optional[List[UsageRecord]] = None,
+) -> str:
+    """
+    Получить ответ от цепочки моделей LLM_MODEL_CHAIN
+
+    Запрос уходит основной модели. Если она не прислала первый токен
+    за LLM_HEDGE_DELAY секунд или завершилась ошибкой, запрос
+    дублируется следующей модели цепочки. Побеждает ответ, пришедший
+    первым; остальные запросы отменяются. Постепенный вывод показывает
+    ту модель, которая первой начала отвечать.
+
+    Args:
+        request: Параметры запроса Chat Completions
+        timeout: Ограничение на ответ одной модели (секунды)
+        priority: Приоритет в очереди
+        estimated: Оценка токенов для лимита TPM
+        on_progress: Колбэк с накопленным текстом
+        usage: Список, в который добавляются записи о расходе по попыткам
+
+    Returns:
+        Текст ответа
+
+    Raises:
+        Exception: Ошибка последней модели, если ни одна не ответила
+    """
+    attempts: Dict[asyncio.Task, _ModelAttempt] = {}
+    leader: Optional[_ModelAttempt] = None
+    trigger: Optional[asyncio.Task] = None
+    last_error: Optional[BaseException] = None
+
+    def progress_for(attempt: _ModelAttempt) -> Optional[ProgressCallback]:
+        if on_progress is None:
+            return None
+
+        async def forward(text: str):
+            nonlocal leader
+            if leader is None:
+                leader = attempt
+            if leader is attempt:
+                await on_progress(text)
+
+        return forward
+
+    def launch():
+        nonlocal trigger
+        tier = len(attempts)
+        attempt = _ModelAttempt(LLM_MODEL_CHAIN[tier], tier)
+        task = asyncio.create_task(attempt.run(request, timeout, priority, estimated, progress_for(attempt)))
+        attempts[task] = attempt
+
+        if trigger is not None:
+            trigger.cancel()
+        trigger = None
+        if LLM_HEDGE_DELAY > 0 and tier + 1 < len(LLM_MODEL_CHAIN):
+            trigger = asyncio.create_task(_wait_hedge_trigger(attempt, LLM_HEDGE_DELAY))
+
+    launch()
+    running = set(attempts)
+
+    try:
+        while running:
+            waiting = running | ({trigger} if trigger is not None else set())
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if trigger in done:
+                fired = trigger.result()
+                trigger = None
+                if fired:
+                    metrics.inc("llm_hedges")
+                    launch()
+                    running = {task for task in attempts if not task.done()}
+
+            for task in done & running:
+                running.discard(task)
+                attempt = attempts[task]
+
+                if task.exception() is None:
+                    attempt.outcome = "win"
+                    metrics.inc(f"llm_wins_{attempt.model}")
+                    return task.result()
+
+                last_error = task.exception()
+                attempt.outcome = "error"
+                metrics.inc(f"llm_failures_{attempt.model}")
+
+                # Ошибка модели — сразу пробуем следующую, если она ещё не запущена
+                if not running and len(attempts) < len(LLM_MODEL_CHAIN):
+                    launch()
+                    running = {t for t in attempts if not t.done()}
+
+        raise last_error
+    finally:
+        if trigger is not None:
+            trigger.cancel()
+        for task, attempt in attempts.items():
+            if not task.done():
+                task.cancel()
+                metrics.inc(f"llm_cancelled_{attempt.model}")
+        # Отменённые попытки тоже стоят денег — учитываем их после остановки
+        await asyncio.gather(*attempts, return_exceptions=True)
+        for attempt in attempts.values():
+            if attempt.started.is_set():
+                record = attempt.record_usage(request)
+                if usage is not None:
+                    usage.append(record)
+
+
+def model_stats() -> List[Dict]:
+    """
+    Статистика по моделям цепочки
+
+    Returns:
+        Для каждой модели: попытки, победы, доля побед, токены (из них
+        из кэша промпта) и стоимость (USD; None, если цены модели нет
+        в LLM_MODEL_PRICES)
+    """
+    stats = []
+    for model in LLM_MODEL_CHAIN:
+        attempts = metrics.get(f"llm_attempts_{model}")
+        wins = metrics.get(f"llm_wins_{model}")
+        stats.append({
+            "model": model,
+            "attempts": int(attempts),
+            "wins": int(wins),
+            "win_rate": wins / attempts if attempts else 0.0,
+            "tokens": int(metrics.get(f"llm_tokens_{model}")),
+            "cached_tokens": int(metrics.get(f"llm_cached_tokens_{model}")),
+            "cost_usd": metrics.get(f"llm_cost_usd_{model}") if LLM_MODEL_PRICES.get(model) else None,
+        })
+    return stats
+
+
+def estimate_tokens(request: Dict) -> int:
+    """
+    Грубая оценка токенов запроса для лимита TPM
+
+    Русский текст занимает примерно токен на 2 символа; к промпту
+    добавляется максимальная длина ответа.
+
+    Args:
+        request: Параметры запроса Chat Completions
+
+    Returns:
+        Оценка числа токенов
+    """
+    prompt_chars = sum(len(message["content"]) for message in request["messages"])
+    return prompt_chars // 2 + request.get("max_tokens", 0)
+
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Пауза перед повтором запроса или None, если ошибку повторять не нужно
+
+    Повторяются ответы 429 и 5xx. Пауза растёт экспоненциально со
+    случайным разбросом (full jitter); заголовок Retry-After учитывается.
+    """
+    if not isinstance(error, openai.APIStatusError):
+        return None
+
+    if error.status_code != 429 and error.status_code < 500:
+        return None
+
+    delay = random.uniform(0, LLM_RETRY_BASE * 2 ** attempt)
+
+    retry_after = error.response.headers.get("retry-after") if error.response is not None else None
+    try:
+        delay = max(delay, float(retry_after))
+    except (TypeError, ValueError):
+        pass
+
+    return delay
+
+
+async def generate_holiday_tradition_async(
+    country: str,
+    holiday_type: str,
+    timeout: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> str:
+    """
+    Асинхронно генерирует описание праздничных традиций.
+
+    Не блокирует event loop. Запрос ждёт очереди у планировщика
+    (лимиты RPM/TPM и LLM_MAX_CONCURRENCY, по приоритету), каждая
+    попытка ограничена таймаутом. Медленный ответ подстраховывается
+    следующей моделью цепочки (см. _hedged_completion). Ответы 429
+    и 5xx повторяются до LLM_MAX_RETRIES раз с растущей паузой.
+    Ответ запрашивается в режиме stream=True; если передан on_progress,
+    колбэк вызывается по мере поступления текста.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника ("Рождество" или "Новый год")
+        timeout: Таймаут запроса в секундах (по умолчанию LLM_TIMEOUT)
+        on_progress: Колбэк с накопленным текстом (для постепенного вывода)
+        priority: Приоритет в очереди (PRIORITY_* из scheduler)
+
+    Returns:
+        Форматированный текст с описанием традиций
+
+    Raises:
+        GenerationUnavailable: Выключатель OpenAI разомкнут, запрос не выполнялся
+        GenerationError: Ответ не получен (после всех повторов)
+    """
+    global _in_flight
+    timeout = timeout or LLM_TIMEOUT
+
+    if not llm_breaker.allow():
+        raise GenerationUnavailable("сервис генерации временно недоступен")
+
+    request = build_request(country, holiday_type)
+    estimated = estimate_tokens(request)
+
+    usage: List[UsageRecord] = []
+
+    _in_flight += 1
+    try:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                text = await _hedged_completion(request, timeout, priority, estimated, on_progress, usage)
+
+                # Пустой ответ — сбой сервиса, он не должен замыкать выключатель
+                if not text:
+                    llm_breaker.record_failure()
+                    raise GenerationError("пустой ответ модели")
+
+                llm_breaker.record_success()
+                return text
+
+            except GenerationError:
+                raise
+
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt == LLM_MAX_RETRIES:
+                    llm_breaker.record_failure()
+                    raise GenerationError(str(e) or type(e).__name__) from e
+
+                metrics.inc("llm_retries")
+                await asyncio.sleep(delay)
+
+    finally:
+        _in_flight -= 1
+        await _save_usage(country, holiday_type, usage)
+
+
+def set_usage_recorder(recorder: Optional[UsageRecorder]):
+    """
+    Сохранять расход токенов каждой генерации (например, в базу)
+
+    Args:
+        recorder: Корутина (страна, праздник, записи) или None — не сохранять
+    """
+    global _usage_recorder
+    _usage_recorder = recorder
+
+
+async def _save_usage(country: str, holiday_type: str, usage: List[UsageRecord]):
+    """Передать записи о расходе токенов получателю; ошибки только логируются"""
+    if _usage_recorder is None or not usage:
+        return
+
+    try:
+        await _usage_recorder(country, holiday_type, usage)
     except Exception as e:
-        return f"Ошибка при генерации: {str(e)}"
+        logger.warning(f"Не удалось сохранить расход токенов: {e}")
+
+
+async def generate_card_async(
+    country: str,
+    holiday_type: str,
+    timeout: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> CardFields:
+    """
+    Асинхронно генерирует карточку и разбирает её на поля
+
+    Обёртка над generate_holiday_tradition_async(): модель отвечает
+    JSON-объектом, который разбирается в CardFields. Колбэк on_progress
+    получает уже отрисованный текст карточки из частично полученного JSON.
+
+    Args:
+        country: Название страны
+        holiday_type: Тип праздника ("Рождество" или "Новый год")
+        timeout: Таймаут запроса в секундах (по умолчанию LLM_TIMEOUT)
+        on_progress: Колбэк с текстом карточки (для постепенного вывода)
+        priority: Приоритет в очереди (PRIORITY_* из scheduler)
+
+    Returns:
+        Поля карточки (часть полей может быть пустой)
+
+    Raises:
+        GenerationError: Ответ не получен или не разбирается как карточка
+    """
+    forward = None
+    if on_progress is not None:
+        async def forward(raw: str):
+            await on_progress(render_card(country, holiday_type, parse_partial_card(raw)))
+
+    raw = await generate_holiday_tradition_async(country, holiday_type, timeout, forward, priority)
+
+    try:
+        card = parse_card(raw)
+    except CardParseError as e:
+        # Ответ, обрезанный по max_tokens, — сохраняем уже полученные поля
+        card = parse_partial_card(raw)
+        if not any(card):
+            metrics.inc("card_parse_errors")
+            raise GenerationError(str(e)) from e
+
+    if not card.is_complete():
+        metrics.inc("incomplete_cards")
+
+    return card
+
+
+def llm_in_flight() -> int:
+    """Число генераций, которые сейчас ждут или выполняют запрос к OpenAI"""
+    return _in_flight
+
+
+async def close_async_client() -> None:
+    """Закрывает пул соединений асинхронного клиента"""
+    await async_client.close()
 
 
 def test_llm_connection() -> bool:
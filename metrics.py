@@ -0,0 +1,78 @@
+"""
+Простые счётчики и замеры времени для мониторинга бота
+"""
+import threading
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+_gauges: Dict[str, float] = {}
+
+
+def inc(name: str, value: float = 1) -> None:
+    """
+    Увеличить счётчик
+
+    Args:
+        name: Имя счётчика
+        value: Величина приращения
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get(name: str) -> float:
+    """
+    Получить значение счётчика
+
+    Args:
+        name: Имя счётчика
+
+    Returns:
+        Текущее значение (0, если счётчик ещё не создан)
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def set_gauge(name: str, value: float) -> None:
+    """
+    Установить текущее значение показателя (например, состояние)
+
+    Args:
+        name: Имя показателя
+        value: Значение
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float) -> None:
+    """
+    Записать длительность операции
+
+    Args:
+        name: Имя замера
+        seconds: Длительность в секундах
+    """
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+
+def snapshot() -> Dict[str, Dict]:
+    """
+    Снимок всех метрик
+
+    Returns:
+        Словарь {"counters": {...}, "gauges": {...}, "timings": {...}}
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {name: dict(values) for name, values in _timings.items()},
+        }
@@ -0,0 +1,196 @@
+"""
+Очередь исходящих запросов к Telegram с учётом лимитов на частоту
+
+Telegram ограничивает бота примерно 30 сообщениями в секунду всего,
+одним сообщением в секунду в личный чат и 20 в минуту в группу; при
+превышении он отвечает RetryAfter. Все отправки бота проходят через
+SendQueue: запросы одного чата выполняются по очереди, перед каждым
+берутся жетоны из ведра чата и общего ведра, а RetryAfter приостанавливает
+чат на указанное время и запрос повторяется.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from telegram.error import RetryAfter
+
+import metrics
+from scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _ChatState:
+    """Очередь и лимит одного чата"""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+        self.blocked_until = 0.0
+        self.pending = 0
+
+
+class SendQueue:
+    """Планировщик отправки сообщений с лимитами на чат и на бота"""
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        group_per_minute: float,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ):
+        """
+        Args:
+            global_rate: Сообщений в секунду на всего бота (0 — без лимита)
+            chat_rate: Сообщений в секунду в личный чат
+            chat_burst: Сколько сообщений подряд можно отправить в чат без паузы
+            group_per_minute: Сообщений в минуту в группу (чаты с id < 0)
+            max_retries: Сколько раз повторять запрос после RetryAfter
+            max_chats: Максимум отслеживаемых чатов
+        """
+        self.global_bucket = TokenBucket(global_rate * 60, burst=global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.global_blocked_until = 0.0
+        self._chats: "OrderedDict[int, _ChatState]" = OrderedDict()
+        self._depth = 0
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable[T]], cost: int = 1) -> T:
+        """
+        Выполнить запрос к Telegram в очереди чата
+
+        Args:
+            chat_id: Чат, в который уходит сообщение
+            call: Функция, выполняющая запрос (вызывается при каждой попытке)
+            cost: Сколько сообщений отправляет запрос (альбом — по числу фото)
+
+        Returns:
+            Результат запроса
+
+        Raises:
+            RetryAfter: Telegram продолжает отказывать после max_retries повторов
+        """
+        chat = self._chat(chat_id)
+        enqueued = time.monotonic()
+        self._set_depth(1)
+        chat.pending += 1
+
+        try:
+            async with chat.lock:
+                for attempt in range(self.max_retries + 1):
+                    await self._wait_turn(chat, cost)
+                    if attempt == 0:
+                        metrics.observe("outbox_wait", time.monotonic() - enqueued)
+
+                    try:
+                        result = await call()
+                        metrics.inc("outbox_sent")
+                        return result
+                    except RetryAfter as e:
+                        metrics.inc("outbox_retry_after")
+                        self.pause(chat_id, float(e.retry_after))
+                        logger.warning(f"Telegram просит подождать {e.retry_after}с перед отправкой в чат {chat_id}")
+                        if attempt == self.max_retries:
+                            raise
+        finally:
+            chat.pending -= 1
+            self._set_depth(-1)
+
+    def try_acquire(self, chat_id: int, cost: int = 1) -> bool:
+        """
+        Занять лимит без ожидания (для необязательных запросов, например
+        промежуточных правок)
+
+        Args:
+            chat_id: Чат
+            cost: Сколько сообщений отправляет запрос
+
+        Returns:
+            True, если в чате нет очереди и лимиты позволяют отправить сейчас
+        """
+        chat = self._chat(chat_id)
+        now = time.monotonic()
+        if (
+            chat.pending
+            or chat.blocked_until > now
+            or self.global_blocked_until > now
+            or chat.bucket.wait_time(cost) > 0
+            or self.global_bucket.wait_time(cost) > 0
+        ):
+            return False
+
+        chat.bucket.consume(cost)
+        self.global_bucket.consume(cost)
+        return True
+
+    def pause(self, chat_id: Optional[int], seconds: float):
+        """
+        Приостановить отправку в чат (или всему боту, если chat_id is None)
+
+        Args:
+            chat_id: Чат
+            seconds: На сколько секунд
+        """
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self.global_blocked_until = max(self.global_blocked_until, until)
+        else:
+            chat = self._chat(chat_id)
+            chat.blocked_until = max(chat.blocked_until, until)
+
+    def depth(self) -> int:
+        """Количество запросов в очереди и в работе"""
+        return self._depth
+
+    async def _wait_turn(self, chat: _ChatState, cost: int):
+        """Дождаться паузы RetryAfter и жетонов в ведре чата и в общем ведре"""
+        while True:
+            now = time.monotonic()
+            wait = max(
+                chat.blocked_until - now,
+                self.global_blocked_until - now,
+                chat.bucket.wait_time(cost),
+                self.global_bucket.wait_time(cost),
+            )
+            if wait <= 0:
+                chat.bucket.consume(cost)
+                self.global_bucket.consume(cost)
+                return
+
+            metrics.inc("outbox_throttled")
+            await asyncio.sleep(wait)
+
+    def _chat(self, chat_id: int) -> _ChatState:
+        """Состояние чата (создаётся при первом обращении)"""
+        chat = self._chats.pop(chat_id, None)
+        if chat is None:
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_per_minute, burst=self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate * 60, burst=self.chat_burst)
+            chat = _ChatState(bucket)
+        self._chats[chat_id] = chat
+
+        # Вытесняем давно неактивные чаты без ожидающих запросов
+        if len(self._chats) > self.max_chats:
+            for key in list(self._chats):
+                if len(self._chats) <= self.max_chats:
+                    break
+                if self._chats[key].pending == 0 and key != chat_id:
+                    del self._chats[key]
+
+        return chat
+
+    def _set_depth(self, delta: int):
+        self._depth += delta
+        metrics.set_gauge("outbox_depth", self._depth)
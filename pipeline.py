@@ -0,0 +1,189 @@
+"""
+Конвейер доставки карточки: одна реализация для всех команд и кнопок
+
+Стадии:
+    resolve — выбрать страну и праздник, показать статусное сообщение
+    text    — взять карточку из кэша или сгенерировать
+    images  — найти изображения (параллельно со стадией text)
+    render  — собрать итоговый текст и кнопки
+    send    — отправить текст, затем изображения (в фоне, с дедлайном)
+
+Время каждой стадии передаётся в хуки. Отмена run() (например, повторным
+нажатием «Другая страна») останавливает поиск изображений и убирает
+статусное сообщение.
+"""
+import asyncio
+import logging
+import time
+from typing import (
+    Any, Awaitable, Callable, Coroutine, Dict, Iterable, MutableMapping, Optional, Tuple, TypeVar,
+)
+
+from telegram import InlineKeyboardMarkup, Message
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+STAGE_RESOLVE = "resolve"
+STAGE_TEXT = "text"
+STAGE_IMAGES = "images"
+STAGE_RENDER = "render"
+STAGE_SEND = "send"
+# Отправка изображений после текста (идёт в фоне)
+STAGE_IMAGES_SEND = "images_send"
+
+
+def _drop(future: "asyncio.Future"):
+    """Отменить ненужный поиск изображений, не теряя его ошибку в логах asyncio"""
+    future.cancel()
+    future.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+
+class CardJob:
+    """Одна доставка карточки: чат, выбранная карточка, статус и время стадий"""
+
+    def __init__(self, message: Message, user_data: Optional[MutableMapping] = None):
+        """
+        Args:
+            message: Сообщение, в чат которого отправляется карточка
+            user_data: Данные пользователя (история стран, варианты карточек)
+        """
+        self.message = message
+        self.user_data = user_data
+        self.country: Optional[str] = None
+        self.holiday_type: Optional[str] = None
+        self.status_message: Optional[Message] = None
+        self.timings: Dict[str, float] = {}
+        self.started = time.monotonic()
+
+    def __str__(self) -> str:
+        return f"{self.country} ({self.holiday_type})"
+
+
+# Хук стадии: (доставка, стадия, длительность в секундах)
+StageHook = Callable[[CardJob, str, float], None]
+
+
+class CardPipeline:
+    """Доставка карточки по стадиям с замером времени и поддержкой отмены"""
+
+    def __init__(
+        self,
+        fetch_text: Callable[[CardJob], Awaitable[str]],
+        fetch_images: Callable[[CardJob], Awaitable[Any]],
+        render: Callable[[CardJob, str], Tuple[str, Optional[InlineKeyboardMarkup]]],
+        send_text: Callable[[CardJob, str, Optional[InlineKeyboardMarkup]], Awaitable[object]],
+        send_images: Callable[[CardJob, Any], Awaitable[object]],
+        discard_status: Callable[[CardJob], Awaitable[object]],
+        spawn: Callable[[Coroutine], asyncio.Task],
+        image_deadline: float,
+        hooks: Iterable[StageHook] = (),
+        on_images_timeout: Optional[Callable[[CardJob], None]] = None,
+    ):
+        """
+        Args:
+            fetch_text: Текст карточки из кэша или генерацией (может показывать
+                текст в статусном сообщении по мере генерации)
+            fetch_images: Изображения карточки (пустой результат — без изображений)
+            render: Итоговый текст и кнопки под карточкой
+            send_text: Отправка текста (заменяет статусное сообщение)
+            send_images: Отправка найденных изображений
+            discard_status: Удаление статусного сообщения при отмене
+            spawn: Запуск фоновой задачи (отправка изображений после текста)
+            image_deadline: Сколько ждать изображения после отправки текста (секунды)
+            hooks: Функции, получающие время каждой стадии
+            on_images_timeout: Вызывается, если поиск изображений не завершился
+                к дедлайну (например, чтобы засчитать сбой Unsplash)
+        """
+        self.fetch_text = fetch_text
+        self.fetch_images = fetch_images
+        self.render = render
+        self.send_text = send_text
+        self.send_images = send_images
+        self.discard_status = discard_status
+        self.spawn = spawn
+        self.image_deadline = image_deadline
+        self.hooks = list(hooks)
+        self.on_images_timeout = on_images_timeout
+
+    async def run(self, job: CardJob, resolve: Callable[[CardJob], Awaitable[object]]) -> CardJob:
+        """
+        Доставить карточку
+
+        Возвращается после отправки текста; изображения досылаются в фоне.
+
+        Args:
+            job: Доставка (чат и данные пользователя)
+            resolve: Стадия resolve точки входа: заполняет job.country,
+                job.holiday_type и job.status_message
+
+        Returns:
+            Доставка с заполненным временем стадий
+        """
+        await self._stage(job, STAGE_RESOLVE, resolve(job))
+
+        # Изображения ищутся, пока готовится текст
+        images = asyncio.ensure_future(self._stage(job, STAGE_IMAGES, self.fetch_images(job)))
+
+        try:
+            text = await self._stage(job, STAGE_TEXT, self.fetch_text(job))
+
+            started = time.monotonic()
+            text, reply_markup = self.render(job, text)
+            self._record(job, STAGE_RENDER, time.monotonic() - started)
+
+            await self._stage(job, STAGE_SEND, self.send_text(job, text, reply_markup))
+        except asyncio.CancelledError:
+            _drop(images)
+            metrics.inc("pipeline_cancelled")
+            if job.status_message is not None:
+                await self.discard_status(job)
+            raise
+        except BaseException:
+            _drop(images)
+            raise
+
+        stages = ", ".join(f"{stage} {seconds:.2f}с" for stage, seconds in job.timings.items())
+        logger.info(f"Карточка {job}: {stages}, всего {time.monotonic() - job.started:.2f}с")
+        self.spawn(self._deliver_images(job, images))
+        return job
+
+    async def _deliver_images(self, job: CardJob, images: "asyncio.Future"):
+        """Дождаться изображений и отправить их с дедлайном image_deadline"""
+        async def wait_and_send():
+            found = await images
+            if found:
+                await self._stage(job, STAGE_IMAGES_SEND, self.send_images(job, found))
+
+        try:
+            await asyncio.wait_for(wait_and_send(), self.image_deadline)
+        except asyncio.TimeoutError:
+            metrics.inc("images_dropped_deadline")
+            logger.info(f"Изображения для {job} не уложились в дедлайн")
+            # Медленный поиск (отменён дедлайном) — сбой источника;
+            # медленная отправка в Telegram — нет
+            if images.cancelled() and self.on_images_timeout is not None:
+                self.on_images_timeout(job)
+        except Exception as e:
+            metrics.inc("images_failed")
+            logger.error(f"Ошибка при отправке изображений для {job}: {e}")
+
+    async def _stage(self, job: CardJob, stage: str, awaitable: Awaitable[T]) -> T:
+        """Выполнить стадию и записать её время"""
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self._record(job, stage, time.monotonic() - started)
+
+    def _record(self, job: CardJob, stage: str, seconds: float):
+        """Передать время стадии в хуки"""
+        job.timings[stage] = seconds
+        for hook in self.hooks:
+            try:
+                hook(job, stage, seconds)
+            except Exception as e:
+                logger.error(f"Ошибка в хуке стадии {stage}: {e}")
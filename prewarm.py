@@ -0,0 +1,366 @@
+"""
+Предварительная генерация карточек для всех стран и праздников (prewarm)
+
+Обходит COUNTRIES × HOLIDAY_TYPES, пропускает уже сохранённые карточки
+и генерирует недостающие с ограниченным параллелизмом. Результаты пишутся
+в базу пачками, поэтому прерванный запуск достаточно повторить.
+
+Запуск:
+    python prewarm.py [--concurrency 4] [--flush-every 10] [--limit N] [--stale]
+
+С --stale заново генерируются и устаревшие карточки (старше RESPONSE_TTL
+или созданные другой версией промпта/модели).
+
+Через OpenAI Batch API (дешевле, результат в течение 24 часов):
+    python prewarm.py --batch-export batch.jsonl    # только файл заявок
+    python prewarm.py --batch-submit batch.jsonl    # файл + загрузка + создание batch
+    python prewarm.py --batch-fetch batch_abc123    # скачать готовый batch и сохранить
+    python prewarm.py --batch-import output.jsonl   # сохранить результаты из файла
+
+Для проверки без OpenAI запустите python fake_openai.py и укажите
+OPENAI_BASE_URL=http://127.0.0.1:8089/v1.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from config import GENERATION_LEASE_TTL, RESPONSE_TTL
+from countries import COUNTRIES, HOLIDAY_TYPES
+from cards import CardFields, CardParseError, parse_card
+from database import Database, AsyncDatabase
+from llm import (
+    GenerationError,
+    PROMPT_VERSION,
+    build_request,
+    client,
+    generate_card_async,
+    set_usage_recorder,
+    close_async_client,
+)
+from scheduler import PRIORITY_PREWARM
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор владельца блокировок генерации
+LEASE_OWNER = f"prewarm:{socket.gethostname()}:{os.getpid()}"
+
+# Разделитель страны и праздника в custom_id заявок Batch API
+CUSTOM_ID_SEPARATOR = "::"
+
+
+class PrewarmProgress:
+    """Счётчики и скорость прогрева"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.generated = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started_at = time.monotonic()
+
+    def cards_per_minute(self) -> float:
+        """Скорость генерации в карточках в минуту"""
+        elapsed = time.monotonic() - self.started_at
+        return self.generated / elapsed * 60 if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"готово {self.generated}/{self.total}, ошибок {self.failed}, "
+            f"пропущено {self.skipped}, {self.cards_per_minute():.1f} карточек/мин"
+        )
+
+
+async def find_missing_keys(db: AsyncDatabase, include_stale: bool = False) -> List[Tuple[str, str]]:
+    """
+    Найти пары (страна, праздник), для которых ещё нет карточки
+
+    Args:
+        db: База данных
+        include_stale: Считать устаревшие карточки отсутствующими
+
+    Returns:
+        Список кортежей (страна, праздник)
+    """
+    cached = await db.get_cached_keys()
+    if include_stale:
+        cached -= await db.get_stale_keys(PROMPT_VERSION, RESPONSE_TTL)
+
+    return [
+        (country, holiday_type)
+        for holiday_type in HOLIDAY_TYPES.values()
+        for country in COUNTRIES
+        if (country, holiday_type) not in cached
+    ]
+
+
+async def claim_rows(
+    db: AsyncDatabase,
+    rows: List[Tuple[str, str, CardFields]],
+) -> List[Tuple[str, str, CardFields]]:
+    """
+    Оставить строки, блокировку которых этот процесс держит на момент записи
+
+    Блокировка продлевается (или захватывается заново, если истекла и
+    свободна). Ключи, которые за это время забрал другой процесс (бот
+    генерирует карточку по запросу), пропускаются, чтобы не перезаписать
+    его результат.
+
+    Args:
+        db: База данных
+        rows: Кортежи (страна, праздник, поля карточки)
+
+    Returns:
+        Строки, которые можно сохранять (блокировки нужно освободить после записи)
+    """
+    held = []
+    for country, holiday_type, card in rows:
+        if await db.renew_lease(country, holiday_type, LEASE_OWNER, GENERATION_LEASE_TTL):
+            held.append((country, holiday_type, card))
+        else:
+            logger.warning(f"Карточку {country} ({holiday_type}) уже генерирует другой процесс, пропускаем")
+    return held
+
+
+async def save_claimed(db: AsyncDatabase, rows: List[Tuple[str, str, CardFields]]) -> int:
+    """
+    Сохранить строки под блокировками генерации (см. claim_rows)
+
+    Args:
+        db: База данных
+        rows: Кортежи (страна, праздник, поля карточки)
+
+    Returns:
+        Количество сохранённых карточек
+    """
+    held = await claim_rows(db, rows)
+    try:
+        await db.save_responses(held, PROMPT_VERSION)
+    finally:
+        for country, holiday_type, _ in held:
+            await db.release_lease(country, holiday_type, LEASE_OWNER)
+    return len(held)
+
+
+async def run_prewarm(
+    db: AsyncDatabase,
+    keys: List[Tuple[str, str]],
+    generate: Callable[[str, str], Awaitable[CardFields]] = functools.partial(
+        generate_card_async, priority=PRIORITY_PREWARM
+    ),
+    concurrency: int = 4,
+    flush_every: int = 10,
+) -> PrewarmProgress:
+    """
+    Сгенерировать карточки для указанных ключей и сохранить их пачками
+
+    Ключи, которые сейчас генерирует другой процесс (бот), пропускаются.
+
+    Args:
+        db: База данных
+        keys: Пары (страна, праздник) для генерации
+        generate: Функция генерации (можно подменить заглушкой)
+        concurrency: Максимум одновременных генераций
+        flush_every: Размер пачки для записи в базу
+
+    Returns:
+        Итоговый прогресс
+    """
+    progress = PrewarmProgress(len(keys))
+    semaphore = asyncio.Semaphore(concurrency)
+    pending: List[Tuple[str, str, CardFields]] = []
+    flush_lock = asyncio.Lock()
+
+    async def flush():
+        async with flush_lock:
+            if not pending:
+                return
+            rows = pending[:]
+            pending.clear()
+            # Пачка могла ждать дольше срока блокировок — проверяем их перед записью
+            saved = await save_claimed(db, rows)
+            progress.skipped += len(rows) - saved
+            logger.info(f"Сохранено {saved} карточек: {progress}")
+
+    async def worker(country: str, holiday_type: str):
+        async with semaphore:
+            if not await db.acquire_lease(country, holiday_type, LEASE_OWNER, GENERATION_LEASE_TTL):
+                progress.skipped += 1
+                return
+
+            try:
+                async with db.lease_heartbeat(country, holiday_type, LEASE_OWNER, GENERATION_LEASE_TTL):
+                    card = await generate(country, holiday_type)
+            except GenerationError as e:
+                progress.failed += 1
+                logger.warning(f"Не удалось сгенерировать {country} ({holiday_type}): {e}")
+                await db.release_lease(country, holiday_type, LEASE_OWNER)
+                return
+
+            progress.generated += 1
+            pending.append((country, holiday_type, card))
+
+        if len(pending) >= flush_every:
+            await flush()
+
+    try:
+        await asyncio.gather(*(worker(country, holiday) for country, holiday in keys))
+    finally:
+        # При прерывании сохраняем всё, что уже сгенерировано
+        await flush()
+
+    return progress
+
+
+def build_batch_requests(keys: Iterable[Tuple[str, str]]) -> List[dict]:
+    """
+    Сформировать заявки в формате OpenAI Batch API
+
+    Args:
+        keys: Пары (страна, праздник)
+
+    Returns:
+        Список заявок для файла JSONL
+    """
+    return [
+        {
+            "custom_id": f"{country}{CUSTOM_ID_SEPARATOR}{holiday_type}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_request(country, holiday_type),
+        }
+        for country, holiday_type in keys
+    ]
+
+
+def parse_batch_results(lines: Iterable[str]) -> List[Tuple[str, str, CardFields]]:
+    """
+    Разобрать файл результатов OpenAI Batch API
+
+    Args:
+        lines: Строки JSONL из output-файла batch
+
+    Returns:
+        Кортежи (страна, праздник, поля карточки) для успешных ответов
+    """
+    rows = []
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        result = json.loads(line)
+        response = result.get("response") or {}
+
+        if result.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Заявка {result.get('custom_id')} завершилась ошибкой")
+            continue
+
+        country, holiday_type = result["custom_id"].split(CUSTOM_ID_SEPARATOR, 1)
+        try:
+            card = parse_card(response["body"]["choices"][0]["message"]["content"])
+        except CardParseError as e:
+            logger.warning(f"Заявка {result['custom_id']}: {e}")
+            continue
+
+        rows.append((country, holiday_type, card))
+
+    return rows
+
+
+def write_batch_file(path: str, keys: List[Tuple[str, str]]):
+    """Записать заявки Batch API в файл JSONL"""
+    with open(path, "w", encoding="utf-8") as f:
+        for request in build_batch_requests(keys):
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+async def main_async(args: argparse.Namespace):
+    db = AsyncDatabase(Database(args.db))
+    set_usage_recorder(
+        lambda country, holiday_type, records: db.save_llm_usage(
+            country, holiday_type, records, PROMPT_VERSION
+        )
+    )
+
+    try:
+        if args.batch_import or args.batch_fetch:
+            if args.batch_fetch:
+                batch = client.batches.retrieve(args.batch_fetch)
+                if batch.status != "completed":
+                    print(f"Batch {batch.id}: статус {batch.status}, результаты ещё не готовы")
+                    return
+                lines = client.files.content(batch.output_file_id).text.splitlines()
+            else:
+                with open(args.batch_import, encoding="utf-8") as f:
+                    lines = f.readlines()
+
+            # Ключи, которые сейчас генерирует бот, не перезаписываем
+            rows = parse_batch_results(lines)
+            saved = await save_claimed(db, rows)
+            print(f"✅ Сохранено {saved} карточек из результатов batch (пропущено {len(rows) - saved})")
+            return
+
+        keys = await find_missing_keys(db, include_stale=args.stale)
+        if args.limit:
+            keys = keys[:args.limit]
+
+        if not keys:
+            print("✅ Все карточки уже в кэше")
+            return
+
+        batch_path = args.batch_export or args.batch_submit
+        if batch_path:
+            write_batch_file(batch_path, keys)
+            print(f"📝 Записано {len(keys)} заявок в {batch_path}")
+
+            if args.batch_submit:
+                with open(batch_path, "rb") as f:
+                    uploaded = client.files.create(file=f, purpose="batch")
+                batch = client.batches.create(
+                    input_file_id=uploaded.id,
+                    endpoint="/v1/chat/completions",
+                    completion_window="24h",
+                )
+                print(f"🚀 Создан batch {batch.id}. Позже выполните: python prewarm.py --batch-fetch {batch.id}")
+            return
+
+        print(f"🔥 Генерация {len(keys)} карточек (параллельно: {args.concurrency})...")
+        progress = await run_prewarm(
+            db, keys, concurrency=args.concurrency, flush_every=args.flush_every
+        )
+        print(f"✅ Прогрев завершён: {progress}")
+
+    finally:
+        await close_async_client()
+        await db.close()
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Предварительная генерация карточек")
+    parser.add_argument("--db", default="holiday_bot.db", help="Путь к базе данных")
+    parser.add_argument("--concurrency", type=int, default=4, help="Одновременных генераций")
+    parser.add_argument("--flush-every", type=int, default=10, help="Размер пачки для записи")
+    parser.add_argument("--limit", type=int, default=0, help="Сгенерировать не больше N карточек")
+    parser.add_argument("--stale", action="store_true", help="Обновить и устаревшие карточки")
+    parser.add_argument("--batch-export", metavar="FILE", help="Записать заявки Batch API в файл")
+    parser.add_argument("--batch-submit", metavar="FILE", help="Записать заявки и создать batch")
+    parser.add_argument("--batch-fetch", metavar="BATCH_ID", help="Скачать и сохранить результаты batch")
+    parser.add_argument("--batch-import", metavar="FILE", help="Сохранить результаты batch из файла")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
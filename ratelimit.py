@@ -0,0 +1,65 @@
+"""
+Ограничение частоты действий
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Hashable
+
+
+class SlidingWindowLimiter:
+    """
+    Не больше limit действий за window секунд для каждого ключа
+
+    Число отслеживаемых ключей ограничено: давно неактивные ключи вытесняются.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        """
+        Args:
+            limit: Максимум действий в окне
+            window: Длина окна (секунды)
+            max_keys: Максимум отслеживаемых ключей
+        """
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events: "OrderedDict[Hashable, Deque[float]]" = OrderedDict()
+
+    def allow(self, key: Hashable = None) -> bool:
+        """
+        Разрешить действие и учесть его, если лимит не исчерпан
+
+        Args:
+            key: Ключ (например, id пользователя; None — общий лимит)
+
+        Returns:
+            True, если действие разрешено
+        """
+        now = time.monotonic()
+        events = self._events.pop(key, None)
+        if events is None:
+            events = deque()
+
+        while events and now - events[0] >= self.window:
+            events.popleft()
+
+        self._events[key] = events
+        while len(self._events) > self.max_keys:
+            self._events.popitem(last=False)
+
+        if len(events) >= self.limit:
+            return False
+
+        events.append(now)
+        return True
+
+    def refund(self, key: Hashable = None):
+        """
+        Вернуть последнее учтённое действие (если оно в итоге не выполнено)
+
+        Args:
+            key: Ключ, для которого allow() вернул True
+        """
+        events = self._events.get(key)
+        if events:
+            events.pop()
@@ -0,0 +1,99 @@
+"""
+Фоновое обновление устаревших карточек (stale-while-revalidate)
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str]
+
+
+class RefreshWorker:
+    """
+    Очередь фонового обновления карточек с ограничением скорости
+
+    Ключ попадает в очередь не более одного раза, карточки обновляются
+    по одной, не чаще одной в interval секунд.
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[str, str], Awaitable[object]],
+        interval: float = 10.0,
+        max_queue: int = 200,
+    ):
+        """
+        Args:
+            refresh: Корутина, которая заново генерирует и сохраняет карточку
+            interval: Минимальный интервал между обновлениями (секунды)
+            max_queue: Максимальная длина очереди
+        """
+        self.refresh = refresh
+        self.interval = interval
+        self._queue: "asyncio.Queue[Key]" = asyncio.Queue(maxsize=max_queue)
+        self._queued: Set[Key] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, country: str, holiday_type: str) -> bool:
+        """
+        Поставить карточку в очередь на обновление
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+
+        Returns:
+            True, если ключ добавлен (False — уже в очереди или очередь полна)
+        """
+        key = (country, holiday_type)
+        if key in self._queued:
+            return False
+
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            metrics.inc("refresh_dropped")
+            return False
+
+        self._queued.add(key)
+        metrics.inc("refresh_scheduled")
+        return True
+
+    def start(self):
+        """Запустить обработку очереди"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить обработку очереди"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def pending(self) -> int:
+        """Количество карточек в очереди"""
+        return self._queue.qsize()
+
+    async def _run(self):
+        while True:
+            country, holiday_type = await self._queue.get()
+            try:
+                logger.info(f"Фоновое обновление карточки {country} ({holiday_type})")
+                await self.refresh(country, holiday_type)
+                metrics.inc("refresh_done")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc("refresh_failed")
+                logger.error(f"Ошибка фонового обновления {country} ({holiday_type}): {e}")
+            finally:
+                self._queued.discard((country, holiday_type))
+
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,251 @@
+"""
+Справочник стран: канонические названия, синонимы и нечёткий поиск
+
+Свободный ввод пользователя («япония», «Japan», «JP», «Японя»)
+приводится к каноническому названию из countries.py до обращения
+к кэшу, поэтому одна страна — один ключ в базе и одна генерация.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from countries import COUNTRIES, COUNTRY_DETAILS
+
+# Максимальная длина названия неизвестной страны
+MAX_COUNTRY_LENGTH = 40
+
+# Допустимое название неизвестной страны: буквы, пробелы, дефисы и точки
+PLAUSIBLE_COUNTRY_RE = re.compile(r"^[^\W\d_]+(?:[ .\-'][^\W\d_]+)*\.?$")
+
+# ISO-код страны: ровно две заглавные латинские буквы («JP») или явная
+# форма «iso jp» / «код jp». Строчные «no», «it» — обычные слова, а не коды
+ISO_CODE_RE = re.compile(r"^\s*(?:(?:iso|код)\s*[:=]?\s*([A-Za-z]{2})|([A-Z]{2}))\s*$", re.IGNORECASE)
+
+# Минимальное сходство по триграммам, при котором кандидат проверяется
+# расстоянием редактирования
+MIN_TRIGRAM_SIMILARITY = 0.3
+
+# Минимальное сходство по триграммам для подсказки
+MIN_SUGGEST_SIMILARITY = 0.15
+
+
+def normalize(text: str) -> str:
+    """
+    Привести название к виду для поиска
+
+    Регистр, «ё», диакритика, знаки препинания и лишние пробелы не учитываются.
+
+    Args:
+        text: Исходная строка
+
+    Returns:
+        Нормализованная строка
+    """
+    text = text.casefold().replace("ё", "е")
+    # Диакритику латиницы убираем, кириллицу («й») не трогаем
+    text = "".join(
+        ch for ch in unicodedata.normalize("NFKD", text)
+        if not (unicodedata.combining(ch) and ch != "\u0306")
+    )
+    text = unicodedata.normalize("NFC", text)
+    text = re.sub(r"[^\w]+", " ", text)
+    return " ".join(text.split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Триграммы нормализованной строки (с границами слова)"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Расстояние Левенштейна с ранним выходом
+
+    Args:
+        a: Первая строка
+        b: Вторая строка
+        limit: Порог; если расстояние больше, возвращается limit + 1
+
+    Returns:
+        Расстояние (не больше limit + 1)
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return min(previous[-1], limit + 1)
+
+
+class CountryRegistry:
+    """Поиск страны по названию, синониму или ISO-коду"""
+
+    def __init__(self, countries: List[str], details: Dict[str, dict]):
+        """
+        Args:
+            countries: Канонические названия стран
+            details: Английские названия, ISO-коды и синонимы по странам
+        """
+        self.countries = countries
+        self.details = details
+        self._exact: Dict[str, str] = {}
+        self._codes: Dict[str, str] = {}
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._names: Dict[str, Set[str]] = {}
+
+        for country in countries:
+            info = details.get(country, {})
+            names = [country, info.get("en", "")] + list(info.get("aliases", []))
+
+            for name in filter(None, names):
+                key = normalize(name)
+                self._exact[key] = country
+                self._names[key] = trigrams(key)
+                for gram in self._names[key]:
+                    self._trigrams[gram].add(key)
+
+            if info.get("iso"):
+                self._codes[normalize(info["iso"])] = country
+
+    def resolve(self, text: str) -> Optional[str]:
+        """
+        Найти каноническое название страны
+
+        Args:
+            text: Ввод пользователя
+
+        Returns:
+            Каноническое название или None, если страна не распознана
+        """
+        key = normalize(text)
+        if not key:
+            return None
+
+        if key in self._exact:
+            return self._exact[key]
+
+        code = iso_code(text)
+        if code in self._codes:
+            return self._codes[code]
+
+        matches = self._fuzzy(key, limit=1)
+        return matches[0][0] if matches else None
+
+    def names(self) -> List[Tuple[str, str]]:
+        """Все известные названия: пары (нормализованное название или синоним, страна)"""
+        return list(self._exact.items())
+
+    def suggest(self, text: str, limit: int = 3) -> List[str]:
+        """
+        Похожие страны для подсказки пользователю
+
+        Args:
+            text: Ввод пользователя
+            limit: Максимум подсказок
+
+        Returns:
+            Канонические названия по убыванию сходства
+        """
+        key = normalize(text)
+        if not key:
+            return []
+
+        grams = trigrams(key)
+        scored: Dict[str, float] = {}
+        for name in self._candidates(grams):
+            score = self._similarity(grams, self._names[name])
+            country = self._exact[name]
+            scored[country] = max(score, scored.get(country, 0.0))
+
+        ranked = sorted(scored.items(), key=lambda item: item[1], reverse=True)
+        return [country for country, score in ranked[:limit] if score >= MIN_SUGGEST_SIMILARITY]
+
+    def _fuzzy(self, key: str, limit: int) -> List[Tuple[str, int]]:
+        """
+        Кандидаты по триграммам, подтверждённые расстоянием редактирования
+
+        Допускается одна ошибка на каждые четыре символа (не меньше одной).
+        """
+        grams = trigrams(key)
+        max_distance = max(1, len(key) // 4)
+        found: Dict[str, int] = {}
+
+        for name in self._candidates(grams):
+            if self._similarity(grams, self._names[name]) < MIN_TRIGRAM_SIMILARITY:
+                continue
+
+            distance = edit_distance(key, name, max_distance)
+            if distance <= max_distance:
+                country = self._exact[name]
+                found[country] = min(distance, found.get(country, distance))
+
+        return sorted(found.items(), key=lambda item: item[1])[:limit]
+
+    def _candidates(self, grams: Set[str]) -> Set[str]:
+        """Нормализованные названия, у которых есть общие триграммы"""
+        candidates: Set[str] = set()
+        for gram in grams:
+            candidates |= self._trigrams.get(gram, set())
+        return candidates
+
+    @staticmethod
+    def _similarity(a: Set[str], b: Set[str]) -> float:
+        """Коэффициент Жаккара для множеств триграмм"""
+        return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def iso_code(text: str) -> Optional[str]:
+    """
+    ISO-код из ввода, если ввод явно является кодом
+
+    Args:
+        text: Ввод пользователя
+
+    Returns:
+        Нормализованный код («jp») или None
+    """
+    match = ISO_CODE_RE.match(text)
+    if not match:
+        return None
+    explicit, upper = match.groups()
+    # «JP» без префикса принимаем только заглавными
+    if upper is not None and not upper.isupper():
+        return None
+    return normalize(explicit or upper)
+
+
+def is_plausible_country(text: str) -> bool:
+    """
+    Похож ли ввод на название страны (для неизвестных справочнику стран)
+
+    Args:
+        text: Ввод пользователя
+
+    Returns:
+        True, если это короткое название из букв
+    """
+    text = " ".join(text.split())
+    return 0 < len(text) <= MAX_COUNTRY_LENGTH and bool(PLAUSIBLE_COUNTRY_RE.match(text))
+
+
+def display_name(text: str) -> str:
+    """Название неизвестной страны в едином виде (лишние пробелы, регистр)"""
+    words = " ".join(text.split()).split(" ")
+    return " ".join(word[:1].upper() + word[1:].lower() for word in words)
+
+
+# Общий справочник стран
+country_registry = CountryRegistry(COUNTRIES, COUNTRY_DETAILS)
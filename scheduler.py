@@ -0,0 +1,184 @@
+"""
+Планировщик запросов к OpenAI: лимиты RPM/TPM, параллелизм и приоритеты
+
+Каждая генерация перед запросом получает слот у планировщика. Слот
+выдаётся, когда свободен один из LLM_MAX_CONCURRENCY потоков и в
+«ведрах» запросов и токенов хватает запаса. Ожидающие обслуживаются
+по приоритету: сначала запросы пользователей, затем фоновое
+обновление, затем прогрев.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+
+import metrics
+
+# Приоритеты (меньше — важнее)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REFRESH = 1
+PRIORITY_PREWARM = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_REFRESH: "refresh",
+    PRIORITY_PREWARM: "prewarm",
+}
+
+
+class TokenBucket:
+    """Ведро с равномерным пополнением: per_minute единиц в минуту"""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        """
+        Args:
+            per_minute: Скорость пополнения в минуту (0 — без лимита)
+            burst: Ёмкость ведра (по умолчанию равна per_minute)
+        """
+        self.capacity = per_minute if burst is None else burst
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Через сколько секунд в ведре наберётся amount единиц
+
+        Запрос больше ёмкости ведра ждёт только полного ведра.
+        """
+        if self.capacity <= 0 or self.rate <= 0:
+            return 0.0
+
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        """Списать amount единиц (может уйти в минус — это долг)"""
+        if self.capacity <= 0:
+            return
+
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """Вернуть amount единиц (или списать, если amount < 0)"""
+        if self.capacity <= 0:
+            return
+
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMScheduler:
+    """Очередь с приоритетами перед запросами к OpenAI"""
+
+    def __init__(self, max_concurrency: int, rpm: float = 0, tpm: float = 0):
+        """
+        Args:
+            max_concurrency: Максимум одновременных запросов
+            rpm: Лимит запросов в минуту (0 — без лимита)
+            tpm: Лимит токенов в минуту (0 — без лимита)
+        """
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._active = 0
+        self._heap: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, tokens: float = 0) -> AsyncIterator[None]:
+        """
+        Дождаться очереди и занять слот на время запроса
+
+        Args:
+            priority: Приоритет запроса (PRIORITY_*)
+            tokens: Оценка числа токенов запроса (промпт + ответ)
+        """
+        await self.acquire(priority, tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, tokens: float = 0):
+        """
+        Дождаться очереди и занять слот
+
+        Args:
+            priority: Приоритет запроса (PRIORITY_*)
+            tokens: Оценка числа токенов запроса (промпт + ответ)
+        """
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._counter), tokens, future))
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот мог быть выдан одновременно с отменой — возвращаем его
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+        metrics.observe(f"llm_queue_wait_{PRIORITY_NAMES.get(priority, priority)}", time.monotonic() - started)
+
+    def release(self):
+        """Освободить слот"""
+        self._active -= 1
+        self._dispatch()
+
+    def settle(self, estimated: float, actual: float):
+        """
+        Уточнить расход токенов после ответа
+
+        Args:
+            estimated: Оценка, переданная в acquire()
+            actual: Фактическое число токенов из usage
+        """
+        self.tokens.refund(estimated - actual)
+
+    def pending(self) -> int:
+        """Количество ожидающих запросов"""
+        return sum(1 for *_, future in self._heap if not future.done())
+
+    def active(self) -> int:
+        """Количество выполняющихся запросов"""
+        return self._active
+
+    def _dispatch(self):
+        """Выдать слоты ожидающим, пока хватает параллелизма и лимитов"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._heap and self._active < self.max_concurrency:
+            priority, _, tokens, future = self._heap[0]
+
+            if future.done():
+                heapq.heappop(self._heap)
+                continue
+
+            # Строгий приоритет: пока первому в очереди не хватает лимита,
+            # менее важные запросы тоже ждут
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                metrics.inc("llm_throttled")
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._heap)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self._active += 1
+            future.set_result(None)
@@ -0,0 +1,107 @@
+"""
+Выбор случайной страны с учётом кэша и нагрузки
+
+Карточки, которые уже есть в кэше, отдаются мгновенно, а холодные
+требуют генерации. Когда запросы к OpenAI заняты, случайный выбор
+смещается в сторону закэшированных стран; недавно показанные
+пользователю страны не повторяются.
+"""
+import random
+from collections import deque
+from typing import Callable, Deque, Iterable, List, MutableMapping, Optional, Set, Tuple
+
+import metrics
+
+Key = Tuple[str, str]
+
+
+class CountryPicker:
+    """Взвешенный случайный выбор страны"""
+
+    def __init__(
+        self,
+        countries: List[str],
+        load: Callable[[], float],
+        cold_weight: float = 1.0,
+        recent_size: int = 10,
+    ):
+        """
+        Args:
+            countries: Список стран для выбора
+            load: Текущая загрузка генерации от 0 (простой) до 1 (всё занято)
+            cold_weight: Вес страны без карточки при нулевой загрузке
+                (вес закэшированной — 1)
+            recent_size: Сколько последних стран пользователя не повторять
+        """
+        self.countries = countries
+        self.load = load
+        self.cold_weight = cold_weight
+        self.recent_size = recent_size
+        self._warm: Set[Key] = set()
+
+    def load_warm(self, keys: Iterable[Key]):
+        """
+        Запомнить пары (страна, праздник), для которых есть карточка
+
+        Вызывается при старте и затем периодически: карточки добавляют и
+        другие процессы с той же базой.
+
+        Args:
+            keys: Пары (страна, праздник)
+        """
+        self._warm.update(keys)
+
+    def mark_warm(self, country: str, holiday_type: str):
+        """Отметить, что карточка появилась в кэше"""
+        self._warm.add((country, holiday_type))
+
+    def is_warm(self, country: str, holiday_type: str) -> bool:
+        """Есть ли карточка в кэше"""
+        return (country, holiday_type) in self._warm
+
+    def pick(self, holiday_type: str, user_data: Optional[MutableMapping] = None) -> str:
+        """
+        Выбрать страну для праздника
+
+        Вес холодной страны уменьшается пропорционально загрузке и
+        при полной загрузке становится нулевым; если кандидатов в кэше
+        нет, выбор делается среди всех.
+
+        Args:
+            holiday_type: Тип праздника
+            user_data: context.user_data пользователя (для истории выбора)
+
+        Returns:
+            Название страны
+        """
+        recent = self._recent(user_data)
+        candidates = [country for country in self.countries if country not in recent]
+        if not candidates:
+            candidates = self.countries
+
+        load = min(max(self.load(), 0.0), 1.0)
+        cold = self.cold_weight * (1.0 - load)
+        weights = [1.0 if self.is_warm(country, holiday_type) else cold for country in candidates]
+
+        if sum(weights) > 0:
+            country = random.choices(candidates, weights=weights)[0]
+        else:
+            country = random.choice(candidates)
+
+        warm = self.is_warm(country, holiday_type)
+        metrics.inc("pick_warm" if warm else "pick_cold")
+        recent.append(country)
+        return country
+
+    def hit_rate(self) -> float:
+        """Доля случайных выборов, попавших в кэш"""
+        warm = metrics.get("pick_warm")
+        total = warm + metrics.get("pick_cold")
+        return warm / total if total else 0.0
+
+    def _recent(self, user_data: Optional[MutableMapping]) -> Deque[str]:
+        """Недавние страны пользователя (последние в конце)"""
+        if user_data is None:
+            return deque(maxlen=self.recent_size)
+
+        return user_data.setdefault("recent_countries", deque(maxlen=self.recent_size))
@@ -0,0 +1,50 @@
+"""
+Объединение одновременных одинаковых запросов (single-flight)
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Выполняет не более одной операции на ключ; остальные вызовы ждут её результат"""
+
+    def __init__(self, name: str = "singleflight"):
+        """
+        Args:
+            name: Префикс имён счётчиков в metrics
+        """
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполнить func() для ключа или дождаться уже запущенного вызова
+
+        Args:
+            key: Ключ операции, например (country, holiday_type)
+            func: Фабрика корутины, которая выполняет операцию
+
+        Returns:
+            Результат операции
+        """
+        future = self._inflight.get(key)
+
+        if future is not None:
+            metrics.inc(f"{self.name}_collapsed")
+            return await asyncio.shield(future)
+
+        metrics.inc(f"{self.name}_started")
+        future = asyncio.ensure_future(func())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # shield: отмена одного ожидающего не отменяет общую операцию
+        return await asyncio.shield(future)
+
+    def in_flight(self) -> int:
+        """Количество выполняющихся операций"""
+        return len(self._inflight)
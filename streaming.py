@@ -0,0 +1,116 @@
+"""
+Постепенное обновление статусного сообщения по мере генерации текста
+"""
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+import metrics
+
+if TYPE_CHECKING:
+    from outbox import SendQueue
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+# Маркер «текст ещё пишется»
+CURSOR = " ▌"
+
+
+class ThrottledMessageEditor:
+    """
+    Редактирует сообщение не чаще одного раза в interval секунд
+
+    Промежуточные обновления объединяются: в сообщение попадает
+    последний полученный текст, остальные пропускаются. Если передана
+    очередь отправки, правка делается только при свободном лимите чата
+    и не задерживает остальные сообщения.
+    """
+
+    def __init__(self, message: Message, interval: float = 1.5, outbox: Optional["SendQueue"] = None):
+        """
+        Args:
+            message: Сообщение, которое нужно обновлять
+            interval: Минимальный интервал между правками (секунды)
+            outbox: Очередь отправки, с которой делится лимит чата
+        """
+        self.message = message
+        self.interval = interval
+        self.outbox = outbox
+        self._latest: Optional[str] = None
+        self._shown: Optional[str] = None
+        self._last_edit = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._editing = False
+        self._closed = False
+
+    async def update(self, text: str) -> None:
+        """
+        Сообщить новый частичный текст
+
+        Args:
+            text: Весь сгенерированный на данный момент текст
+        """
+        if self._closed:
+            return
+
+        self._latest = text
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def close(self) -> None:
+        """Прекратить обновления (финальный текст отправляет вызывающий код)"""
+        self._closed = True
+
+        if self._flush_task is None or self._flush_task.done():
+            return
+
+        if self._editing:
+            # Уже отправленная правка должна завершиться до финального
+            # текста, иначе она может перезаписать его
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        else:
+            self._flush_task.cancel()
+
+    async def _flush_later(self) -> None:
+        """Дождаться окончания интервала и показать последний текст"""
+        delay = self._last_edit + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self._closed or self._latest is None or self._latest == self._shown:
+            return
+
+        text = self._latest
+        self._last_edit = time.monotonic()
+
+        # Лимит чата исчерпан — пропускаем правку, её заменит следующая
+        if self.outbox is not None and not self.outbox.try_acquire(self.message.chat_id):
+            metrics.inc("stream_edits_skipped")
+            return
+
+        self._editing = True
+        try:
+            await self.message.edit_text(text[:MAX_MESSAGE_LENGTH - len(CURSOR)] + CURSOR)
+            self._shown = text
+            metrics.inc("stream_edits")
+        except RetryAfter as e:
+            # Telegram просит подождать — откладываем следующие правки
+            self._last_edit = time.monotonic() + float(e.retry_after)
+            if self.outbox is not None:
+                self.outbox.pause(self.message.chat_id, float(e.retry_after))
+            metrics.inc("stream_edits_throttled")
+        except BadRequest as e:
+            # Например, «message is not modified»
+            logger.debug(f"Не удалось обновить сообщение: {e}")
+        except TelegramError as e:
+            logger.warning(f"Ошибка при обновлении сообщения: {e}")
+        finally:
+            self._editing = False
@@ -0,0 +1,175 @@
+"""
+Несколько вариантов карточки на (страна, праздник) и их ротация
+
+Пользователь, нажимающий «Другая страна», рано или поздно получает уже
+виденную пару. Вместо повторной генерации ему показывается другой
+сохранённый вариант, а новые варианты дозаполняются в фоне, когда
+OpenAI простаивает.
+"""
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, MutableMapping, Optional, Set, Tuple
+
+import metrics
+from database import AsyncDatabase, CardEntry
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str]
+
+# Сколько последних показанных вариантов помнить для одного пользователя
+SEEN_VARIANTS_MAX = 200
+
+
+def get_seen(user_data: Optional[MutableMapping]) -> Deque[int]:
+    """
+    Показанные пользователю варианты (id записей), последние в конце
+
+    Args:
+        user_data: context.user_data пользователя (None — без учёта)
+
+    Returns:
+        Ограниченная очередь id
+    """
+    if user_data is None:
+        return deque(maxlen=SEEN_VARIANTS_MAX)
+
+    return user_data.setdefault("seen_variants", deque(maxlen=SEEN_VARIANTS_MAX))
+
+
+def choose_variant(
+    variants: List[CardEntry],
+    seen: Deque[int],
+    is_fresh: Callable[[CardEntry], bool],
+) -> Tuple[CardEntry, bool]:
+    """
+    Выбрать вариант карточки для показа
+
+    Сначала выбираются свежие непоказанные варианты, затем любые
+    непоказанные, затем — давнее всего показанный.
+
+    Args:
+        variants: Непустой список вариантов
+        seen: Показанные пользователю id (последние в конце)
+        is_fresh: Проверка актуальности варианта
+
+    Returns:
+        Кортеж (вариант, все ли варианты пользователь уже видел)
+    """
+    seen_ids = set(seen)
+    unseen = [entry for entry in variants if entry.id not in seen_ids]
+
+    if unseen:
+        fresh = [entry for entry in unseen if is_fresh(entry)]
+        return random.choice(fresh or unseen), False
+
+    # Все варианты уже показаны — берём тот, что показывался раньше остальных
+    order = {entry_id: index for index, entry_id in enumerate(seen)}
+    return min(variants, key=lambda entry: order.get(entry.id, -1)), True
+
+
+def remember_seen(seen: Deque[int], entry: CardEntry):
+    """Отметить вариант показанным (перемещает его в конец очереди)"""
+    try:
+        seen.remove(entry.id)
+    except ValueError:
+        pass
+    seen.append(entry.id)
+
+
+class VariantFiller:
+    """
+    Фоновое пополнение пула вариантов карточек
+
+    Раз в interval секунд, если генерация простаивает, добавляет один
+    вариант карточке, у которой их меньше pool_size. В первую очередь
+    пополняются карточки, все варианты которых кто-то уже видел.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        fill: Callable[[str, str], Awaitable[object]],
+        is_idle: Callable[[], bool],
+        prompt_version: str,
+        pool_size: int = 3,
+        interval: float = 30.0,
+    ):
+        """
+        Args:
+            db: База данных
+            fill: Корутина, которая генерирует и сохраняет новый вариант
+            is_idle: Можно ли сейчас занимать OpenAI фоновой генерацией
+            prompt_version: Текущая версия промпта (устаревшие карточки не пополняются)
+            pool_size: Желаемое число вариантов на карточку
+            interval: Интервал между попытками пополнения (секунды)
+        """
+        self.db = db
+        self.fill = fill
+        self.is_idle = is_idle
+        self.prompt_version = prompt_version
+        self.pool_size = pool_size
+        self.interval = interval
+        self._demand: Set[Key] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def note_demand(self, country: str, holiday_type: str):
+        """
+        Отметить, что пользователь просмотрел все варианты карточки
+
+        Args:
+            country: Название страны
+            holiday_type: Тип праздника
+        """
+        self._demand.add((country, holiday_type))
+        metrics.inc("variants_exhausted")
+
+    def start(self):
+        """Запустить пополнение (при pool_size <= 1 не запускается)"""
+        if self.pool_size <= 1:
+            return
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить пополнение"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _next_key(self) -> Optional[Key]:
+        """Выбрать карточку для пополнения"""
+        while self._demand:
+            country, holiday_type = self._demand.pop()
+            if len(await self.db.get_variants(country, holiday_type)) < self.pool_size:
+                return country, holiday_type
+
+        keys = await self.db.get_underfilled_keys(self.pool_size, self.prompt_version, limit=1)
+        return keys[0] if keys else None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+
+            if not self.is_idle():
+                continue
+
+            try:
+                key = await self._next_key()
+                if key is None:
+                    continue
+
+                country, holiday_type = key
+                logger.info(f"Пополнение вариантов карточки {country} ({holiday_type})")
+                await self.fill(country, holiday_type)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc("variant_fill_failed")
+                logger.error(f"Ошибка пополнения вариантов: {e}")
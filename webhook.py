@@ -0,0 +1,163 @@
+"""
+Режим webhook: встроенный HTTP-сервер вместо long polling
+
+Обновления принимаются по POST на WEBHOOK_PATH и кладутся в update_queue
+приложения python-telegram-bot. Дополнительно сервер отдаёт GET /health
+для балансировщика или reverse proxy.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import time
+from typing import List, Optional
+
+import tornado.web
+from telegram import Update
+from telegram.ext import Application
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передаёт secret_token
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class TelegramUpdateHandler(tornado.web.RequestHandler):
+    """Приём обновлений от Telegram"""
+
+    def initialize(self, bot_app: Application, secret_token: Optional[str]):
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token:
+            received = self.request.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                metrics.inc("webhook_rejected")
+                logger.warning("Webhook: неверный secret token")
+                self.set_status(403)
+                return
+
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+
+        # Повреждённое обновление — 400, иначе Telegram будет повторять его бесконечно
+        try:
+            update = Update.de_json(data, self.bot_app.bot) if isinstance(data, dict) else None
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Webhook: некорректное обновление: {e}")
+            update = None
+
+        if update is None:
+            metrics.inc("webhook_malformed")
+            self.set_status(400)
+            return
+
+        await self.bot_app.update_queue.put(update)
+        metrics.inc("webhook_updates")
+        self.set_status(200)
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    """Проверка состояния: GET /health"""
+
+    def initialize(self, bot_app: Application, started_at: float):
+        self.bot_app = bot_app
+        self.started_at = started_at
+
+    def get(self):
+        running = self.bot_app.running
+        snapshot = metrics.snapshot()
+        self.set_status(200 if running else 503)
+        self.write({
+            "status": "ok" if running else "starting",
+            "uptime": round(time.monotonic() - self.started_at, 1),
+            "update_queue": self.bot_app.update_queue.qsize(),
+            "counters": snapshot["counters"],
+            "gauges": snapshot["gauges"],
+        })
+
+
+def build_webhook_app(
+    application: Application,
+    url_path: str,
+    secret_token: Optional[str],
+) -> tornado.web.Application:
+    """
+    Создаёт tornado-приложение с маршрутами webhook и /health
+
+    Args:
+        application: Приложение python-telegram-bot
+        url_path: Путь, на который Telegram присылает обновления
+        secret_token: Ожидаемый secret token (None — без проверки)
+
+    Returns:
+        tornado-приложение
+    """
+    return tornado.web.Application([
+        (url_path, TelegramUpdateHandler, {"bot_app": application, "secret_token": secret_token}),
+        (r"/health", HealthHandler, {"bot_app": application, "started_at": time.monotonic()}),
+    ])
+
+
+async def run_webhook(
+    application: Application,
+    listen: str,
+    port: int,
+    url_path: str,
+    webhook_url: str,
+    secret_token: Optional[str],
+    allowed_updates: List[str],
+    register: bool = True,
+) -> None:
+    """
+    Запускает бота в режиме webhook до сигнала SIGINT/SIGTERM
+
+    Args:
+        application: Приложение python-telegram-bot
+        listen: Адрес для входящих соединений
+        port: Порт
+        url_path: Путь webhook
+        webhook_url: Публичный URL, который регистрируется в Telegram
+        secret_token: Secret token для проверки запросов
+        allowed_updates: Типы обновлений, которые нужны боту
+        register: Регистрировать ли webhook в Telegram (отключите для
+            локальной проверки и на всех экземплярах, кроме одного)
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    app = build_webhook_app(application, url_path, secret_token)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+
+        if register:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=allowed_updates,
+            )
+            logger.info(f"Webhook зарегистрирован: {webhook_url}")
+
+        await application.start()
+        server = app.listen(port, address=listen)
+        logger.info(f"Webhook-сервер слушает {listen}:{port}{url_path}")
+
+        await stop.wait()
+
+        logger.info("Остановка webhook-сервера...")
+        server.stop()
+        await application.stop()
+
+    if application.post_shutdown:
+        await application.post_shutdown(application)